@@ -1,11 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import os
+import redis
 import requests
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "ETag"])
 limiter = Limiter(
     get_remote_address, app=app, default_limits=["1000 per day", "60 per hour"]
 )
@@ -14,29 +16,125 @@ ORDER_SERVICE_URL = "http://order-service:5001"
 DELIVERY_SERVICE_URL = "http://delivery-service:5002"
 STOCK_SERVICE_URL = "http://stock-service:5003"
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
+CHANGE_FEED_STREAM = os.getenv("CHANGE_FEED_STREAM", "changes")
+# Seconds a change feed connection may stay silent before a keep-alive comment
+CHANGE_FEED_KEEPALIVE = 15
+
+change_feed = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+PASSTHROUGH_HEADERS = ["X-Next-Cursor", "ETag"]
+CONDITIONAL_HEADERS = ["If-None-Match"]
+
+
+def forward_list(url):
+    """
+    Forward a listing request with its query string, pagination and ETag headers.
+
+    A 304 from the service is returned as is, and NDJSON responses are
+    streamed through chunk by chunk instead of being buffered and
+    re-serialized.
+    """
+    response = requests.get(
+        url,
+        params=request.args,
+        headers={
+            name: request.headers[name]
+            for name in CONDITIONAL_HEADERS
+            if name in request.headers
+        },
+        stream=True,
+    )
+    headers = {
+        name: response.headers[name]
+        for name in PASSTHROUGH_HEADERS
+        if name in response.headers
+    }
+    if response.status_code == 304:
+        return Response(status=304, headers=headers)
+    if response.headers.get("Content-Type", "").startswith(NDJSON_MEDIA_TYPE):
+        return Response(
+            stream_with_context(response.iter_content(chunk_size=None)),
+            status=response.status_code,
+            headers=headers,
+            content_type=NDJSON_MEDIA_TYPE,
+        )
+    return jsonify(response.json()), response.status_code, headers
+
 
 @app.route("/")
 def index():
     return "API Gateway is running"
 
 
+def parse_stream_id(stream_id):
+    milliseconds, _, sequence = stream_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def change_events(last_id):
+    """
+    Yield server-sent events for every change after `last_id`.
+
+    If `last_id` is older than the oldest entry still kept in the stream the
+    client has missed changes, so a `reset` event tells it to reload its
+    lists before the stream continues.
+    """
+    if last_id != "$":
+        oldest = change_feed.xrange(CHANGE_FEED_STREAM, count=1)
+        if oldest and parse_stream_id(last_id) < parse_stream_id(oldest[0][0]):
+            yield "event: reset\ndata: {}\n\n"
+    while True:
+        entries = change_feed.xread(
+            {CHANGE_FEED_STREAM: last_id}, count=100, block=CHANGE_FEED_KEEPALIVE * 1000
+        )
+        if not entries:
+            yield ": keep-alive\n\n"
+            continue
+        for _, messages in entries:
+            for entry_id, fields in messages:
+                last_id = entry_id
+                yield f"id: {entry_id}\nevent: {fields['entity']}\ndata: {fields['data']}\n\n"
+
+
+# Change feed
+@app.route("/changes", methods=["GET"])
+@limiter.exempt
+def get_changes():
+    # Resume after the last sequence number the client saw, or start with new changes
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since") or "$"
+    if last_id != "$":
+        try:
+            parse_stream_id(last_id)
+        except ValueError:
+            return jsonify({"error": "Invalid sequence number"}), 400
+    return Response(
+        stream_with_context(change_events(last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Order endpoints
 @app.route("/orders", methods=["GET"])
 def get_orders():
-    response = requests.get(f"{ORDER_SERVICE_URL}/orders")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{ORDER_SERVICE_URL}/orders")
 
 
 @app.route("/orders/active", methods=["GET"])
 def get_active_orders():
-    response = requests.get(f"{ORDER_SERVICE_URL}/orders/active")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{ORDER_SERVICE_URL}/orders/active")
 
 
 @app.route("/orders/completed", methods=["GET"])
 def get_completed_orders():
-    response = requests.get(f"{ORDER_SERVICE_URL}/orders/completed")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{ORDER_SERVICE_URL}/orders/completed")
+
+
+@app.route("/orders/stats", methods=["GET"])
+def get_order_stats():
+    return forward_list(f"{ORDER_SERVICE_URL}/orders/stats")
 
 
 @app.route("/order/<order_id>", methods=["GET"])
@@ -51,6 +149,12 @@ def create_order():
     return jsonify(response.json()), response.status_code
 
 
+@app.route("/create_orders", methods=["POST"])
+def create_orders():
+    response = requests.post(f"{ORDER_SERVICE_URL}/create_orders", json=request.json)
+    return jsonify(response.json()), response.status_code
+
+
 @app.route("/close_order/<order_id>", methods=["POST"])
 def close_order(order_id):
     response = requests.post(f"{ORDER_SERVICE_URL}/close_order/{order_id}")
@@ -75,22 +179,31 @@ def update_msg(order_id):
     return jsonify(response.json()), response.status_code
 
 
+@app.route("/order_events", methods=["POST"])
+def order_events():
+    response = requests.post(f"{ORDER_SERVICE_URL}/order_events", json=request.json)
+    return jsonify(response.json()), response.status_code
+
+
 # Delivery endpoints
 @app.route("/delivery_persons", methods=["GET"])
 def get_delivery_persons():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/delivery_persons")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{DELIVERY_SERVICE_URL}/delivery_persons")
 
 
 @app.route("/delivery_persons/en_route", methods=["GET"])
 def get_en_route_persons():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/delivery_persons/en_route")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{DELIVERY_SERVICE_URL}/delivery_persons/en_route")
 
 
 @app.route("/delivery_persons/idle", methods=["GET"])
 def get_idle_persons():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/delivery_persons/idle")
+    return forward_list(f"{DELIVERY_SERVICE_URL}/delivery_persons/idle")
+
+
+@app.route("/delivery_persons/counts", methods=["GET"])
+def get_delivery_person_counts():
+    response = requests.get(f"{DELIVERY_SERVICE_URL}/delivery_persons/counts")
     return jsonify(response.json()), response.status_code
 
 
@@ -102,20 +215,17 @@ def get_delivery_person(person_id):
 
 @app.route("/deliveries", methods=["GET"])
 def get_deliveries():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/deliveries")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{DELIVERY_SERVICE_URL}/deliveries")
 
 
 @app.route("/deliveries/active", methods=["GET"])
 def get_active_deliveries():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/deliveries/active")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{DELIVERY_SERVICE_URL}/deliveries/active")
 
 
 @app.route("/deliveries/completed", methods=["GET"])
 def get_completed_deliveries():
-    response = requests.get(f"{DELIVERY_SERVICE_URL}/deliveries/completed")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{DELIVERY_SERVICE_URL}/deliveries/completed")
 
 
 @app.route("/deliveries/<delivery_id>", methods=["GET"])
@@ -132,6 +242,18 @@ def assign_delivery():
     return jsonify(response.json()), response.status_code
 
 
+@app.route("/dispatch/claim", methods=["POST"])
+def dispatch_claim():
+    response = requests.post(f"{DELIVERY_SERVICE_URL}/dispatch/claim", json=request.json)
+    return jsonify(response.json()), response.status_code
+
+
+@app.route("/dispatch/stats", methods=["GET"])
+def get_dispatch_stats():
+    response = requests.get(f"{DELIVERY_SERVICE_URL}/dispatch/stats")
+    return jsonify(response.json()), response.status_code
+
+
 @app.route("/update_delivery_person_status/<person_id>", methods=["POST"])
 def update_delivery_person_status(person_id):
     # Transform the request to include person_id in the body
@@ -147,8 +269,12 @@ def update_delivery_person_status(person_id):
 # Stock endpoints
 @app.route("/current_stock", methods=["GET"])
 def get_current_stock():
-    response = requests.get(f"{STOCK_SERVICE_URL}/current_stock")
-    return jsonify(response.json()), response.status_code
+    return forward_list(f"{STOCK_SERVICE_URL}/current_stock")
+
+
+@app.route("/catalog", methods=["GET"])
+def get_catalog():
+    return forward_list(f"{STOCK_SERVICE_URL}/catalog")
 
 
 @app.route("/current_stock/<item_id>", methods=["GET"])
@@ -169,6 +295,18 @@ def remove_stock():
     return jsonify(response.json()), response.status_code
 
 
+@app.route("/available_stock", methods=["GET"])
+def available_stock():
+    response = requests.get(f"{STOCK_SERVICE_URL}/available_stock")
+    return jsonify(response.json()), response.status_code
+
+
+@app.route("/reserve_stock", methods=["POST"])
+def reserve_stock():
+    response = requests.post(f"{STOCK_SERVICE_URL}/reserve_stock", json=request.json)
+    return jsonify(response.json()), response.status_code
+
+
 @app.route("/validate_stock", methods=["POST"])
 def validate_stock():
     response = requests.post(f"{STOCK_SERVICE_URL}/validate_stock", json=request.json)
@@ -0,0 +1,125 @@
+"""
+Latency of `GET /orders/active` with a large order history, before and after archiving.
+
+Seeds `--history` completed orders (each with one delivery) dated before the
+archive retention window, measures `/orders/active`, moves the history to the
+`*_history` tables with the archiver's own batch function, and measures
+again. Meant for a scratch database: the seeded orders are not removed.
+
+Usage (reads the DB_* settings like the services do):
+    PYTHONPATH=. python benchmarks/archive_active_orders.py \
+        --url http://localhost:5001 --history 10000000 --requests 500
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+import requests
+
+from common.archive import archive_batch
+from common.db import db_config_from_env
+from common.ids import ulid_at
+
+SEED_BATCH_SIZE = 10000
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_history(conn, count, retention_days):
+    """Insert `count` completed orders older than the retention window."""
+    oldest = datetime.now() - timedelta(days=retention_days + 365)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM delivery_persons ORDER BY id LIMIT 1")
+        delivery_person_id = cursor.fetchone()[0]
+        seeded = 0
+        while seeded < count:
+            batch = min(SEED_BATCH_SIZE, count - seeded)
+            orders = []
+            for i in range(batch):
+                order_time = oldest + timedelta(seconds=(seeded + i) % (300 * 86400))
+                orders.append(
+                    (
+                        ulid_at(int(order_time.timestamp() * 1000)),
+                        order_time,
+                        f"customer-{random.randint(1, 10000)}",
+                        round(random.uniform(1, 20), 2),
+                        "completed",
+                        order_time + timedelta(minutes=random.randint(5, 60)),
+                    )
+                )
+            cursor.executemany(
+                "INSERT INTO orders (id, order_time, customer_name, customer_distance,"
+                " order_status, delivered_at) VALUES (%s, %s, %s, %s, %s, %s)",
+                orders,
+            )
+            cursor.executemany(
+                "INSERT INTO deliveries (order_id, delivery_person_id) VALUES (%s, %s)",
+                [(order[0], delivery_person_id) for order in orders],
+            )
+            conn.commit()
+            seeded += batch
+            print(f"seeded {seeded}/{count} historical orders", end="\r")
+    print()
+
+
+def measure(url, count):
+    session = requests.Session()
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        session.get(f"{url}/orders/active").raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    print(
+        f"{label:<16} requests={len(latencies):>5} "
+        f"p50={percentile(latencies, 50):7.1f}ms "
+        f"p95={percentile(latencies, 95):7.1f}ms "
+        f"p99={percentile(latencies, 99):7.1f}ms "
+        f"mean={statistics.mean(latencies):7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--history", type=int, default=10000000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--retention-days", type=float, default=7)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded history")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**db_config_from_env())
+    try:
+        if not args.skip_seed:
+            seed_history(conn, args.history, args.retention_days)
+        report("before archive", measure(args.url, args.requests))
+
+        cutoff = datetime.now() - timedelta(days=args.retention_days)
+        archived = 0
+        started = time.perf_counter()
+        while True:
+            batch = archive_batch(conn, cutoff, batch_size=5000)
+            if not batch:
+                break
+            archived += len(batch)
+            print(f"archived {archived} orders", end="\r")
+        print(f"\narchived {archived} orders in {time.perf_counter() - started:.0f}s")
+
+        report("after archive", measure(args.url, args.requests))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Batch dispatch matcher: solver runtime and effect on simulated delivery times.
+
+1. Times `solve_assignment` on random problems of each `--sizes` entry, for
+   the dispatch cost (ride back to the kitchen plus customer distance) and
+   for a general one (straight-line distance from delivery person to
+   drop-off), optionally next to scipy's solver when it is installed.
+2. Replays the simulation's delivery model (delivery time = 5-10 s plus
+   5 s per km of pickup and customer distance, idle delivery persons riding
+   back to the kitchen from their last drop-off) with immediate dispatch, which hands an order to the
+   lowest-numbered idle delivery person or to the next one to become idle,
+   and with batch matching every DISPATCH_MATCH_INTERVAL seconds. Reports
+   the mean order_time to delivered_at duration that /orders/stats shows.
+
+Usage:
+    PYTHONPATH=. python benchmarks/dispatch_matching.py --sizes 1000,10000
+"""
+
+import argparse
+import heapq
+import random
+import statistics
+import time
+from collections import deque
+
+import numpy as np
+
+from common.assignment import solve_assignment
+from common.dispatch import dropoff_position, pickup_distance
+
+AREA_KM = 12
+
+
+def random_problem(size, kind, rng):
+    persons = rng.uniform(-AREA_KM, AREA_KM, (size, 2))
+    dropoffs = rng.uniform(-AREA_KM, AREA_KM, (size, 2))
+    if kind == "dispatch":
+        pickup = np.hypot(persons[:, 0], persons[:, 1])
+        return pickup[:, None] + np.hypot(dropoffs[:, 0], dropoffs[:, 1])[None, :]
+    return np.hypot(
+        persons[:, None, 0] - dropoffs[None, :, 0], persons[:, None, 1] - dropoffs[None, :, 1]
+    )
+
+
+def benchmark_solver(sizes, kinds, seed):
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        linear_sum_assignment = None
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        for kind in kinds:
+            cost = random_problem(size, kind, rng)
+            started = time.perf_counter()
+            rows, columns = solve_assignment(cost)
+            elapsed = time.perf_counter() - started
+            line = f"{kind:<9} {size:>6}x{size:<6} solve_assignment={elapsed:8.2f}s total={cost[rows, columns].sum():12.1f}"
+            if linear_sum_assignment is not None:
+                started = time.perf_counter()
+                rows, columns = linear_sum_assignment(cost)
+                line += (
+                    f"  scipy={time.perf_counter() - started:8.2f}s"
+                    f" total={cost[rows, columns].sum():12.1f}"
+                )
+            print(line, flush=True)
+            del cost
+
+
+def simulate(policy, couriers, orders, order_interval, match_interval, seed):
+    """
+    Event-driven replay of the delivery model.
+
+    Returns:
+        dict: Mean and p95 delivery time, mean dispatch wait and pickup distance
+    """
+    rng = random.Random(seed)
+    positions = [(0.0, 0.0)] * couriers
+    idle_since = [0.0] * couriers
+    idle = set(range(couriers))
+    queue = deque()
+    events = []  # (time, sequence, kind, payload)
+    sequence = 0
+
+    def push(at, kind, payload=None):
+        nonlocal sequence
+        heapq.heappush(events, (at, sequence, kind, payload))
+        sequence += 1
+
+    arrival = 0.0
+    for number in range(orders):
+        arrival += rng.expovariate(1 / order_interval)
+        distance = rng.randint(1, 12)
+        push(arrival, "order", (f"order-{number}", arrival, distance))
+    if policy == "batch":
+        push(match_interval, "match")
+
+    delivery_times, waits, pickups = [], [], []
+
+    def assign(now, courier, order):
+        order_id, ordered_at, distance = order
+        idle.discard(courier)
+        pickup = pickup_distance(*positions[courier], now - idle_since[courier])
+        trip = rng.randint(5, 10) + 5 * (pickup + distance)
+        waits.append(now - ordered_at)
+        pickups.append(pickup)
+        push(now + trip, "delivered", (courier, order))
+
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+        if kind == "order":
+            if policy == "immediate" and idle:
+                assign(now, min(idle), payload)
+            else:
+                queue.append(payload)
+        elif kind == "delivered":
+            courier, (order_id, ordered_at, distance) = payload
+            delivery_times.append(now - ordered_at)
+            positions[courier] = dropoff_position(order_id, distance)
+            idle_since[courier] = now
+            idle.add(courier)
+            if policy == "immediate" and queue:
+                assign(now, courier, queue.popleft())
+        elif kind == "match":
+            if queue and idle:
+                batch = [queue.popleft() for _ in range(min(len(queue), len(idle)))]
+                candidates = sorted(idle)
+                cost = np.array(
+                    [
+                        [
+                            pickup_distance(*positions[courier], now - idle_since[courier])
+                            + order[2]
+                            for order in batch
+                        ]
+                        for courier in candidates
+                    ]
+                )
+                for i, j in zip(*solve_assignment(cost)):
+                    assign(now, candidates[i], batch[j])
+            if len(delivery_times) < orders:
+                push(now + match_interval, "match")
+
+    delivery_times.sort()
+    return {
+        "mean": statistics.mean(delivery_times),
+        "p95": delivery_times[int(0.95 * (len(delivery_times) - 1))],
+        "wait": statistics.mean(waits),
+        "pickup": statistics.mean(pickups),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--costs", default="dispatch,euclidean")
+    parser.add_argument("--couriers", type=int, default=10)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--order-interval", type=float, default=12.0, help="mean seconds between orders")
+    parser.add_argument("--match-interval", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-solver", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_solver:
+        benchmark_solver(
+            [int(size) for size in args.sizes.split(",")], args.costs.split(","), args.seed
+        )
+
+    for policy in ("immediate", "batch"):
+        result = simulate(
+            policy,
+            args.couriers,
+            args.orders,
+            args.order_interval,
+            args.match_interval,
+            args.seed,
+        )
+        print(
+            f"{policy:<9} mean delivery={result['mean']:7.1f}s p95={result['p95']:7.1f}s "
+            f"mean wait={result['wait']:6.1f}s mean pickup={result['pickup']:5.2f}km"
+        )
+
+
+if __name__ == "__main__":
+    main()
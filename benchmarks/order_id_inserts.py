@@ -0,0 +1,121 @@
+"""
+Insert throughput of order id schemes as the table grows.
+
+Creates scratch copies of `orders` and `order_items` for each key layout and
+fills them in batches, printing orders/s for every step of growth:
+
+- legacy: random 8 hex character ids in VARCHAR(50)
+- ulid:   time-ordered ULIDs in VARCHAR(26) ASCII, the current layout
+- binary: the same ULIDs stored as BINARY(16)
+
+Random keys keep inserting into pages all over the primary key and the
+order_items foreign key index, so their throughput drops once those indexes
+outgrow the buffer pool; time-ordered keys only append.
+
+Usage (reads the DB_* settings like the services do):
+    PYTHONPATH=. python benchmarks/order_id_inserts.py \
+        --rows 2000000 --step 200000 --batch 1000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+import mysql.connector
+
+from common.db import db_config_from_env
+from common.ids import UlidGenerator, legacy_order_id, ulid_to_bytes
+
+LAYOUTS = {
+    "legacy": ("VARCHAR(50)", legacy_order_id, None),
+    "ulid": ("VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin", None, None),
+    "binary": ("BINARY(16)", None, ulid_to_bytes),
+}
+
+
+def create_tables(cursor, layout, key_type):
+    cursor.execute(f"DROP TABLE IF EXISTS bench_{layout}_items")
+    cursor.execute(f"DROP TABLE IF EXISTS bench_{layout}_orders")
+    cursor.execute(
+        f"""CREATE TABLE bench_{layout}_orders (
+            id {key_type} PRIMARY KEY,
+            order_time DATETIME NOT NULL,
+            customer_name VARCHAR(255) NOT NULL,
+            customer_distance DECIMAL(20,2) NOT NULL,
+            order_status VARCHAR(50) NOT NULL,
+            INDEX (order_status, order_time, id)
+        )"""
+    )
+    cursor.execute(
+        f"""CREATE TABLE bench_{layout}_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id {key_type},
+            item_id INT NOT NULL,
+            quantity INT NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES bench_{layout}_orders(id)
+        )"""
+    )
+
+
+def fill(conn, layout, rows, step, batch):
+    key_type, generate, encode = LAYOUTS[layout]
+    generate = generate or UlidGenerator()
+    encode = encode or (lambda order_id: order_id)
+    with conn.cursor() as cursor:
+        create_tables(cursor, layout, key_type)
+        conn.commit()
+
+        inserted = 0
+        step_started = time.perf_counter()
+        while inserted < rows:
+            now = datetime.now()
+            ids = [encode(generate()) for _ in range(batch)]
+            cursor.executemany(
+                f"INSERT INTO bench_{layout}_orders"
+                " (id, order_time, customer_name, customer_distance, order_status)"
+                " VALUES (%s, %s, %s, %s, %s)",
+                [(order_id, now, "bench", 1.0, "active") for order_id in ids],
+            )
+            cursor.executemany(
+                f"INSERT INTO bench_{layout}_items (order_id, item_id, quantity)"
+                " VALUES (%s, %s, %s)",
+                [
+                    (order_id, random.randint(1, 10), 1)
+                    for order_id in ids
+                    for _ in range(2)
+                ],
+            )
+            conn.commit()
+            inserted += batch
+            if inserted % step == 0:
+                elapsed = time.perf_counter() - step_started
+                print(f"{layout:<7} rows={inserted:>9} orders/s={step / elapsed:9.0f}")
+                step_started = time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--step", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--layouts", nargs="+", choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--keep", action="store_true", help="keep the scratch tables")
+    args = parser.parse_args()
+    if args.step % args.batch:
+        raise SystemExit("--step must be a multiple of --batch")
+
+    conn = mysql.connector.connect(**db_config_from_env())
+    try:
+        for layout in args.layouts:
+            fill(conn, layout, args.rows, args.step, args.batch)
+            if not args.keep:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE bench_{layout}_items")
+                    cursor.execute(f"DROP TABLE bench_{layout}_orders")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
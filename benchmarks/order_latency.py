@@ -0,0 +1,96 @@
+"""
+Concurrency benchmark for the order service.
+
+Measures the latency of `GET /order/{order_id}` on its own and again while
+other clients continuously scan `GET /orders`. With blocking database calls
+on the event loop the second run's p99 grows with the scan time; with the
+executor-backed data path the two runs stay close.
+
+Usage:
+    python benchmarks/order_latency.py --url http://localhost:5001 \
+        --duration 30 --scanners 4 --probes 4
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def probe(url, order_ids, stop, latencies):
+    session = requests.Session()
+    i = 0
+    while not stop.is_set():
+        order_id = order_ids[i % len(order_ids)]
+        started = time.perf_counter()
+        session.get(f"{url}/order/{order_id}").raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        i += 1
+
+
+def scan(url, stop, scans):
+    session = requests.Session()
+    while not stop.is_set():
+        session.get(f"{url}/orders").raise_for_status()
+        scans.append(1)
+
+
+def run(url, order_ids, duration, scanners, probes):
+    stop = threading.Event()
+    latencies, scans = [], []
+    threads = [
+        threading.Thread(target=probe, args=(url, order_ids, stop, latencies))
+        for _ in range(probes)
+    ]
+    threads += [
+        threading.Thread(target=scan, args=(url, stop, scans)) for _ in range(scanners)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, len(scans)
+
+
+def report(label, latencies, scans, duration):
+    print(
+        f"{label:<22} requests={len(latencies):>6} "
+        f"p50={percentile(latencies, 50):7.1f}ms "
+        f"p95={percentile(latencies, 95):7.1f}ms "
+        f"p99={percentile(latencies, 99):7.1f}ms "
+        f"mean={statistics.mean(latencies):7.1f}ms "
+        f"scans/s={scans / duration:6.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--scanners", type=int, default=4)
+    parser.add_argument("--probes", type=int, default=4)
+    args = parser.parse_args()
+
+    orders = requests.get(f"{args.url}/orders").json()
+    order_ids = [order["id"] for order in orders[:100]]
+    if not order_ids:
+        raise SystemExit("No orders found; start the order generator first")
+
+    latencies, scans = run(args.url, order_ids, args.duration, 0, args.probes)
+    report("/order alone", latencies, scans, args.duration)
+    latencies, scans = run(args.url, order_ids, args.duration, args.scanners, args.probes)
+    report("/order during scans", latencies, scans, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Restock latency of `POST /add_stock` for 10, 1k and 10k items.
+
+Seeds scratch items, then times restocks of every size through the stock
+service, whose add path locks the rows with one SELECT and updates them with
+one multi-row statement. For comparison the former add path, one SELECT per
+item followed by one UPDATE per item in the same transaction, is replayed
+over a direct connection. The scratch items are deleted at the end.
+
+Usage (reads the DB_* settings like the services do):
+    PYTHONPATH=. python benchmarks/restock_latency.py \
+        --url http://localhost:5003 --sizes 10,1000,10000 --repeats 20
+"""
+
+import argparse
+import statistics
+import time
+
+import mysql.connector
+import requests
+
+from common.catalog import CATALOG_TABLE
+from common.db import db_config_from_env
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+ITEM_PREFIX = "restock-bench-"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_items(conn, count):
+    """Insert `count` scratch items with room for every restock, return their ids."""
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO stock (item_name, quantity, max_quantity) VALUES (%s, 0, 2000000000)",
+            [(f"{ITEM_PREFIX}{i}",) for i in range(count)],
+        )
+        conn.commit()
+        cursor.execute(
+            "SELECT item_id FROM stock WHERE item_name LIKE %s ORDER BY item_id",
+            (f"{ITEM_PREFIX}%",),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_items(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM stock WHERE item_name LIKE %s", (f"{ITEM_PREFIX}%",))
+        conn.commit()
+
+
+def restock_service(session, url, item_ids):
+    started = time.perf_counter()
+    session.post(
+        f"{url}/add_stock",
+        json={"order_items": [{"item_id": item_id, "quantity": 1} for item_id in item_ids]},
+    ).raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+def restock_per_item(conn, item_ids):
+    """The former add path: a capacity SELECT per item, then an UPDATE per item."""
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        for item_id in item_ids:
+            cursor.execute(
+                "SELECT quantity, max_quantity, item_name FROM stock WHERE item_id = %s",
+                (item_id,),
+            )
+            cursor.fetchone()
+        cursor.executemany(
+            "UPDATE stock SET quantity = quantity + %s, version = version + 1"
+            " WHERE item_id = %s",
+            [(1, item_id) for item_id in item_ids],
+        )
+        conn.commit()
+    return (time.perf_counter() - started) * 1000
+
+
+def report(label, size, latencies):
+    print(
+        f"{label:<22} items={size:>6} "
+        f"p50={percentile(latencies, 50):9.1f}ms "
+        f"p95={percentile(latencies, 95):9.1f}ms "
+        f"mean={statistics.mean(latencies):9.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:5003")
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    conn = mysql.connector.connect(**db_config_from_env())
+    # Items are added and removed, so services must reload their catalogs
+    table_versions = TableVersions(redis_from_env())
+    session = requests.Session()
+    try:
+        item_ids = seed_items(conn, max(sizes))
+        table_versions.bump(CATALOG_TABLE)
+        for size in sizes:
+            batch = item_ids[:size]
+            report(
+                "add_stock (set-based)",
+                size,
+                [restock_service(session, args.url, batch) for _ in range(args.repeats)],
+            )
+            report(
+                "per-item (former)",
+                size,
+                [restock_per_item(conn, batch) for _ in range(args.repeats)],
+            )
+    finally:
+        delete_items(conn)
+        table_versions.bump(CATALOG_TABLE)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
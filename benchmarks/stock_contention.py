@@ -0,0 +1,145 @@
+"""
+Decrements per second on one item as concurrency rises, with and without shards.
+
+Seeds one scratch item, then for every `--shards` entry (0 keeps the stock on
+the item's row) and every `--concurrency` level runs that many threads. Each
+thread has its own connection and takes one unit per transaction for
+`--duration` seconds with take_stock, retrying with locked shards like
+`/remove_stock` does (see common.stock_shards.with_locked_retry). Reports
+decrements per second, the transaction latency and how many takes needed
+the locked retry. The scratch item is deleted at the end.
+
+Usage (reads the DB_* settings like the services do):
+    PYTHONPATH=. python benchmarks/stock_contention.py \
+        --shards 0,4,16 --concurrency 1,4,16,64 --duration 5
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import mysql.connector
+
+from common.catalog import CATALOG_TABLE
+from common.db import db_config_from_env
+from common.redis_store import redis_from_env
+from common.reservations import take_stock
+from common.stock_shards import ShardsDrained, set_shards
+from common.versions import TableVersions
+
+ITEM_NAME = "contention-bench"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed_item(conn):
+    """Insert the scratch item with enough units for every run, return its id."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO stock (item_name, quantity, max_quantity)"
+            " VALUES (%s, 1000000000, 2000000000)",
+            (ITEM_NAME,),
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+
+def delete_item(conn, item_id):
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM stock_shards WHERE item_id = %s", (item_id,))
+        cursor.execute("DELETE FROM stock WHERE item_id = %s", (item_id,))
+        conn.commit()
+
+
+def reshard(conn, item_id, shards):
+    with conn.cursor() as cursor:
+        set_shards(cursor, item_id, shards)
+        conn.commit()
+
+
+def decrement(item_id, sharded, stop, latencies, retries, errors):
+    conn = mysql.connector.connect(**db_config_from_env())
+    try:
+        with conn.cursor() as cursor:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    try:
+                        taken = take_stock(cursor, {item_id: 1}, sharded=sharded)
+                    except ShardsDrained:
+                        conn.rollback()
+                        retries.append(1)
+                        taken = take_stock(
+                            cursor, {item_id: 1}, sharded=sharded, lock_shards=True
+                        )
+                    if taken is None:
+                        conn.rollback()
+                        errors.append("refused")
+                        continue
+                    conn.commit()
+                except mysql.connector.Error as e:
+                    conn.rollback()
+                    errors.append(str(e))
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        conn.close()
+
+
+def run(item_id, shards, concurrency, duration):
+    stop = threading.Event()
+    latencies, retries, errors = [], [], []
+    sharded = {item_id} if shards else set()
+    threads = [
+        threading.Thread(
+            target=decrement, args=(item_id, sharded, stop, latencies, retries, errors)
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    label = f"{shards} shards" if shards else "stock row"
+    print(
+        f"{label:<10} threads={concurrency:>4} "
+        f"decrements/s={len(latencies) / duration:9.1f} "
+        f"p50={percentile(latencies, 50) if latencies else 0:7.2f}ms "
+        f"p95={percentile(latencies, 95) if latencies else 0:7.2f}ms "
+        f"mean={statistics.mean(latencies) if latencies else 0:7.2f}ms "
+        f"locked_retries={len(retries)} errors={len(errors)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shards", default="0,4,16")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64")
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**db_config_from_env())
+    # The item is added and removed, so services must reload their catalogs
+    table_versions = TableVersions(redis_from_env())
+    item_id = seed_item(conn)
+    table_versions.bump(CATALOG_TABLE)
+    try:
+        for shards in [int(value) for value in args.shards.split(",")]:
+            reshard(conn, item_id, shards)
+            for concurrency in [int(value) for value in args.concurrency.split(",")]:
+                run(item_id, shards, concurrency, args.duration)
+    finally:
+        delete_item(conn, item_id)
+        table_versions.bump("stock", CATALOG_TABLE)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
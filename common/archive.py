@@ -0,0 +1,129 @@
+"""
+Archiver that keeps the live order tables small.
+
+Completed and cancelled orders whose order_time is older than the retention
+window are moved, together with their order_items and deliveries rows, into
+the `*_history` tables created by migration 0006, and dropped from
+delivery_view along with their stock reservations. Each batch is one short
+transaction and batches are spaced out by ARCHIVE_THROTTLE seconds, so the
+archiver never holds many row locks or saturates the database.
+
+Order lookups and listings read the live tables unless asked to include
+history; the statistics tables are cumulative and are not touched.
+
+Run with `python -m common.archive`; only one replica archives at a time.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.migrate import apply_migrations
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+# Pause between two batches while there is a backlog to archive
+ARCHIVE_THROTTLE = float(os.getenv("ARCHIVE_THROTTLE", "0.2"))
+# Pause once everything older than the retention window has been archived
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "60"))
+ARCHIVE_LOCK = "food_delivery.order_archiver"
+
+TERMINAL_STATUSES = ("completed", "cancelled")
+
+# (live table, history table, column holding the order id), children first
+ARCHIVED_TABLES = [
+    ("deliveries", "deliveries_history", "order_id"),
+    ("order_items", "order_items_history", "order_id"),
+    ("orders", "orders_history", "id"),
+]
+
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move one batch of terminal orders older than `cutoff` to the history tables.
+
+    Returns:
+        list: Ids of the archived orders
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM orders WHERE order_status IN (%s, %s) AND order_time < %s"
+            " ORDER BY order_time, id LIMIT %s FOR UPDATE",
+            (*TERMINAL_STATUSES, cutoff, batch_size),
+        )
+        order_ids = [row[0] for row in cursor.fetchall()]
+        if not order_ids:
+            conn.rollback()
+            return []
+
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        # Archived deliveries are read through the history tables, and the
+        # stock reservations of finished orders are no longer needed
+        for table in ("delivery_view", "stock_reservation_items", "stock_reservations"):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE order_id IN ({placeholders})",
+                tuple(order_ids),
+            )
+        for table, history_table, column in ARCHIVED_TABLES:
+            cursor.execute(
+                f"INSERT INTO {history_table} SELECT * FROM {table}"
+                f" WHERE {column} IN ({placeholders})",
+                tuple(order_ids),
+            )
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {column} IN ({placeholders})",
+                tuple(order_ids),
+            )
+        conn.commit()
+        return order_ids
+
+
+def run_archiver(
+    pool,
+    table_versions,
+    retention_days=ARCHIVE_RETENTION_DAYS,
+    batch_size=ARCHIVE_BATCH_SIZE,
+    throttle=ARCHIVE_THROTTLE,
+    interval=ARCHIVE_INTERVAL,
+):
+    """Archive forever; only the replica holding the archiver lock moves rows."""
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = pool.acquire()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT GET_LOCK(%s, -1)", (ARCHIVE_LOCK,))
+                    cursor.fetchone()
+                logger.info("Acquired order archiver lock")
+
+            cutoff = datetime.now() - timedelta(days=retention_days)
+            archived = archive_batch(conn, cutoff, batch_size)
+            if archived:
+                table_versions.bump("orders", "deliveries")
+                logger.info(f"Archived {len(archived)} orders older than {cutoff}")
+            time.sleep(throttle if len(archived) == batch_size else interval)
+        except (MySQLError, PoolTimeoutError) as e:
+            logger.error(f"Order archiver database error: {str(e)}")
+            if conn is not None:
+                pool.release(conn, discard=True)
+                conn = None
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    pool = ConnectionPool(db_config_from_env(), pool_size=1)
+    apply_migrations(pool)
+    run_archiver(pool, TableVersions(redis_from_env()))
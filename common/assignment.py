@@ -0,0 +1,196 @@
+"""
+Minimum-cost assignment of rows to columns with the auction algorithm.
+
+`solve_assignment` pairs every row of a cost matrix with a distinct column
+(or every column with a distinct row, whichever side is smaller) so that the
+total cost of the pairs is minimal. It runs Bertsekas' forward/reverse
+auction with epsilon scaling:
+
+- forward rounds: every unassigned row bids for its best column, at a price
+  that keeps the column just ahead of the row's second best
+- reverse rounds, for more columns than rows: every unassigned column priced
+  above the cheapest assigned one lowers its price to win its best row
+
+All bidders of a round bid at once, so a round is a handful of NumPy
+operations over their rows or columns. Costs are rounded to multiples of
+`resolution` and the last scaling phase runs with an epsilon small enough
+for the result to be optimal for the rounded costs.
+
+Separable costs, a row part plus a column part such as a pickup distance
+plus a customer distance from the same kitchen, are the auction's worst
+case (every row ranks the columns alike) but need no search: any pairing
+of the rows with the cheapest columns is optimal.
+"""
+
+import numpy as np
+
+# Bidders evaluated per NumPy operation, bounds the temporary arrays
+BID_BLOCK_SIZE = 1024
+# Factor by which epsilon shrinks between scaling phases
+EPSILON_SCALING = 7
+
+
+def _best_two(values):
+    """Index and value of the best and value of the second best entry per row."""
+    rows = np.arange(len(values))
+    best = values.argmax(axis=1)
+    best_value = values[rows, best]
+    values[rows, best] = -np.inf
+    return best, best_value, values.max(axis=1)
+
+
+def _award(targets, offers, bidders):
+    """Keep the highest offer per target: (targets, offers, winners)."""
+    order = np.lexsort((-offers, targets))
+    targets, offers, bidders = targets[order], offers[order], bidders[order]
+    first = np.ones(len(targets), dtype=bool)
+    first[1:] = targets[1:] != targets[:-1]
+    return targets[first], offers[first], bidders[first]
+
+
+def _forward_round(benefit, prices, column_of_row, row_of_column, epsilon):
+    """Let every unassigned row bid for its best column."""
+    bidders = np.flatnonzero(column_of_row < 0)
+    columns = np.empty(len(bidders), dtype=np.int64)
+    bids = np.empty(len(bidders))
+    for start in range(0, len(bidders), BID_BLOCK_SIZE):
+        block = slice(start, start + BID_BLOCK_SIZE)
+        best, best_value, second_value = _best_two(benefit[bidders[block]] - prices)
+        columns[block] = best
+        bids[block] = prices[best] + best_value - second_value + epsilon
+
+    columns, bids, winners = _award(columns, bids, bidders)
+    outbid = row_of_column[columns]
+    column_of_row[outbid[outbid >= 0]] = -1
+    row_of_column[columns] = winners
+    column_of_row[winners] = columns
+    prices[columns] = bids
+
+
+def _reverse_round(benefit, prices, column_of_row, row_of_column, floor, epsilon):
+    """
+    Let every unassigned column priced above `floor` bid for its best row.
+
+    Returns:
+        bool: Whether any column was still priced above the floor
+    """
+    bidders = np.flatnonzero((row_of_column < 0) & (prices > floor))
+    if not len(bidders):
+        return False
+    assigned = column_of_row >= 0
+    profits = np.full(len(column_of_row), -np.inf)
+    profits[assigned] = (
+        benefit[assigned, column_of_row[assigned]] - prices[column_of_row[assigned]]
+    )
+
+    rows = np.empty(len(bidders), dtype=np.int64)
+    new_prices = np.empty(len(bidders))
+    gains = np.empty(len(bidders), dtype=bool)
+    for start in range(0, len(bidders), BID_BLOCK_SIZE):
+        block = slice(start, start + BID_BLOCK_SIZE)
+        best, best_value, second_value = _best_two(benefit[:, bidders[block]].T - profits)
+        rows[block] = best
+        gains[block] = best_value - epsilon > floor
+        new_prices[block] = np.maximum(floor, second_value - epsilon)
+
+    # Columns that cannot beat the floor drop to it and stay unassigned
+    prices[bidders[~gains]] = floor
+    bidders, rows, new_prices = bidders[gains], rows[gains], new_prices[gains]
+    if len(bidders):
+        # A row goes to the column leaving it the highest profit
+        offers = benefit[rows, bidders] - new_prices
+        rows, _, winners = _award(rows, offers, bidders)
+        won_prices = prices.copy()
+        won_prices[bidders] = new_prices
+        released = column_of_row[rows]
+        row_of_column[released] = -1
+        column_of_row[rows] = winners
+        row_of_column[winners] = rows
+        prices[winners] = won_prices[winners]
+    return True
+
+
+def _separable_column_costs(cost, tolerance):
+    """Column part of `cost` if it is a row part plus a column part, else None."""
+    row_costs = cost[:, 0]
+    column_costs = cost[0] - cost[0, 0]
+    for start in range(0, len(cost), BID_BLOCK_SIZE):
+        block = cost[start : start + BID_BLOCK_SIZE]
+        residual = block - row_costs[start : start + BID_BLOCK_SIZE, None] - column_costs
+        if np.abs(residual).max() > tolerance:
+            return None
+    return column_costs
+
+
+def _auction(benefit, epsilon, min_epsilon):
+    """Maximize the total benefit, every row getting a distinct column."""
+    n_rows, n_columns = benefit.shape
+    # Starting from the column maxima, rows whose costs differ by a constant
+    # per column (the same ranking of columns) are already close to
+    # indifferent, instead of all bidding for the same column
+    prices = benefit.max(axis=0)
+    while True:
+        column_of_row = np.full(n_rows, -1, dtype=np.int64)
+        row_of_column = np.full(n_columns, -1, dtype=np.int64)
+        while (column_of_row < 0).any():
+            _forward_round(benefit, prices, column_of_row, row_of_column, epsilon)
+        if n_columns > n_rows:
+            floor = prices[column_of_row].min()
+            while _reverse_round(
+                benefit, prices, column_of_row, row_of_column, floor, epsilon
+            ):
+                pass
+        if epsilon <= min_epsilon:
+            return column_of_row
+        epsilon = max(epsilon / EPSILON_SCALING, min_epsilon)
+
+
+def _result(rows, columns, transposed):
+    """Pairs in the caller's orientation, sorted by row."""
+    if transposed:
+        order = np.argsort(columns)
+        return columns[order], rows[order]
+    return rows, columns
+
+
+def solve_assignment(cost, resolution=1e-3, seed=0):
+    """
+    Pair rows and columns of `cost` at minimum total cost.
+
+    Args:
+        cost (array-like): Matrix of finite costs
+        resolution (float): Costs are rounded to multiples of this value
+        seed (int): Seed of the tie breaker between equally cheap pairs
+
+    Returns:
+        tuple: (row_indices, column_indices) arrays of the pairs, sorted by
+            row; there are min(rows, columns) of them
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n_rows, n_columns = cost.shape
+    if not n_rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    column_costs = _separable_column_costs(cost, resolution / 2)
+    if column_costs is not None:
+        columns = np.sort(np.argsort(column_costs, kind="stable")[:n_rows])
+        return _result(np.arange(n_rows), columns, transposed)
+
+    # Integer costs scaled by 2 (n + 1) plus a random tie breaker below 1:
+    # rows with equal preferences spread over their tied columns instead of
+    # outbidding each other one column at a time, and with a final epsilon
+    # of 1 the result is still optimal for the rounded costs
+    benefit = np.random.default_rng(seed).random((n_rows, n_columns))
+    scaled = cost / resolution
+    np.rint(scaled, out=scaled)
+    scaled *= 2 * (n_rows + 1)
+    benefit -= scaled
+    del scaled
+
+    spread = benefit.max() - benefit.min()
+    columns = _auction(benefit, max(spread / 2, 1.0), min_epsilon=1.0)
+    return _result(np.arange(n_rows), columns, transposed)
@@ -0,0 +1,120 @@
+"""
+Redis read-through cache with write invalidation.
+
+Every cached key has a version counter next to it. Writers bump the version
+and delete the entry after their transaction commits; readers remember the
+version they saw before loading from MySQL and only store the loaded value
+if the version is still the same. A reader whose load raced with a write can
+therefore never put the pre-write value back into the cache.
+"""
+
+import json
+import logging
+import threading
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Store the value only if nobody invalidated the key since the load started
+FILL_IF_VERSION_UNCHANGED = """
+local current = redis.call('GET', KEYS[2]) or '0'
+if current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class ReadThroughCache:
+    """JSON values cached in Redis under `<namespace>:<key>`."""
+
+    def __init__(self, redis_client, namespace, ttl):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.ttl = ttl
+        # Version counters must outlive any load that started before a write
+        self.version_ttl = max(ttl * 10, 3600)
+        self._fill = self.redis.register_script(FILL_IF_VERSION_UNCHANGED)
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._errors = 0
+
+    def _data_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _version_key(self, key):
+        return f"{self.namespace}:{key}:version"
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value of `key`, loading and caching it on a miss.
+
+        Args:
+            key: Cache key within the namespace
+            loader (callable): Returns the JSON-serializable value from MySQL
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        try:
+            cached, version = self.redis.mget(self._data_key(key), self._version_key(key))
+        except redis.RedisError as e:
+            logger.warning(f"Cache read failed for {self._data_key(key)}: {str(e)}")
+            self._count("_errors")
+            return loader()
+
+        if cached is not None:
+            self._count("_hits")
+            return json.loads(cached)
+
+        self._count("_misses")
+        value = loader()
+        try:
+            self._fill(
+                keys=[self._data_key(key), self._version_key(key)],
+                args=[version or "0", json.dumps(value), self.ttl],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Cache fill failed for {self._data_key(key)}: {str(e)}")
+            self._count("_errors")
+        return value
+
+    def invalidate(self, *keys):
+        """Drop `keys` from the cache; call after the write has committed."""
+        if not keys:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        for key in keys:
+            pipe.incr(self._version_key(key))
+            pipe.expire(self._version_key(key), self.version_ttl)
+            pipe.delete(self._data_key(key))
+        try:
+            results = pipe.execute()
+        except redis.RedisError as e:
+            # Entries expire after the TTL at the latest
+            logger.warning(f"Cache invalidation failed for {self.namespace}: {str(e)}")
+            self._count("_errors")
+            return
+        self._count("_evictions", sum(results[2::3]))
+
+    def stats(self):
+        """Hit, miss and eviction counters of this replica."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "errors": self._errors,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+                "ttl": self.ttl,
+            }
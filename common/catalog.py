@@ -0,0 +1,99 @@
+"""
+In-process catalog of stock items.
+
+Item names, capacities and shard counts (see common/stock_shards.py)
+practically never change, unlike the stock quantities next to them, so
+services keep the item_id -> {item_name, max_quantity, shards} map in memory
+instead of joining the `stock` rows that stock updates keep locking.
+
+Freshness is driven by the `catalog` table version (see common/versions.py):
+any write that changes an item's name, max_quantity or shards, or adds an item,
+bumps it after commit. Readers compare that counter with the one they loaded
+at most every CATALOG_REFRESH_INTERVAL seconds, which costs one Redis GET.
+Without Redis the catalog is reloaded from MySQL on that interval instead.
+Looking up an item id that is not in the catalog checks the version right
+away, so a new item is visible as soon as its writer has bumped it.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "5"))
+CATALOG_TABLE = "catalog"
+CATALOG_QUERY = (
+    "SELECT item_id, item_name, max_quantity, shards FROM stock ORDER BY item_id"
+)
+
+
+class Catalog:
+    """Versioned item catalog of one service replica."""
+
+    def __init__(
+        self,
+        loader,
+        table_versions,
+        refresh_interval=CATALOG_REFRESH_INTERVAL,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            loader (callable): Returns the catalog rows (dicts of CATALOG_QUERY)
+            table_versions (TableVersions): Source of the `catalog` version
+            refresh_interval (float): Seconds between two version checks
+            clock (callable): Monotonic time source
+        """
+        self._loader = loader
+        self._table_versions = table_versions
+        self._refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._items = None
+        self._version = None
+        self._checked_at = None
+
+    def _reload(self, version):
+        rows = self._loader()
+        self._items = {
+            row["item_id"]: {
+                "item_name": row["item_name"],
+                "max_quantity": row["max_quantity"],
+                "shards": row["shards"],
+            }
+            for row in rows
+        }
+        self._version = version
+        logger.info(f"Loaded catalog of {len(self._items)} items (version {version})")
+
+    def items(self, force_check=False):
+        """Return the item_id -> {item_name, max_quantity, shards} map, refreshed if stale."""
+        with self._lock:
+            now = self._clock()
+            if (
+                not force_check
+                and self._checked_at is not None
+                and now - self._checked_at < self._refresh_interval
+            ):
+                return self._items
+            versions = self._table_versions.current(CATALOG_TABLE)
+            version = versions[0] if versions else None
+            if self._items is None or version is None or version != self._version:
+                self._reload(version)
+            self._checked_at = now
+            return self._items
+
+    def get(self, item_id):
+        """Catalog entry of `item_id`, or None if the item does not exist."""
+        items = self.items()
+        if item_id not in items:
+            # Possibly an item added since the last version check
+            items = self.items(force_check=True)
+        return items.get(item_id)
+
+    def invalidate(self):
+        """Force a version check on the next read."""
+        with self._lock:
+            self._checked_at = None
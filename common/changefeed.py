@@ -0,0 +1,105 @@
+"""
+Change feed of order and delivery state transitions.
+
+Each committed transition is appended once to a Redis stream. Stream entry
+ids (`<milliseconds>-<sequence>`) are the feed's sequence numbers: the API
+gateway serves the stream as server-sent events and a client that reconnects
+with `Last-Event-ID` resumes right after the last entry it saw.
+
+Publishing happens after commit, and a Redis error drops the transitions of
+that call. The publisher then remembers the gap and appends a `reset` entry
+before its next transitions, which the gateway serves as a `reset` event:
+clients reload their lists instead of silently missing a change.
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import redis
+
+from common.redis_store import redis_from_env
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_STREAM = os.getenv("CHANGE_FEED_STREAM", "changes")
+# Approximate number of entries kept for clients resuming after a disconnect
+CHANGE_FEED_MAXLEN = int(os.getenv("CHANGE_FEED_MAXLEN", "100000"))
+
+
+class ChangeFeed:
+    """Publisher for the change feed stream."""
+
+    def __init__(self, redis_client, stream=CHANGE_FEED_STREAM, maxlen=CHANGE_FEED_MAXLEN):
+        self.redis = redis_client
+        self.stream = stream
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        # Transitions were dropped since the last entry this publisher appended
+        self._gap = False
+
+    def publish(self, entity, entity_id, event, **fields):
+        """
+        Append one transition to the feed.
+
+        Called after the transaction that made the change has committed. A
+        Redis outage must not fail the write that already succeeded, so errors
+        are logged, the event is dropped and the next publish appends a
+        `reset` entry first.
+
+        Args:
+            entity (str): 'order', 'delivery' or 'delivery_person'
+            entity_id: Id of the changed row
+            event (str): Transition name, e.g. 'created' or 'status_changed'
+            **fields: New values of the changed columns
+
+        Returns:
+            str: Sequence number of the entry, or None if publishing failed
+        """
+        ids = self.publish_many([(entity, entity_id, event, fields)])
+        return ids[0] if ids else None
+
+    def publish_many(self, changes):
+        """
+        Append several transitions in one Redis round trip.
+
+        Args:
+            changes (list): (entity, entity_id, event, fields) tuples
+
+        Returns:
+            list: Sequence numbers of the entries, empty if publishing failed
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            gap, self._gap = self._gap, False
+        pipe = self.redis.pipeline(transaction=False)
+        if gap:
+            pipe.xadd(
+                self.stream,
+                {"entity": "reset", "data": json.dumps({"entity": "reset", "at": now})},
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+        for entity, entity_id, event, fields in changes:
+            change = {"entity": entity, "id": entity_id, "event": event, "at": now, **fields}
+            pipe.xadd(
+                self.stream,
+                {"entity": entity, "data": json.dumps(change, default=str)},
+                maxlen=self.maxlen,
+                approximate=True,
+            )
+        try:
+            ids = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish {len(changes)} change(s): {str(e)}")
+            with self._lock:
+                self._gap = True
+            return []
+        return ids[1:] if gap else ids
+
+
+def change_feed_from_env(redis_client=None):
+    """Build the change feed publisher for the service environment."""
+    return ChangeFeed(redis_client or redis_from_env())
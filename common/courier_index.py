@@ -0,0 +1,370 @@
+"""
+Redis index of delivery person state.
+
+Every delivery person has a hash `couriers:<id>` with the columns of their
+`delivery_persons` row, is a member of `couriers:all` and of the set of their
+status (`couriers:idle` or `couriers:en_route`). The delivery service writes each
+status change through after its transaction has committed, so the idle and
+en_route listings, the counts and the first pick of a dispatch claim are
+answered from Redis without touching MySQL.
+
+MySQL stays the source of truth. A delivery person popped from the idle set
+is still locked and checked in MySQL before being assigned, and readers fall
+back to MySQL while the index is not built (`couriers:ready` missing, e.g.
+after Redis lost its data) or Redis is unavailable. A write-through that is
+lost or applied out of order leaves the index drifted until the reconciler
+(`python -m common.courier_index`) compares it with MySQL every
+COURIER_RECONCILE_INTERVAL seconds and repairs it. Status changes are written
+through before `delivery_persons` is bumped, so a listing tagged with the new
+version is never answered from the old index.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+
+import redis
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.migrate import apply_migrations
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
+COURIER_RECONCILE_INTERVAL = float(os.getenv("COURIER_RECONCILE_INTERVAL", "30"))
+COURIER_RECONCILER_LOCK = "food_delivery.courier_reconciler"
+
+INDEXED_STATUSES = ("idle", "en_route")
+COURIER_FIELDS = (
+    "id",
+    "name",
+    "phone_number",
+    "person_status",
+    "position_x",
+    "position_y",
+    "idle_since",
+)
+DELIVERY_PERSONS_QUERY = f"SELECT {', '.join(COURIER_FIELDS)} FROM delivery_persons"
+
+# Replace the hash and set memberships of one delivery person (KEYS: hash,
+# idle set, en_route set, all set; ARGV: expected status, id, status, hash
+# fields), or remove them when no fields are given. Nothing changes if the
+# expected status is not '*' and differs from the one currently indexed.
+SET_STATE = """
+if ARGV[1] ~= '*' and (redis.call('HGET', KEYS[1], 'person_status') or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SREM', KEYS[2], ARGV[2])
+redis.call('SREM', KEYS[3], ARGV[2])
+if #ARGV > 3 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+    redis.call('SADD', KEYS[4], ARGV[2])
+    if ARGV[3] == 'idle' then
+        redis.call('SADD', KEYS[2], ARGV[2])
+    elseif ARGV[3] == 'en_route' then
+        redis.call('SADD', KEYS[3], ARGV[2])
+    end
+else
+    redis.call('SREM', KEYS[4], ARGV[2])
+end
+return 1
+"""
+
+# Put a delivery person popped from the idle set back if they are still idle
+RESTORE_IDLE = """
+if redis.call('HGET', KEYS[1], 'person_status') == 'idle' then
+    return redis.call('SADD', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+
+def encode_courier(row):
+    """Hash fields of a delivery_persons row."""
+    fields = {}
+    for field in COURIER_FIELDS:
+        value = row.get(field)
+        if isinstance(value, datetime):
+            # idle_since is a DATETIME(3) column
+            value = value.isoformat(timespec="milliseconds")
+        fields[field] = "" if value is None else str(value)
+    return fields
+
+
+def decode_courier(fields):
+    """Rebuild a delivery_persons row from its hash fields."""
+    return {
+        "id": int(fields["id"]),
+        "name": fields["name"],
+        "phone_number": fields["phone_number"],
+        "person_status": fields["person_status"],
+        "position_x": float(fields.get("position_x") or 0),
+        "position_y": float(fields.get("position_y") or 0),
+        "idle_since": datetime.fromisoformat(fields["idle_since"])
+        if fields.get("idle_since")
+        else None,
+    }
+
+
+class CourierIndex:
+    """Delivery person hashes and status sets stored under `<namespace>:*`."""
+
+    def __init__(self, redis_client, namespace="couriers"):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.ready_key = f"{namespace}:ready"
+        self._set_state = self.redis.register_script(SET_STATE)
+        self._restore_idle = self.redis.register_script(RESTORE_IDLE)
+
+    def _hash_key(self, person_id):
+        return f"{self.namespace}:{person_id}"
+
+    def _status_key(self, person_status):
+        return f"{self.namespace}:{person_status}"
+
+    def _write(self, client, person_id, row, expected="*"):
+        """Index `row` for `person_id`, or remove them if `row` is None."""
+        args = [expected, person_id, row["person_status"] if row else ""]
+        if row:
+            args.extend(value for item in encode_courier(row).items() for value in item)
+        return self._set_state(
+            keys=[
+                self._hash_key(person_id),
+                *map(self._status_key, INDEXED_STATUSES),
+                self._status_key("all"),
+            ],
+            args=args,
+            client=client,
+        )
+
+    def update(self, *rows):
+        """Write the committed state of delivery persons through to the index."""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for row in rows:
+                self._write(pipe, row["id"], row)
+            pipe.execute()
+        except redis.RedisError as e:
+            person_ids = [row["id"] for row in rows]
+            logger.warning(f"Failed to index delivery persons {person_ids}: {str(e)}")
+
+    def set_status(self, person_status, *person_ids, **fields):
+        """
+        Write a status change through, keeping the indexed fields not in `fields`.
+
+        Delivery persons missing from the index are left to the reconciler.
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for person_id in person_ids:
+                pipe.hgetall(self._hash_key(person_id))
+            rows = [decode_courier(fields) for fields in pipe.execute() if fields]
+        except (redis.RedisError, KeyError, ValueError) as e:
+            logger.warning(f"Failed to read indexed delivery persons {person_ids}: {str(e)}")
+            return
+        for row in rows:
+            row.update(fields, person_status=person_status)
+            if person_status != "idle":
+                row["idle_since"] = None
+        self.update(*rows)
+
+    def rebuild(self, rows):
+        """Replace the whole index with `rows` read from MySQL and mark it ready."""
+        try:
+            stale = set(self.redis.smembers(self._status_key("all")))
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(
+                *map(self._status_key, (*INDEXED_STATUSES, "all")),
+                *map(self._hash_key, stale),
+            )
+            for row in rows:
+                self._write(pipe, row["id"], row)
+            pipe.set(self.ready_key, 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to rebuild the delivery person index: {str(e)}")
+            return False
+        return True
+
+    def members(self, person_status):
+        """
+        Indexed delivery persons with `person_status`, sorted by id.
+
+        Returns:
+            list: Delivery person rows, or None if the index is unavailable
+        """
+        try:
+            ready, person_ids = (
+                self.redis.pipeline(transaction=False)
+                .exists(self.ready_key)
+                .smembers(self._status_key(person_status))
+                .execute()
+            )
+            if not ready:
+                return None
+            pipe = self.redis.pipeline(transaction=False)
+            for person_id in sorted(person_ids, key=int):
+                pipe.hgetall(self._hash_key(person_id))
+            rows = [decode_courier(fields) for fields in pipe.execute() if fields]
+        except (redis.RedisError, KeyError, ValueError) as e:
+            logger.warning(f"Failed to read the delivery person index: {str(e)}")
+            return None
+        # A write-through in progress may have updated the hash but not the sets yet
+        return [row for row in rows if row["person_status"] == person_status]
+
+    def counts(self):
+        """
+        Number of delivery persons per indexed status.
+
+        Returns:
+            dict: Status to count, or None if the index is unavailable
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False).exists(self.ready_key)
+            for person_status in INDEXED_STATUSES:
+                pipe.scard(self._status_key(person_status))
+            ready, *counts = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to count indexed delivery persons: {str(e)}")
+            return None
+        return dict(zip(INDEXED_STATUSES, counts)) if ready else None
+
+    def pop_idle(self):
+        """
+        Take a random delivery person out of the idle set.
+
+        The caller must lock and check them in MySQL, and `restore_idle` them
+        if they end up not being assigned.
+
+        Returns:
+            int: Delivery person id, or None if nobody is indexed as idle
+        """
+        try:
+            person_id = self.redis.spop(self._status_key("idle"))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to pop an idle delivery person: {str(e)}")
+            return None
+        return int(person_id) if person_id is not None else None
+
+    def restore_idle(self, person_id):
+        """Return a popped delivery person to the idle set if still indexed as idle."""
+        try:
+            self._restore_idle(
+                keys=[self._hash_key(person_id), self._status_key("idle")], args=[person_id]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Failed to restore idle delivery person {person_id}: {str(e)}")
+
+    def reconcile(self, read_rows):
+        """
+        Repair every delivery person whose indexed state differs from MySQL.
+
+        The index is read before MySQL, and a repair only applies if the
+        indexed status is still the one read: a write-through that lands in
+        between is newer than the MySQL rows and is kept.
+
+        Args:
+            read_rows (callable): Returns the current delivery_persons rows
+
+        Returns:
+            int: Number of delivery persons repaired, -1 if the index was rebuilt
+        """
+        if not self.redis.exists(self.ready_key):
+            return -1 if self.rebuild(read_rows()) else 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        for person_status in (*INDEXED_STATUSES, "all"):
+            pipe.smembers(self._status_key(person_status))
+        *status_members, indexed_ids = pipe.execute()
+        indexed_ids = sorted(indexed_ids, key=int)
+        pipe = self.redis.pipeline(transaction=False)
+        for person_id in indexed_ids:
+            pipe.hgetall(self._hash_key(person_id))
+        indexed = {
+            int(person_id): fields for person_id, fields in zip(indexed_ids, pipe.execute())
+        }
+        membership = {
+            int(person_id): person_status
+            for person_status, members in zip(INDEXED_STATUSES, status_members)
+            for person_id in members
+        }
+
+        rows = {row["id"]: row for row in read_rows()}
+        repairs = []
+        for person_id in sorted(set(rows) | set(indexed) | set(membership)):
+            row, fields = rows.get(person_id), indexed.get(person_id) or {}
+            if row is None:
+                in_sync = not fields and person_id not in membership
+            else:
+                person_status = row["person_status"]
+                in_sync = fields == encode_courier(row) and membership.get(person_id) == (
+                    person_status if person_status in INDEXED_STATUSES else None
+                )
+            if not in_sync:
+                repairs.append((person_id, row, fields.get("person_status", "")))
+        if not repairs:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        for person_id, row, expected in repairs:
+            self._write(pipe, person_id, row, expected)
+        return sum(pipe.execute())
+
+
+def load_delivery_persons(pool):
+    """Read the state of every delivery person from MySQL."""
+    with pool.borrow() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute(DELIVERY_PERSONS_QUERY)
+            return cursor.fetchall()
+
+
+def run_reconciler(pool, index, table_versions, interval=COURIER_RECONCILE_INTERVAL):
+    """
+    Reconcile forever; only the replica holding the reconciler lock repairs.
+
+    Listings of idle and en_route delivery persons are read from the index,
+    so `delivery_persons` is bumped after every repair or rebuild: clients
+    holding an ETag of the drifted listing get the repaired one.
+    """
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = pool.acquire()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT GET_LOCK(%s, -1)", (COURIER_RECONCILER_LOCK,))
+                    cursor.fetchone()
+                logger.info("Acquired courier reconciler lock")
+
+            repaired = index.reconcile(lambda: load_delivery_persons(pool))
+            if repaired:
+                table_versions.bump("delivery_persons")
+            if repaired < 0:
+                logger.info("Rebuilt the delivery person index")
+            elif repaired:
+                logger.warning(f"Repaired {repaired} drifted delivery persons in the index")
+        except (MySQLError, PoolTimeoutError) as e:
+            logger.error(f"Courier reconciler database error: {str(e)}")
+            if conn is not None:
+                pool.release(conn, discard=True)
+                conn = None
+        except redis.RedisError as e:
+            logger.error(f"Courier reconciler Redis error: {str(e)}")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # One connection holds the lock, the other reads the delivery persons
+    pool = ConnectionPool(db_config_from_env(), pool_size=2)
+    apply_migrations(pool)
+    redis_client = redis_from_env()
+    run_reconciler(pool, CourierIndex(redis_client), TableVersions(redis_client))
@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import mysql.connector
+from fastapi import HTTPException, status
+from mysql.connector.errors import Error as MySQLError
+
+# Pool configuration, tunable per replica
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Threads that run blocking queries off the event loop; defaults to the pool size
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "0"))
+
+
+def db_config_from_env():
+    """Build the MySQL connection settings from the service environment."""
+    return {
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "database": os.getenv("DB_NAME"),
+    }
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, health-checked pool of MySQL connections.
+
+    Connections are opened lazily up to `pool_size`. A checkout waits at most
+    `timeout` seconds for a free slot. Idle connections older than
+    `max_lifetime` seconds are closed and replaced, and with `pre_ping`
+    enabled every checkout pings the server before handing the connection out.
+    """
+
+    def __init__(
+        self,
+        db_config,
+        pool_size=DB_POOL_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        pre_ping=DB_POOL_PRE_PING,
+        executor_workers=DB_EXECUTOR_WORKERS,
+    ):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        # Never run more blocking calls than there are connections to serve them
+        self.executor_workers = executor_workers or pool_size
+
+        self._lock = threading.Condition()
+        self._idle = []  # (connection, created_at) pairs, most recently used last
+        self._created_at = {}  # id(connection) -> creation time of checked out ones
+        self._open = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        self._timeouts = 0
+        self._executor = None
+        self._pending = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.db_config)
+        with self._lock:
+            self._created += 1
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except MySQLError:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+
+    def _is_usable(self, conn, created_at):
+        if time.monotonic() - created_at > self.max_lifetime:
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except MySQLError:
+                return False
+        return True
+
+    def acquire(self):
+        """Check out a connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                while not self._idle and self._open >= self.pool_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.timeout}s"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                else:
+                    conn, created_at = None, None
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    conn, created_at = self._connect()
+                except MySQLError:
+                    with self._lock:
+                        self._open -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_usable(conn, created_at):
+                with self._lock:
+                    self._recycled += 1
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                self._created_at[id(conn)] = created_at
+            return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, ending any open transaction."""
+        with self._lock:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+        if not discard:
+            try:
+                # Never hand a pending transaction or a stale snapshot to the
+                # next borrower.
+                conn.rollback()
+            except MySQLError:
+                discard = True
+        if discard:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, created_at))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a pooled connection for one unit of work."""
+        try:
+            conn = self.acquire()
+        except (MySQLError, PoolTimeoutError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Database connection failed: {str(e)}",
+            )
+        discard = False
+        try:
+            yield conn
+        except MySQLError as e:
+            discard = True
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Database connection failed: {str(e)}",
+            )
+        except BaseException:
+            discard = not conn.is_connected()
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    @contextmanager
+    def borrow(self):
+        """
+        Context manager like `connection` for background workers.
+
+        MySQLError and PoolTimeoutError reach the caller as they are instead
+        of as an HTTP 503, so worker loops can catch them and retry.
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except MySQLError:
+            discard = True
+            raise
+        except BaseException:
+            discard = not conn.is_connected()
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.executor_workers, thread_name_prefix="db"
+                )
+            return self._executor
+
+    def _run_tracked(self, func):
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking data-access function on the pool's executor.
+
+        FastAPI endpoints await this instead of calling `mysql.connector`
+        directly, so a slow query only occupies a DB thread and never the
+        event loop serving every other request on the worker.
+        """
+        executor = self._get_executor()
+        with self._lock:
+            self._pending += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, self._run_tracked, functools.partial(func, *args, **kwargs)
+        )
+
+    def close(self):
+        """Close every idle connection, e.g. on application shutdown."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Current pool usage counters."""
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+                "timeouts": self._timeouts,
+                "executor_workers": self.executor_workers,
+                "executor_pending": self._pending,
+            }
@@ -0,0 +1,99 @@
+"""
+Denormalized `delivery_view` table (migration 0009) behind the delivery reads.
+
+Each live delivery has one row carrying the order and delivery person
+columns that the Delivery model shows, so /deliveries and /deliveries/{id}
+read a single table through its own indexes instead of joining deliveries,
+orders and delivery_persons on every request. The join runs on the write
+path instead, in the transaction of each write that changes what a row
+shows:
+
+- a delivery is created: `record_deliveries`
+- the status or delivered_at of an order changes: `record_order_statuses`
+- a delivery person is renamed: `record_delivery_person_name`
+- an order is archived: its rows are deleted with it (common/archive.py)
+"""
+
+DELIVERY_VIEW_COLUMNS = (
+    "id",
+    "order_id",
+    "order_status",
+    "order_time",
+    "customer_name",
+    "customer_distance",
+    "delivery_person_id",
+    "delivery_person_name",
+    "delivered_at",
+    "dropoff_x",
+    "dropoff_y",
+)
+
+# The view columns of deliveries joined with {orders} and delivery persons;
+# also serves archived deliveries, which have no view rows
+DELIVERY_VIEW_SELECT = """SELECT
+        dl.id,
+        dl.order_id,
+        o.order_status,
+        o.order_time,
+        o.customer_name,
+        o.customer_distance,
+        dl.delivery_person_id,
+        dp.name AS delivery_person_name,
+        o.delivered_at,
+        dl.dropoff_x,
+        dl.dropoff_y
+    FROM {deliveries} dl
+    LEFT JOIN {orders} o ON o.id = dl.order_id
+    LEFT JOIN delivery_persons dp ON dp.id = dl.delivery_person_id"""
+
+
+def record_deliveries(cursor, delivery_ids):
+    """
+    Add the view rows of new deliveries as part of the caller's transaction.
+
+    The orders are read with a shared lock, so a concurrent status change
+    either happens first and is copied, or waits and updates the new rows.
+    """
+    if not delivery_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(delivery_ids))
+    columns = ", ".join(DELIVERY_VIEW_COLUMNS)
+    cursor.execute(
+        f"INSERT INTO delivery_view ({columns}) "
+        + DELIVERY_VIEW_SELECT.format(deliveries="deliveries", orders="orders")
+        + f" WHERE dl.id IN ({placeholders}) ORDER BY dl.id FOR SHARE OF o",
+        tuple(delivery_ids),
+    )
+
+
+def record_order_statuses(cursor, order_ids):
+    """
+    Copy the status and delivered_at of orders into their view rows.
+
+    Must run in the transaction that changed the orders, after the update.
+    """
+    if not order_ids:
+        return
+    order_ids = sorted(order_ids)
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    cursor.execute(
+        "UPDATE delivery_view v JOIN orders o ON o.id = v.order_id"
+        " SET v.order_status = o.order_status, v.delivered_at = o.delivered_at"
+        f" WHERE v.order_id IN ({placeholders})",
+        tuple(order_ids),
+    )
+
+
+def record_delivery_person_name(cursor, person_id):
+    """
+    Copy the name of a delivery person into their view rows.
+
+    No endpoint renames delivery persons yet; one that does must call this
+    in its transaction.
+    """
+    cursor.execute(
+        "UPDATE delivery_view v JOIN delivery_persons dp ON dp.id = v.delivery_person_id"
+        " SET v.delivery_person_name = dp.name"
+        " WHERE v.delivery_person_id = %s",
+        (person_id,),
+    )
@@ -0,0 +1,342 @@
+"""
+Dispatch of queued orders to idle delivery persons.
+
+Orders that find nobody idle wait in the `dispatch_queue` table (migration
+0007). Every transaction that adds to or takes from the queue first locks
+the single `dispatch_mutex` row, so an order is never queued while a
+delivery person goes idle without either of them seeing the other.
+
+Positions are kilometres east (x) and north (y) of the kitchen, where every
+order is picked up. A delivery person who drops off an order rides back
+towards the kitchen while idle, so the trip of an assignment is what is left
+of that ride (its pickup distance) followed by the customer distance.
+
+With DISPATCH_MODE=immediate (the default) the delivery service assigns an
+order as soon as somebody is idle, and a delivery person who becomes idle
+takes the head of the queue. With DISPATCH_MODE=batch it only queues, and
+the matcher (`python -m common.dispatch`) assigns the waiting orders to the
+idle delivery persons every DISPATCH_MATCH_INTERVAL seconds, pairing them
+at the lowest total travel distance (see common/assignment.py). Only one
+replica matches at a time.
+"""
+
+import logging
+import math
+import os
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+from mysql.connector.errors import Error as MySQLError
+
+from common.assignment import solve_assignment
+from common.changefeed import change_feed_from_env
+from common.courier_index import CourierIndex
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.delivery_view import record_deliveries
+from common.migrate import apply_migrations
+from common.order_stats import duration_bucket
+from common.outbox import enqueue_task
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "immediate")
+# Orders still waiting for a delivery person after this many seconds are cancelled
+DISPATCH_MAX_WAIT = int(os.getenv("DISPATCH_MAX_WAIT", "3600"))
+DISPATCH_MATCH_INTERVAL = float(os.getenv("DISPATCH_MATCH_INTERVAL", "2"))
+# Most orders and delivery persons paired by one matcher transaction
+DISPATCH_MATCH_BATCH_SIZE = int(os.getenv("DISPATCH_MATCH_BATCH_SIZE", "1000"))
+DISPATCH_MATCHER_LOCK = "food_delivery.dispatch_matcher"
+
+KITCHEN_POSITION = (0.0, 0.0)
+# Riding pace of delivery persons, as in the delivery simulation of tasks/tasks.py
+RIDE_SECONDS_PER_KM = 5.0
+
+
+def dropoff_position(order_id, customer_distance):
+    """
+    Drop-off coordinates of an order that came without any.
+
+    The order lies `customer_distance` km from the kitchen, at a bearing
+    derived from its id so every service computes the same point.
+    """
+    bearing = zlib.crc32(order_id.encode()) / 2**32 * 2 * math.pi
+    return (
+        KITCHEN_POSITION[0] + customer_distance * math.cos(bearing),
+        KITCHEN_POSITION[1] + customer_distance * math.sin(bearing),
+    )
+
+
+def pickup_distance(position_x, position_y, idle_seconds=0.0):
+    """
+    Distance in km left to the kitchen.
+
+    Args:
+        position_x (float): Where the delivery person became idle
+        position_y (float): Where the delivery person became idle
+        idle_seconds (float): Time spent riding back since then
+    """
+    distance = math.hypot(position_x - KITCHEN_POSITION[0], position_y - KITCHEN_POSITION[1])
+    return max(distance - idle_seconds / RIDE_SECONDS_PER_KM, 0.0)
+
+
+def idle_seconds(idle_since, now):
+    """Seconds a delivery person has been idle, 0 if unknown."""
+    return max((now - idle_since).total_seconds(), 0.0) if idle_since else 0.0
+
+
+def dispatch_costs(delivery_persons, orders, now):
+    """
+    Travel distance of every delivery person / order pair.
+
+    Args:
+        delivery_persons (list): Rows with position_x, position_y and idle_since
+        orders (list): Rows with customer_distance
+        now (datetime): Time of the assignment
+
+    Returns:
+        numpy.ndarray: Pickup plus customer distance, one row per delivery person
+    """
+    pickup = np.array(
+        [
+            pickup_distance(
+                row["position_x"], row["position_y"], idle_seconds(row["idle_since"], now)
+            )
+            for row in delivery_persons
+        ]
+    )
+    distances = np.array([float(row["customer_distance"]) for row in orders])
+    return pickup[:, None] + distances[None, :]
+
+
+def lock_dispatch_queue(cursor):
+    """Serialize the transactions that add to or take from the dispatch queue."""
+    cursor.execute("SELECT id FROM dispatch_mutex WHERE id = 1 FOR UPDATE")
+    cursor.fetchone()
+
+
+def record_dispatch_waits(cursor, waits_ms):
+    """Add claim-to-assignment waits, in milliseconds, to the histogram."""
+    histogram = defaultdict(lambda: [0, 0])
+    for wait_ms in waits_ms:
+        wait_ms = max(int(wait_ms), 0)
+        bucket = histogram[duration_bucket(wait_ms)]
+        bucket[0] += 1
+        bucket[1] += wait_ms
+    if not histogram:
+        return
+    # Rows are always locked in key order so concurrent writers can't deadlock
+    rows = sorted(histogram.items())
+    cursor.execute(
+        "INSERT INTO dispatch_wait_histogram (bucket, order_count, total_ms) VALUES "
+        + ", ".join(["(%s, %s, %s)"] * len(rows))
+        + " ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count),"
+        " total_ms = total_ms + VALUES(total_ms)",
+        tuple(value for bucket, (count, total) in rows for value in (bucket, count, total)),
+    )
+
+
+def expire_waiting_orders(cursor, now, max_wait=DISPATCH_MAX_WAIT):
+    """
+    Drop queued orders older than `max_wait` seconds and queue their cancellation.
+
+    Must run with the dispatch queue locked.
+
+    Returns:
+        list: IDs of the expired orders
+    """
+    cursor.execute(
+        "SELECT id, order_id FROM dispatch_queue WHERE enqueued_at < %s ORDER BY id",
+        (now - timedelta(seconds=max_wait),),
+    )
+    expired = cursor.fetchall()
+    if expired:
+        placeholders = ", ".join(["%s"] * len(expired))
+        cursor.execute(
+            f"DELETE FROM dispatch_queue WHERE id IN ({placeholders})",
+            tuple(row["id"] for row in expired),
+        )
+        for row in expired:
+            enqueue_task(
+                cursor, "cancel_order", [row["order_id"], "No delivery person available"]
+            )
+    return [row["order_id"] for row in expired]
+
+
+def match_batch(conn, batch_size=DISPATCH_MATCH_BATCH_SIZE, now=None):
+    """
+    Assign queued orders to idle delivery persons in one transaction.
+
+    Orders are taken in queue order (priority, then arrival), at most as
+    many as there are idle delivery persons, so a far away order is never
+    passed over for a closer one. Among more idle delivery persons than
+    orders, those with the shortest total trip are chosen.
+
+    Returns:
+        list: Assignments made, dicts with order_id, delivery_id,
+            delivery_person_id and pickup_distance
+    """
+    now = now or datetime.now()
+    conn.start_transaction(isolation_level="READ COMMITTED")
+    with conn.cursor(dictionary=True) as cursor:
+        lock_dispatch_queue(cursor)
+        expire_waiting_orders(cursor, now)
+        cursor.execute(
+            """SELECT id, order_id, customer_distance, dropoff_x, dropoff_y, enqueued_at
+            FROM dispatch_queue
+            ORDER BY priority DESC, id LIMIT %s""",
+            (batch_size,),
+        )
+        orders = cursor.fetchall()
+        delivery_persons = []
+        if orders:
+            cursor.execute(
+                """SELECT id, position_x, position_y, idle_since FROM delivery_persons
+                WHERE person_status = 'idle'
+                ORDER BY id LIMIT %s
+                FOR UPDATE SKIP LOCKED""",
+                (batch_size,),
+            )
+            delivery_persons = cursor.fetchall()
+        if not delivery_persons:
+            conn.commit()
+            return []
+
+        orders = orders[: len(delivery_persons)]
+        costs = dispatch_costs(delivery_persons, orders, now)
+        person_indices, order_indices = solve_assignment(costs)
+        pairs = [
+            (orders[j], delivery_persons[i]) for i, j in zip(person_indices, order_indices)
+        ]
+
+        placeholders = ", ".join(["%s"] * len(pairs))
+        cursor.execute(
+            f"DELETE FROM dispatch_queue WHERE id IN ({placeholders})",
+            tuple(order["id"] for order, _ in pairs),
+        )
+        cursor.execute(
+            "UPDATE delivery_persons SET person_status = 'en_route', idle_since = NULL"
+            f" WHERE id IN ({placeholders})",
+            tuple(person["id"] for _, person in pairs),
+        )
+        cursor.execute(
+            "INSERT INTO deliveries (order_id, delivery_person_id, dropoff_x, dropoff_y) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * len(pairs)),
+            tuple(
+                value
+                for order, person in pairs
+                for value in (order["order_id"], person["id"], order["dropoff_x"], order["dropoff_y"])
+            ),
+        )
+        cursor.execute(
+            f"SELECT id, order_id FROM deliveries WHERE order_id IN ({placeholders})",
+            tuple(order["order_id"] for order, _ in pairs),
+        )
+        delivery_ids = {row["order_id"]: row["id"] for row in cursor.fetchall()}
+        record_deliveries(cursor, sorted(delivery_ids.values()))
+        record_dispatch_waits(
+            cursor,
+            [(now - order["enqueued_at"]).total_seconds() * 1000 for order, _ in pairs],
+        )
+
+        assignments = []
+        for (order, person), i, j in zip(pairs, person_indices, order_indices):
+            distance = costs[i, j] - float(order["customer_distance"])
+            enqueue_task(
+                cursor,
+                "deliver_order",
+                [order["order_id"], float(order["customer_distance"]), person["id"], distance],
+            )
+            assignments.append(
+                {
+                    "order_id": order["order_id"],
+                    "delivery_id": delivery_ids.get(order["order_id"]),
+                    "delivery_person_id": person["id"],
+                    "pickup_distance": distance,
+                }
+            )
+        conn.commit()
+    return assignments
+
+
+def run_matcher(
+    pool,
+    table_versions,
+    change_feed,
+    courier_index,
+    interval=DISPATCH_MATCH_INTERVAL,
+    batch_size=DISPATCH_MATCH_BATCH_SIZE,
+):
+    """Match forever; only the replica holding the matcher lock assigns orders."""
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = pool.acquire()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT GET_LOCK(%s, -1)", (DISPATCH_MATCHER_LOCK,))
+                    cursor.fetchone()
+                logger.info("Acquired dispatch matcher lock")
+
+            started = time.monotonic()
+            assignments = match_batch(conn, batch_size)
+            if assignments:
+                courier_index.set_status(
+                    "en_route", *(assignment["delivery_person_id"] for assignment in assignments)
+                )
+                table_versions.bump("delivery_persons", "deliveries")
+                change_feed.publish_many(
+                    [
+                        change
+                        for assignment in assignments
+                        for change in (
+                            (
+                                "delivery_person",
+                                assignment["delivery_person_id"],
+                                "status_changed",
+                                {"person_status": "en_route"},
+                            ),
+                            (
+                                "delivery",
+                                assignment["delivery_id"],
+                                "created",
+                                {
+                                    "order_id": assignment["order_id"],
+                                    "delivery_person_id": assignment["delivery_person_id"],
+                                },
+                            ),
+                        )
+                    ]
+                )
+                logger.info(
+                    f"Matched {len(assignments)} orders in {time.monotonic() - started:.3f}s"
+                )
+            # Keep going right away while a full batch was matched
+            if len(assignments) < batch_size:
+                time.sleep(interval)
+        except (MySQLError, PoolTimeoutError) as e:
+            logger.error(f"Dispatch matcher database error: {str(e)}")
+            if conn is not None:
+                pool.release(conn, discard=True)
+                conn = None
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    pool = ConnectionPool(db_config_from_env(), pool_size=1)
+    apply_migrations(pool)
+    redis_client = redis_from_env()
+    run_matcher(
+        pool,
+        TableVersions(redis_client),
+        change_feed_from_env(redis_client),
+        CourierIndex(redis_client),
+    )
@@ -0,0 +1,228 @@
+"""
+Order id generation.
+
+The scheme is chosen with ORDER_ID_SCHEME:
+
+- `ulid` (default): 26-character ULIDs. The first 10 characters encode the
+  creation time in milliseconds, the remaining 16 are random, and ids created
+  within the same millisecond by one process are strictly increasing. New rows
+  therefore land at the right edge of the primary key and of every index that
+  references it, instead of at a random page.
+- `legacy`: the last 8 hex characters of a uuid4, as issued before ULIDs.
+
+Both kinds of id fit the `orders.id` column, so legacy rows stay valid. They
+can be given time-ordered ids with `python -m common.ids rekey`.
+
+ULIDs are text on the wire and in MySQL. `ulid_to_bytes` and
+`ulid_from_bytes` give their 16-byte form, which only
+benchmarks/order_id_inserts.py uses to compare against BINARY(16) keys; no
+table stores it.
+"""
+
+import argparse
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+
+from common.db import ConnectionPool, db_config_from_env
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
+ORDER_ID_SCHEME = os.getenv("ORDER_ID_SCHEME", "ulid")
+REKEY_BATCH_SIZE = int(os.getenv("REKEY_BATCH_SIZE", "500"))
+
+# Crockford's base32, which ULIDs use; it sorts in the same order as the bytes
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CROCKFORD_VALUES = {char: value for value, char in enumerate(CROCKFORD_ALPHABET)}
+
+ULID_LENGTH = 26
+TIMESTAMP_BITS = 48
+RANDOM_BITS = 80
+MAX_RANDOM = (1 << RANDOM_BITS) - 1
+
+# Tables holding orders: live ones and those moved out by the archiver
+ORDER_TABLES = ["orders", "orders_history"]
+# Tables whose order_id column references the id of an order
+ORDER_ID_REFERENCES = [
+    "order_items",
+    "deliveries",
+    "order_events",
+    "delivery_view",
+    "dispatch_queue",
+    "stock_reservations",
+    "stock_reservation_items",
+    "order_items_history",
+    "deliveries_history",
+]
+
+
+def encode_ulid(value):
+    """Encode a 128-bit integer as a 26-character ULID."""
+    chars = []
+    for _ in range(ULID_LENGTH):
+        chars.append(CROCKFORD_ALPHABET[value & 0x1F])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def decode_ulid(ulid):
+    """Decode a ULID into its 128-bit integer value."""
+    if len(ulid) != ULID_LENGTH:
+        raise ValueError(f"Invalid ULID length: {ulid!r}")
+    value = 0
+    try:
+        for char in ulid.upper():
+            value = (value << 5) | CROCKFORD_VALUES[char]
+    except KeyError:
+        raise ValueError(f"Invalid ULID character in {ulid!r}")
+    if value >> 128:
+        raise ValueError(f"ULID out of range: {ulid!r}")
+    return value
+
+
+def ulid_to_bytes(ulid):
+    """Binary (BINARY(16)) form of a ULID; byte order matches string order."""
+    return decode_ulid(ulid).to_bytes(16, "big")
+
+
+def ulid_from_bytes(data):
+    """ULID string of a BINARY(16) value."""
+    return encode_ulid(int.from_bytes(data, "big"))
+
+
+def ulid_timestamp(ulid):
+    """Creation time of a ULID in milliseconds since the epoch."""
+    return decode_ulid(ulid) >> RANDOM_BITS
+
+
+def ulid_at(timestamp_ms):
+    """ULID for the given time with fresh random bits."""
+    return encode_ulid((timestamp_ms << RANDOM_BITS) | secrets.randbits(RANDOM_BITS))
+
+
+class UlidGenerator:
+    """Thread-safe generator of strictly increasing ULIDs."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_timestamp = -1
+        self._last_random = 0
+
+    def __call__(self):
+        with self._lock:
+            timestamp = int(self._clock() * 1000)
+            if timestamp > self._last_timestamp:
+                self._last_timestamp = timestamp
+                self._last_random = secrets.randbits(RANDOM_BITS)
+            elif self._last_random < MAX_RANDOM:
+                # Same millisecond, or the clock stepped back: stay ordered
+                self._last_random += 1
+            else:
+                self._last_timestamp += 1
+                self._last_random = secrets.randbits(RANDOM_BITS)
+            if self._last_timestamp >> TIMESTAMP_BITS:
+                raise ValueError("ULID timestamp overflow")
+            return encode_ulid((self._last_timestamp << RANDOM_BITS) | self._last_random)
+
+
+def legacy_order_id():
+    """Random 8 hex character id, the scheme used before ULIDs."""
+    return uuid.uuid4().hex[-8:]
+
+
+def order_id_generator(scheme=ORDER_ID_SCHEME):
+    """
+    Return the order id generator for `scheme`.
+
+    Args:
+        scheme (str): 'ulid' or 'legacy'
+
+    Returns:
+        callable: Generator returning a new id on every call
+    """
+    if scheme == "ulid":
+        return UlidGenerator()
+    if scheme == "legacy":
+        return legacy_order_id
+    raise ValueError(f"Unknown order id scheme: {scheme}")
+
+
+def rekey_legacy_orders(pool, batch_size=REKEY_BATCH_SIZE):
+    """
+    Give every order that does not have a ULID yet a ULID derived from its order_time.
+
+    Live and archived orders are walked once each in primary key order, one
+    batch after the last id seen, so no batch scans the rows before it. The
+    legacy orders of a batch are rewritten in one transaction together with
+    the rows that reference them; new ULIDs that sort after the position are
+    skipped when reached. Run it while no simulation is in flight: tasks
+    already queued for an old id will not find their order anymore.
+
+    Returns:
+        int: Number of orders rekeyed
+    """
+    rekeyed = 0
+    with pool.connection() as conn:
+        with conn.cursor() as cursor:
+            # The child rows are moved before their order row
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            try:
+                for orders_table in ORDER_TABLES:
+                    last_id = ""
+                    while True:
+                        cursor.execute(
+                            f"SELECT id, order_time FROM {orders_table} WHERE id > %s"
+                            " ORDER BY id LIMIT %s",
+                            (last_id, batch_size),
+                        )
+                        rows = cursor.fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1][0]
+                        mapping = [
+                            (ulid_at(int(order_time.timestamp() * 1000)), old_id)
+                            for old_id, order_time in rows
+                            if len(old_id) != ULID_LENGTH
+                        ]
+                        if mapping:
+                            for table in ORDER_ID_REFERENCES:
+                                cursor.executemany(
+                                    f"UPDATE {table} SET order_id = %s WHERE order_id = %s",
+                                    mapping,
+                                )
+                            cursor.executemany(
+                                f"UPDATE {orders_table} SET id = %s WHERE id = %s", mapping
+                            )
+                            rekeyed += len(mapping)
+                            logger.info(f"Rekeyed {rekeyed} orders")
+                        conn.commit()
+            finally:
+                cursor.execute("SET SESSION foreign_key_checks = 1")
+    return rekeyed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order id maintenance")
+    parser.add_argument("command", choices=["rekey"], help="rekey: move legacy orders to ULIDs")
+    parser.add_argument("--batch-size", type=int, default=REKEY_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    pool = ConnectionPool(db_config_from_env(), pool_size=1)
+    rekeyed = rekey_legacy_orders(pool, args.batch_size)
+    if rekeyed:
+        TableVersions(redis_from_env()).bump("orders", "deliveries")
+    logger.info(f"Rekeyed orders: {rekeyed or 'none pending'}")
+
+
+if __name__ == "__main__":
+    main()
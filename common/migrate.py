@@ -0,0 +1,270 @@
+"""
+Versioned schema migrations.
+
+Migrations are the numbered SQL files in `common/migrations`
+(`0001_hot_path_indexes.sql`, ...). Every service applies the pending ones at
+startup; a MySQL advisory lock makes sure only one replica runs them while the
+others wait. Applied versions are recorded in the `schema_migrations` table.
+
+Run by hand, or as a one-shot container, with:
+    python -m common.migrate            # apply pending migrations
+    python -m common.migrate --check    # EXPLAIN the hot queries
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+MIGRATION_LOCK = "food_delivery.schema_migrations"
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "300"))
+# How long to wait for the database to accept connections at startup
+MIGRATION_WAIT_TIMEOUT = float(os.getenv("MIGRATION_WAIT_TIMEOUT", "60"))
+
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# Queries behind the list endpoints, as (name, SQL, params). None of them may
+# be answered with a full table scan.
+HOT_QUERIES = [
+    (
+        "get_all_orders(active)",
+        "SELECT * FROM orders WHERE order_status = %s ORDER BY order_time, id LIMIT 100",
+        ("active",),
+    ),
+    (
+        "get_all_orders(completed)",
+        "SELECT * FROM orders WHERE order_status = %s ORDER BY order_time, id LIMIT 100",
+        ("completed",),
+    ),
+    (
+        "get_all_orders(page)",
+        "SELECT * FROM orders WHERE (order_time > %s OR (order_time = %s AND id > %s))"
+        " ORDER BY order_time, id LIMIT 100",
+        ("2024-01-01 00:00:00", "2024-01-01 00:00:00", ""),
+    ),
+    (
+        "get_all_orders(customer)",
+        "SELECT * FROM orders WHERE customer_name = %s ORDER BY order_time, id LIMIT 100",
+        ("",),
+    ),
+    (
+        "get_all_orders(include_history)",
+        "SELECT * FROM orders_history WHERE order_status = %s ORDER BY order_time, id LIMIT 100",
+        ("completed",),
+    ),
+    (
+        "order archiver",
+        "SELECT id FROM orders WHERE order_status IN (%s, %s) AND order_time < %s"
+        " ORDER BY order_time, id LIMIT 500",
+        ("completed", "cancelled", "2024-01-01 00:00:00"),
+    ),
+    (
+        "get_delivery_personnel(idle)",
+        "SELECT * FROM delivery_persons WHERE person_status = %s",
+        ("idle",),
+    ),
+    (
+        "get_delivery_personnel(en_route)",
+        "SELECT * FROM delivery_persons WHERE person_status = %s",
+        ("en_route",),
+    ),
+    (
+        "deliveries by order",
+        "SELECT id, delivery_person_id FROM deliveries WHERE order_id = %s",
+        ("",),
+    ),
+    (
+        "get_list_of_deliveries(active)",
+        "SELECT * FROM delivery_view WHERE order_status = %s"
+        " ORDER BY order_time, order_id LIMIT 100",
+        ("active",),
+    ),
+    (
+        "get_list_of_deliveries(page)",
+        "SELECT * FROM delivery_view WHERE (order_time > %s OR (order_time = %s AND order_id > %s))"
+        " ORDER BY order_time, order_id LIMIT 100",
+        ("2024-01-01 00:00:00", "2024-01-01 00:00:00", ""),
+    ),
+    (
+        "get_list_of_deliveries(delivery person)",
+        "SELECT * FROM delivery_view WHERE delivery_person_id = %s"
+        " ORDER BY order_time, order_id LIMIT 100",
+        (0,),
+    ),
+    (
+        "delivery view rows of an order",
+        "SELECT id FROM delivery_view WHERE order_id = %s",
+        ("",),
+    ),
+    (
+        "dispatch queue head",
+        "SELECT id, order_id, customer_distance, enqueued_at FROM dispatch_queue"
+        " ORDER BY priority DESC, id LIMIT 1",
+        (),
+    ),
+    (
+        "last delivery of a delivery person",
+        "SELECT dropoff_x, dropoff_y FROM deliveries WHERE delivery_person_id = %s"
+        " ORDER BY id DESC LIMIT 1",
+        (0,),
+    ),
+    (
+        "stock reservation reaper",
+        "SELECT order_id FROM stock_reservations WHERE state = %s AND expires_at < %s"
+        " ORDER BY expires_at LIMIT 500",
+        ("held", "2024-01-01 00:00:00"),
+    ),
+    (
+        "stock shards of items",
+        "SELECT item_id, shard, quantity, held, version FROM stock_shards"
+        " WHERE item_id IN (%s) ORDER BY item_id, shard",
+        (0,),
+    ),
+    (
+        "dispatch queue expiry",
+        "SELECT id, order_id FROM dispatch_queue WHERE enqueued_at < %s ORDER BY id",
+        ("2024-01-01 00:00:00",),
+    ),
+]
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Return the available migrations as sorted (version, name, path) tuples."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(
+                (int(match.group(1)), match.group(2), os.path.join(directory, filename))
+            )
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a migration file into statements, dropping `--` comment lines."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def wait_for_connection(pool, timeout=MIGRATION_WAIT_TIMEOUT):
+    """Check out a connection, retrying while the database is still starting."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.acquire()
+        except (MySQLError, PoolTimeoutError) as e:
+            if time.monotonic() >= deadline:
+                raise
+            logger.warning(f"Database not ready for migrations, retrying: {str(e)}")
+            time.sleep(2)
+
+
+def apply_migrations(pool, directory=MIGRATIONS_DIR):
+    """
+    Apply every migration that is not yet recorded in `schema_migrations`.
+
+    Args:
+        pool (ConnectionPool): Pool to borrow the migration connection from
+        directory (str): Directory holding the numbered SQL files
+
+    Returns:
+        list: Versions applied by this call
+    """
+    conn = wait_for_connection(pool)
+    applied_now = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT)
+            )
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+            try:
+                cursor.execute(
+                    """CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    )"""
+                )
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+
+                for version, name, path in load_migrations(directory):
+                    if version in applied:
+                        continue
+                    logger.info(f"Applying migration {version:04d}_{name}")
+                    with open(path) as f:
+                        for statement in split_statements(f.read()):
+                            cursor.execute(statement)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name),
+                    )
+                    conn.commit()
+                    applied_now.append(version)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+                cursor.fetchone()
+    except BaseException:
+        pool.release(conn, discard=True)
+        raise
+    pool.release(conn)
+    return applied_now
+
+
+def check_query_plans(pool, queries=HOT_QUERIES):
+    """
+    EXPLAIN each hot query and collect the ones that need a full table scan.
+
+    Returns:
+        list: (query name, table) pairs whose plan has access type ALL
+    """
+    full_scans = []
+    with pool.connection() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            for name, query, params in queries:
+                cursor.execute("EXPLAIN " + query, params)
+                for row in cursor.fetchall():
+                    if row["type"] == "ALL":
+                        full_scans.append((name, row["table"]))
+    return full_scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or check schema migrations")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="EXPLAIN the hot queries and fail on any full table scan",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    pool = ConnectionPool(db_config_from_env(), pool_size=1)
+    applied = apply_migrations(pool)
+    logger.info(f"Applied migrations: {applied or 'none pending'}")
+
+    if args.check:
+        full_scans = check_query_plans(pool)
+        for name, table in full_scans:
+            logger.error(f"{name} scans the whole {table} table")
+        if full_scans:
+            sys.exit(1)
+        logger.info("All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+-- Secondary indexes for the query shapes of the list endpoints.
+
+-- get_all_orders: status-filtered pages ordered by (order_time, id)
+CREATE INDEX idx_orders_status_time ON orders (order_status, order_time, id);
+
+-- get_all_orders: unfiltered and time-range pages
+CREATE INDEX idx_orders_time ON orders (order_time, id);
+
+-- get_all_orders: pages of a single customer
+CREATE INDEX idx_orders_customer_time ON orders (customer_name, order_time, id);
+
+-- get_delivery_personnel: idle / en_route lookups
+CREATE INDEX idx_delivery_persons_status ON delivery_persons (person_status, id);
+
+-- get_list_of_deliveries and fetch_delivery: deliveries of an order, with the
+-- courier id needed for the join covered by the index
+CREATE INDEX idx_deliveries_order ON deliveries (order_id, delivery_person_id);
@@ -0,0 +1,9 @@
+-- Transactional outbox: Celery tasks are written in the same transaction as
+-- the rows they refer to and published to the broker by the relay (`python -m common.outbox`).
+CREATE TABLE task_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    task_id VARCHAR(36) NOT NULL,
+    task_name VARCHAR(255) NOT NULL,
+    task_args JSON NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
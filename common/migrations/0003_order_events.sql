@@ -0,0 +1,10 @@
+-- Transition history of every order, written by the order write paths and
+-- the batched /order_events endpoint.
+CREATE TABLE order_events (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    order_id VARCHAR(50) NOT NULL,
+    order_status VARCHAR(50),
+    message TEXT,
+    event_time DATETIME NOT NULL,
+    INDEX idx_order_events_order (order_id, id)
+);
@@ -0,0 +1,11 @@
+-- Order ids are ULIDs (26 characters) or legacy 8 character hex ids. Store them
+-- as single-byte ASCII with a binary collation so the keys in orders and in
+-- every referencing index are compact and compare bytewise.
+-- Foreign key checks are off so the referencing columns can change type
+-- together with orders.id.
+SET SESSION foreign_key_checks = 0;
+ALTER TABLE orders MODIFY id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+ALTER TABLE order_items MODIFY order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin;
+ALTER TABLE deliveries MODIFY order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin;
+ALTER TABLE order_events MODIFY order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+SET SESSION foreign_key_checks = 1;
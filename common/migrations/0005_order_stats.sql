@@ -0,0 +1,42 @@
+-- Statistics behind GET /orders/stats, maintained by the order write paths in
+-- the same transaction as the orders themselves (see common/order_stats.py)
+CREATE TABLE order_status_counts (
+    order_status VARCHAR(50) PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE order_minute_stats (
+    minute DATETIME PRIMARY KEY,
+    created INT NOT NULL DEFAULT 0,
+    completed INT NOT NULL DEFAULT 0,
+    cancelled INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE order_delivery_time_histogram (
+    bucket INT PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    total_seconds BIGINT NOT NULL DEFAULT 0
+);
+
+-- Backfill from the existing orders. Cancellations carry no timestamp, so
+-- only those made from now on show up in the per-minute rollups.
+INSERT INTO order_status_counts (order_status, order_count)
+SELECT order_status, COUNT(*) FROM orders GROUP BY order_status;
+
+INSERT INTO order_minute_stats (minute, created)
+SELECT DATE_FORMAT(order_time, '%Y-%m-%d %H:%i:00') AS m, COUNT(*)
+FROM orders GROUP BY m;
+
+INSERT INTO order_minute_stats (minute, completed)
+SELECT DATE_FORMAT(delivered_at, '%Y-%m-%d %H:%i:00') AS m, COUNT(*)
+FROM orders WHERE order_status = 'completed' AND delivered_at IS NOT NULL GROUP BY m
+ON DUPLICATE KEY UPDATE completed = VALUES(completed);
+
+-- Buckets grow by 5%: FLOOR(LN(seconds + 1) / LN(1.05)), as in duration_bucket()
+INSERT INTO order_delivery_time_histogram (bucket, order_count, total_seconds)
+SELECT FLOOR(LN(d.seconds + 1) / LN(1.05)) AS b, COUNT(*), SUM(d.seconds)
+FROM (
+    SELECT GREATEST(TIMESTAMPDIFF(SECOND, order_time, delivered_at), 0) AS seconds
+    FROM orders WHERE order_status = 'completed' AND delivered_at IS NOT NULL
+) d
+GROUP BY b;
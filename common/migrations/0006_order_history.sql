@@ -0,0 +1,9 @@
+-- Cold copies of orders, order_items and deliveries. The archiver
+-- (python -m common.archive) moves completed and cancelled orders out of the
+-- live tables once they are older than ARCHIVE_RETENTION_DAYS.
+-- CREATE TABLE ... LIKE keeps the columns and indexes but no foreign keys, so
+-- any later migration that changes a live table must change its history copy
+-- the same way.
+CREATE TABLE orders_history LIKE orders;
+CREATE TABLE order_items_history LIKE order_items;
+CREATE TABLE deliveries_history LIKE deliveries;
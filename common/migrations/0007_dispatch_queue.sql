@@ -0,0 +1,28 @@
+-- Orders waiting for a delivery person (see POST /dispatch/claim). A courier
+-- who becomes idle takes the next entry, highest priority first and then in
+-- arrival order, instead of the order polling for a free courier.
+CREATE TABLE dispatch_queue (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    customer_distance DECIMAL(20, 2) NOT NULL,
+    priority INT NOT NULL DEFAULT 0,
+    enqueued_at DATETIME(3) NOT NULL,
+    UNIQUE KEY uq_dispatch_queue_order (order_id),
+    INDEX idx_dispatch_queue_next (priority DESC, id),
+    INDEX idx_dispatch_queue_enqueued_at (enqueued_at)
+);
+
+-- Single row locked by every transaction that adds to or takes from the
+-- queue, so an order is never queued while a courier goes idle unseen
+CREATE TABLE dispatch_mutex (
+    id TINYINT PRIMARY KEY
+);
+INSERT INTO dispatch_mutex (id) VALUES (1);
+
+-- Time from claim to assignment in milliseconds, 5% wide buckets as in
+-- common.order_stats.duration_bucket()
+CREATE TABLE dispatch_wait_histogram (
+    bucket INT PRIMARY KEY,
+    order_count BIGINT NOT NULL DEFAULT 0,
+    total_ms BIGINT NOT NULL DEFAULT 0
+);
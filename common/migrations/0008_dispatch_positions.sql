@@ -0,0 +1,21 @@
+-- Positions for dispatch, in km east (x) and north (y) of the kitchen (see
+-- common/dispatch.py). Delivery persons start at the kitchen; once idle they
+-- ride back to it from the drop-off point of their last delivery, kept in
+-- position_x/position_y, since idle_since (NULL while en_route).
+-- deliveries_history must keep the columns of deliveries (migration 0006).
+ALTER TABLE delivery_persons
+    ADD COLUMN position_x DOUBLE NOT NULL DEFAULT 0,
+    ADD COLUMN position_y DOUBLE NOT NULL DEFAULT 0,
+    ADD COLUMN idle_since DATETIME(3) NULL;
+
+ALTER TABLE deliveries
+    ADD COLUMN dropoff_x DOUBLE NULL,
+    ADD COLUMN dropoff_y DOUBLE NULL;
+
+ALTER TABLE deliveries_history
+    ADD COLUMN dropoff_x DOUBLE NULL,
+    ADD COLUMN dropoff_y DOUBLE NULL;
+
+ALTER TABLE dispatch_queue
+    ADD COLUMN dropoff_x DOUBLE NOT NULL DEFAULT 0,
+    ADD COLUMN dropoff_y DOUBLE NOT NULL DEFAULT 0;
@@ -0,0 +1,34 @@
+-- One row per live delivery with the order and delivery person columns of
+-- the Delivery model, maintained by the writes (see common/delivery_view.py)
+-- so delivery reads don't join. Archived deliveries have no rows.
+CREATE TABLE delivery_view (
+    id INT PRIMARY KEY,
+    order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin NULL,
+    order_status VARCHAR(50) NULL,
+    order_time DATETIME NULL,
+    customer_name VARCHAR(255) NULL,
+    customer_distance DECIMAL(20, 2) NULL,
+    delivery_person_id INT NOT NULL,
+    delivery_person_name VARCHAR(255) NULL,
+    delivered_at DATETIME NULL,
+    dropoff_x DOUBLE NULL,
+    dropoff_y DOUBLE NULL,
+    -- record_order_statuses and the archiver: rows of an order
+    INDEX idx_delivery_view_order (order_id),
+    -- get_list_of_deliveries: status-filtered, unfiltered and per delivery
+    -- person pages ordered by (order_time, order_id)
+    INDEX idx_delivery_view_status_time (order_status, order_time, order_id),
+    INDEX idx_delivery_view_time (order_time, order_id),
+    INDEX idx_delivery_view_person_time (delivery_person_id, order_time, order_id)
+);
+
+INSERT INTO delivery_view (
+    id, order_id, order_status, order_time, customer_name, customer_distance,
+    delivery_person_id, delivery_person_name, delivered_at, dropoff_x, dropoff_y
+)
+SELECT
+    dl.id, dl.order_id, o.order_status, o.order_time, o.customer_name, o.customer_distance,
+    dl.delivery_person_id, dp.name, o.delivered_at, dl.dropoff_x, dl.dropoff_y
+FROM deliveries dl
+LEFT JOIN orders o ON o.id = dl.order_id
+LEFT JOIN delivery_persons dp ON dp.id = dl.delivery_person_id;
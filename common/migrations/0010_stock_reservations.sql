@@ -0,0 +1,21 @@
+-- Units held for orders that are not finished yet; quantity - held is what
+-- new orders can still take (see common/reservations.py)
+ALTER TABLE stock ADD COLUMN held INT NOT NULL DEFAULT 0;
+
+-- One hold per order: 'held' until the order is completed ('committed'),
+-- cancelled or past expires_at ('released')
+CREATE TABLE stock_reservations (
+    order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin PRIMARY KEY,
+    state VARCHAR(16) NOT NULL,
+    expires_at DATETIME(3) NOT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    -- reaper: expired holds
+    INDEX idx_stock_reservations_expiry (state, expires_at)
+);
+
+CREATE TABLE stock_reservation_items (
+    order_id VARCHAR(26) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+    item_id INT NOT NULL,
+    quantity INT NOT NULL,
+    PRIMARY KEY (order_id, item_id)
+);
@@ -0,0 +1,3 @@
+-- Incremented by every write to a stock row, so in-process snapshots of the
+-- table (see common/stock_snapshot.py) never replace a row with an older copy
+ALTER TABLE stock ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,22 @@
+-- Number of stock_shards rows that receive the free units of a hot item; 0
+-- keeps all of its stock on the stock row (see common/stock_shards.py)
+ALTER TABLE stock ADD COLUMN shards INT NOT NULL DEFAULT 0;
+
+-- Sub-rows of a hot item's stock: each is an independent counter with the
+-- same meaning as the stock row's quantity / held / version, and the item's
+-- totals are the stock row plus all of its shards
+CREATE TABLE stock_shards (
+    item_id INT NOT NULL,
+    shard INT NOT NULL,
+    quantity INT NOT NULL DEFAULT 0,
+    held INT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (item_id, shard)
+);
+
+-- The shard a line was held on, 0 for the stock row itself; a line of a hot
+-- item can be spread over several shards
+ALTER TABLE stock_reservation_items
+    ADD COLUMN shard INT NOT NULL DEFAULT 0,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (order_id, item_id, shard);
@@ -0,0 +1,188 @@
+"""
+Incrementally maintained order statistics.
+
+The order write paths call `record_created` and `record_transitions` with the
+cursor of their own transaction, so the statistics tables change together
+with the orders they describe:
+
+- `order_status_counts`: number of orders per status
+- `order_minute_stats`: orders created, completed and cancelled per minute
+- `order_delivery_time_histogram`: order_time to delivered_at durations in
+  buckets that are 5% wider than the previous one, with the sum of the
+  durations per bucket
+
+Reading the statistics touches one row per status, per requested minute and
+per histogram bucket, however many orders exist.
+"""
+
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+DURATION_BUCKET_GROWTH = 1.05
+
+
+def as_datetime(value):
+    """Accept both the ISO strings built by the service and MySQL datetimes."""
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def minute_of(value):
+    """Start of the minute a timestamp falls into."""
+    return as_datetime(value).replace(second=0, microsecond=0)
+
+
+def duration_bucket(duration):
+    """Histogram bucket of a non-negative duration; must match migrations 0005 and 0007."""
+    return int(math.log1p(max(duration, 0)) / math.log(DURATION_BUCKET_GROWTH))
+
+
+def record_created(cursor, order_times, order_status="active"):
+    """
+    Count newly inserted orders as part of the caller's transaction.
+
+    Args:
+        cursor: Cursor of the open transaction
+        order_times (list): order_time of every inserted order
+        order_status (str): Status the orders were inserted with
+    """
+    if not order_times:
+        return
+    cursor.execute(
+        "INSERT INTO order_status_counts (order_status, order_count) VALUES (%s, %s)"
+        " ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count)",
+        (order_status, len(order_times)),
+    )
+    per_minute = sorted(Counter(minute_of(t) for t in order_times).items())
+    cursor.execute(
+        "INSERT INTO order_minute_stats (minute, created) VALUES "
+        + ", ".join(["(%s, %s)"] * len(per_minute))
+        + " ON DUPLICATE KEY UPDATE created = created + VALUES(created)",
+        tuple(value for row in per_minute for value in row),
+    )
+
+
+def record_transitions(cursor, transitions):
+    """
+    Count status changes as part of the caller's transaction.
+
+    Args:
+        cursor: Cursor of the open transaction
+        transitions (list): (old_status, new_status, order_time, changed_at)
+            tuples, read from the order rows locked by the caller
+    """
+    status_deltas = Counter()
+    per_minute = defaultdict(Counter)
+    histogram = defaultdict(lambda: [0, 0])
+    for old_status, new_status, order_time, changed_at in transitions:
+        if old_status == new_status:
+            continue
+        status_deltas[old_status] -= 1
+        status_deltas[new_status] += 1
+        if new_status in ("completed", "cancelled"):
+            per_minute[minute_of(changed_at)][new_status] += 1
+        if new_status == "completed":
+            seconds = max(
+                int((as_datetime(changed_at) - as_datetime(order_time)).total_seconds()), 0
+            )
+            bucket = histogram[duration_bucket(seconds)]
+            bucket[0] += 1
+            bucket[1] += seconds
+
+    # Rows are always locked in key order so concurrent writers can't deadlock
+    deltas = sorted((s, d) for s, d in status_deltas.items() if d)
+    if deltas:
+        cursor.execute(
+            "INSERT INTO order_status_counts (order_status, order_count) VALUES "
+            + ", ".join(["(%s, %s)"] * len(deltas))
+            + " ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count)",
+            tuple(value for row in deltas for value in row),
+        )
+    if per_minute:
+        rows = sorted(per_minute.items())
+        cursor.execute(
+            "INSERT INTO order_minute_stats (minute, completed, cancelled) VALUES "
+            + ", ".join(["(%s, %s, %s)"] * len(rows))
+            + " ON DUPLICATE KEY UPDATE completed = completed + VALUES(completed),"
+            " cancelled = cancelled + VALUES(cancelled)",
+            tuple(
+                value
+                for minute, counts in rows
+                for value in (minute, counts["completed"], counts["cancelled"])
+            ),
+        )
+    if histogram:
+        rows = sorted(histogram.items())
+        cursor.execute(
+            "INSERT INTO order_delivery_time_histogram (bucket, order_count, total_seconds) VALUES "
+            + ", ".join(["(%s, %s, %s)"] * len(rows))
+            + " ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count),"
+            " total_seconds = total_seconds + VALUES(total_seconds)",
+            tuple(value for bucket, (count, total) in rows for value in (bucket, count, total)),
+        )
+
+
+def histogram_percentile(buckets, total, pct):
+    """
+    Approximate percentile of a duration histogram.
+
+    Args:
+        buckets (list): (bucket, order_count, total_duration) sorted by bucket
+        total (int): Sum of order_count over all buckets
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: Mean duration of the bucket holding the percentile, in the
+            unit of total_duration
+    """
+    rank = pct / 100 * total
+    seen = 0
+    for _, count, duration in buckets:
+        seen += count
+        if count and seen >= rank:
+            return round(duration / count, 1)
+    return None
+
+
+def load_stats(cursor, minutes=60, now=None):
+    """
+    Read the statistics of the last `minutes` minutes.
+
+    Returns:
+        dict: Counts per status, per-minute rollups and delivery time summary
+    """
+    cursor.execute("SELECT order_status, order_count FROM order_status_counts")
+    counts = {order_status: int(count) for order_status, count in cursor.fetchall()}
+
+    since = minute_of(now or datetime.now()) - timedelta(minutes=minutes - 1)
+    cursor.execute(
+        "SELECT minute, created, completed, cancelled FROM order_minute_stats"
+        " WHERE minute >= %s ORDER BY minute",
+        (since,),
+    )
+    per_minute = [
+        {"minute": minute, "created": created, "completed": completed, "cancelled": cancelled}
+        for minute, created, completed, cancelled in cursor.fetchall()
+    ]
+
+    cursor.execute(
+        "SELECT bucket, order_count, total_seconds FROM order_delivery_time_histogram"
+        " ORDER BY bucket"
+    )
+    buckets = [(bucket, int(count), int(seconds)) for bucket, count, seconds in cursor.fetchall()]
+    delivered = sum(count for _, count, _ in buckets)
+    total_seconds = sum(seconds for _, _, seconds in buckets)
+
+    return {
+        "counts": counts,
+        "total": sum(counts.values()),
+        "minutes": minutes,
+        "orders_per_minute": round(sum(row["created"] for row in per_minute) / minutes, 2),
+        "per_minute": per_minute,
+        "delivery_time": {
+            "delivered": delivered,
+            "mean_seconds": round(total_seconds / delivered, 1) if delivered else None,
+            "p50_seconds": histogram_percentile(buckets, delivered, 50),
+            "p95_seconds": histogram_percentile(buckets, delivered, 95),
+        },
+    }
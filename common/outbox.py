@@ -0,0 +1,132 @@
+"""
+Transactional outbox for Celery tasks.
+
+Services call `enqueue_task` with the cursor of the transaction that writes
+the rows a task refers to, so the task exists if and only if that
+transaction commits. The relay (`python -m common.outbox`) drains the
+`task_outbox` table to the broker in batches.
+
+Delivery is at-least-once: a relay that dies after publishing but before
+deleting a batch publishes it again on restart, with the same task ids.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+
+from celery import Celery
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.migrate import apply_migrations
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# Seconds to wait before polling again once the outbox has been drained
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "0.5"))
+OUTBOX_RELAY_LOCK = "food_delivery.task_outbox_relay"
+
+
+def enqueue_task(cursor, task_name, args):
+    """
+    Record a task in the outbox as part of the caller's transaction.
+
+    Args:
+        cursor: Cursor of the open transaction
+        task_name (str): Registered Celery task name
+        args (list): JSON-serializable task arguments
+
+    Returns:
+        str: Id the task will carry once published
+    """
+    task_id = str(uuid.uuid4())
+    cursor.execute(
+        "INSERT INTO task_outbox (task_id, task_name, task_args) VALUES (%s, %s, %s)",
+        (task_id, task_name, json.dumps(args)),
+    )
+    return task_id
+
+
+def relay_batch(conn, celery, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Publish the oldest outbox entries and remove them from the table.
+
+    All tasks of a batch are sent over one broker connection.
+
+    Returns:
+        int: Number of tasks published
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, task_id, task_name, task_args FROM task_outbox ORDER BY id LIMIT %s",
+            (batch_size,),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        with celery.producer_or_acquire() as producer:
+            for _, task_id, task_name, task_args in rows:
+                celery.send_task(
+                    task_name,
+                    args=json.loads(task_args),
+                    task_id=task_id,
+                    producer=producer,
+                )
+
+        placeholders = ", ".join(["%s"] * len(rows))
+        cursor.execute(
+            f"DELETE FROM task_outbox WHERE id IN ({placeholders})",
+            tuple(row[0] for row in rows),
+        )
+        conn.commit()
+        return len(rows)
+
+
+def run_relay(pool, celery, batch_size=OUTBOX_BATCH_SIZE, flush_interval=OUTBOX_FLUSH_INTERVAL):
+    """Drain the outbox forever; only the replica holding the relay lock publishes."""
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = pool.acquire()
+                with conn.cursor() as cursor:
+                    # Blocks until any other relay replica goes away
+                    cursor.execute("SELECT GET_LOCK(%s, -1)", (OUTBOX_RELAY_LOCK,))
+                    cursor.fetchone()
+                logger.info("Acquired outbox relay lock")
+
+            published = relay_batch(conn, celery, batch_size)
+            if published:
+                logger.info(f"Published {published} tasks from the outbox")
+            if published < batch_size:
+                time.sleep(flush_interval)
+        except (MySQLError, PoolTimeoutError) as e:
+            logger.error(f"Outbox relay database error: {str(e)}")
+            if conn is not None:
+                pool.release(conn, discard=True)
+                conn = None
+            time.sleep(flush_interval)
+        except Exception as e:
+            # Broker unavailable; the batch stays in the outbox and is retried
+            logger.error(f"Outbox relay publish error: {str(e)}")
+            if conn is not None:
+                conn.rollback()
+            time.sleep(flush_interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    celery = Celery(
+        os.getenv("TASK_QUEUE_NAME"), broker=os.getenv("TASK_QUEUE_BROKER_URL")
+    )
+    pool = ConnectionPool(db_config_from_env(), pool_size=1)
+    apply_migrations(pool)
+    run_relay(pool, celery)
@@ -0,0 +1,63 @@
+import base64
+import json
+import os
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from mysql.connector.errors import Error as MySQLError
+
+# Upper bound for a single page of a keyset-paginated listing
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+# Rows pulled from the server cursor per round trip in streaming mode
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row of a page into an opaque cursor."""
+    payload = json.dumps(jsonable_encoder(list(values)), separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by `encode_cursor` into its `size` key values."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return values
+
+
+def stream_rows(get_db_connection, query, params):
+    """
+    Yield the rows of `query` as NDJSON lines while the server cursor produces them.
+
+    The connection is held for the lifetime of the stream and the result set
+    is read in batches of STREAM_BATCH_SIZE, so memory stays flat however many
+    rows match.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield json.dumps(jsonable_encoder(row)) + "\n"
+        finally:
+            # An abandoned stream leaves unread rows behind and closing the
+            # cursor refuses them; the rollback in pool release reads and drops
+            # them, and the connection goes back to the pool.
+            try:
+                cursor.close()
+            except MySQLError:
+                pass
@@ -0,0 +1,11 @@
+import os
+
+import redis
+
+# Redis database shared by the caches, counters and change feed of the services
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
+
+
+def redis_from_env():
+    """Build a Redis client for the service environment."""
+    return redis.Redis.from_url(REDIS_URL, decode_responses=True)
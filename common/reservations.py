@@ -0,0 +1,375 @@
+"""
+Stock reservations: an order holds its stock, then commits or releases it.
+
+`stock.held` (migration 0010) counts the units held for orders that are not
+finished, so `quantity - held` is what other orders can still take. A hold
+is all or nothing: one UPDATE adds every line to `held` only where that much
+is available, and `stock_reservations` / `stock_reservation_items` record
+what the order holds. Completing the order commits its hold (the units
+leave both `quantity` and `held`), cancelling it releases the hold (they
+leave `held` only). Only a held reservation changes state, so retried
+commits and releases are harmless. Hot items take their units from shard
+rows instead of the stock row (see common/stock_shards.py).
+
+A hold that is neither committed nor released within RESERVATION_TTL
+seconds belongs to an order the workers lost track of; the TTL must exceed
+the longest time an order can wait for dispatch and be delivered. The
+reaper (`python -m common.reservations`) releases expired holds in batches
+every RESERVATION_REAP_INTERVAL seconds. Only one replica reaps at a time.
+
+The available quantity of every item is also kept in the Redis hash
+`stock:available`, so availability checks don't query MySQL. The stock
+service applies each change once its transaction has committed, and the
+reaper rebuilds the hash from MySQL after every pass. The hash is only an
+estimate: holds are decided by the guarded UPDATE, so a drifted counter can
+make a check wrong until the next rebuild but can never oversell. The items
+whose holds the reaper released are announced to the stock snapshots of the
+stock service replicas (common/stock_snapshot.py).
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+
+import redis
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.migrate import apply_migrations
+from common.redis_store import redis_from_env
+from common.stock_shards import (
+    STOCK_TOTALS,
+    ShardsDrained,
+    line_totals,
+    pick_shards,
+    read_shards,
+    take_from_shards,
+    update_shards,
+)
+from common.stock_snapshot import publish_stock_changes
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", "7200"))
+RESERVATION_REAP_INTERVAL = float(os.getenv("RESERVATION_REAP_INTERVAL", "5"))
+RESERVATION_REAP_BATCH_SIZE = int(os.getenv("RESERVATION_REAP_BATCH_SIZE", "500"))
+RESERVATION_REAPER_LOCK = "food_delivery.reservation_reaper"
+
+HELD = "held"
+COMMITTED = "committed"
+RELEASED = "released"
+
+AVAILABLE_STOCK_QUERY = f"SELECT item_id, quantity - held FROM {STOCK_TOTALS}"
+
+# Add increments to the fields of an existing hash (KEYS: hash; ARGV: field,
+# increment pairs). A missing hash stays missing until it is rebuilt.
+ADD_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def quantity_case(quantities):
+    """
+    CASE expression giving the quantity of each item.
+
+    Args:
+        quantities (dict): Quantity per item id
+
+    Returns:
+        tuple: SQL fragment and its parameters
+    """
+    sql = "CASE item_id " + " ".join(["WHEN %s THEN %s"] * len(quantities)) + " END"
+    return sql, tuple(value for line in quantities.items() for value in line)
+
+
+def take_stock(cursor, requested, hold=False, sharded=(), lock_shards=False):
+    """
+    Take the requested quantity of every item, or of none.
+
+    One UPDATE changes only the rows with at least the requested quantity
+    available, locking them in item id order. With `hold` the quantities are
+    added to `held`, otherwise they are removed from `quantity`. Sharded
+    items are taken from their shards afterwards (see
+    common.stock_shards.take_from_shards).
+
+    Args:
+        cursor: Cursor of the open transaction
+        requested (dict): Positive quantity per item id, in item id order
+        sharded: Ids of the items with shards
+        lock_shards (bool): Lock every shard of the sharded items instead of
+            picking one per line without locks
+
+    Returns:
+        list: (item_id, shard, quantity) lines taken, shard 0 being the
+            stock row, or None if an item is short and the caller must roll
+            back
+
+    Raises:
+        ShardsDrained: A picked shard was drained; retry with lock_shards
+    """
+    plain = {item_id: quantity for item_id, quantity in requested.items() if item_id not in sharded}
+    hot = {item_id: quantity for item_id, quantity in requested.items() if item_id in sharded}
+    picked = None
+    if hot and not lock_shards:
+        # Picked before any lock is taken, so a miss costs a cheap retry
+        picked = pick_shards(read_shards(cursor, hot), hot)
+        if picked is None:
+            raise ShardsDrained(f"No single stock shard can serve items {list(hot)}")
+    lines = []
+    if plain:
+        case, case_params = quantity_case(plain)
+        placeholders = ", ".join(["%s"] * len(plain))
+        assignment = "held = held +" if hold else "quantity = quantity -"
+        cursor.execute(
+            f"UPDATE stock SET {assignment} {case}, version = version + 1"
+            f" WHERE item_id IN ({placeholders}) AND quantity - held >= {case}"
+            " ORDER BY item_id",
+            (*case_params, *plain, *case_params),
+        )
+        if cursor.rowcount != len(plain):
+            return None
+        lines = [(item_id, 0, quantity) for item_id, quantity in plain.items()]
+    if hot:
+        shard_lines = take_from_shards(cursor, hot, hold=hold, picked=picked)
+        if shard_lines is None:
+            return None
+        lines = sorted(lines + shard_lines)
+    return lines
+
+
+def end_holds(cursor, lines, commit=False):
+    """
+    Take held (item_id, shard, quantity) lines, in key order, off `held`, and
+    off `quantity` too when committing.
+    """
+    quantities = {item_id: quantity for item_id, shard, quantity in lines if shard == 0}
+    if quantities:
+        case, case_params = quantity_case(quantities)
+        placeholders = ", ".join(["%s"] * len(quantities))
+        assignments, params = f"held = held - {case}", case_params
+        if commit:
+            assignments, params = f"quantity = quantity - {case}, {assignments}", case_params * 2
+        cursor.execute(
+            f"UPDATE stock SET {assignments}, version = version + 1"
+            f" WHERE item_id IN ({placeholders}) ORDER BY item_id",
+            (*params, *quantities),
+        )
+    shard_lines = [line for line in lines if line[1] != 0]
+    if shard_lines:
+        assignments = "held = held - {case}"
+        if commit:
+            assignments = "quantity = quantity - {case}, " + assignments
+        update_shards(cursor, assignments, shard_lines)
+
+
+def hold_stock(cursor, order_id, requested, expires_at, sharded=(), lock_shards=False):
+    """
+    Hold the requested quantities for an order until `expires_at`.
+
+    Holding again for an order that already has a reservation changes
+    nothing, so a retried request cannot hold twice. `sharded` and
+    `lock_shards` are passed on to take_stock.
+
+    Returns:
+        str: State of the order's reservation, or None if the stock is not
+            available and the caller must roll back
+    """
+    cursor.execute(
+        "INSERT INTO stock_reservations (order_id, state, expires_at) VALUES (%s, %s, %s)"
+        " ON DUPLICATE KEY UPDATE order_id = order_id",
+        (order_id, HELD, expires_at),
+    )
+    if cursor.rowcount == 0:
+        cursor.execute("SELECT state FROM stock_reservations WHERE order_id = %s", (order_id,))
+        return cursor.fetchone()[0]
+    lines = take_stock(cursor, requested, hold=True, sharded=sharded, lock_shards=lock_shards)
+    if lines is None:
+        return None
+    cursor.execute(
+        "INSERT INTO stock_reservation_items (order_id, item_id, shard, quantity) VALUES "
+        + ", ".join(["(%s, %s, %s, %s)"] * len(lines)),
+        tuple(value for line in lines for value in (order_id, *line)),
+    )
+    return HELD
+
+
+def finish_reservation(cursor, order_id, state):
+    """
+    Commit or release the hold of an order.
+
+    Args:
+        cursor: Cursor of the open transaction
+        order_id (str): Order whose hold ends
+        state (str): COMMITTED or RELEASED
+
+    Returns:
+        tuple: State before the call (None without a reservation) and the
+            quantity per item whose hold ended, empty unless it was held
+    """
+    cursor.execute(
+        "SELECT state FROM stock_reservations WHERE order_id = %s FOR UPDATE", (order_id,)
+    )
+    row = cursor.fetchone()
+    if row is None or row[0] != HELD:
+        return (row[0] if row else None), {}
+    cursor.execute(
+        "SELECT item_id, shard, quantity FROM stock_reservation_items"
+        " WHERE order_id = %s ORDER BY item_id, shard",
+        (order_id,),
+    )
+    lines = cursor.fetchall()
+    end_holds(cursor, lines, commit=state == COMMITTED)
+    cursor.execute(
+        "UPDATE stock_reservations SET state = %s WHERE order_id = %s", (state, order_id)
+    )
+    return HELD, line_totals(lines)
+
+
+def reap_expired(conn, now=None, batch_size=RESERVATION_REAP_BATCH_SIZE):
+    """
+    Release one batch of expired holds in one transaction.
+
+    Holds being committed or released right now are locked and skipped.
+
+    Returns:
+        tuple: Order ids whose hold was released and the released quantity
+            per item
+    """
+    now = now or datetime.now()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT order_id FROM stock_reservations WHERE state = %s AND expires_at < %s"
+            " ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED",
+            (HELD, now, batch_size),
+        )
+        order_ids = [row[0] for row in cursor.fetchall()]
+        if not order_ids:
+            conn.rollback()
+            return [], {}
+
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        cursor.execute(
+            "SELECT item_id, shard, SUM(quantity) FROM stock_reservation_items"
+            f" WHERE order_id IN ({placeholders})"
+            " GROUP BY item_id, shard ORDER BY item_id, shard",
+            tuple(order_ids),
+        )
+        lines = [(item_id, shard, int(quantity)) for item_id, shard, quantity in cursor.fetchall()]
+        end_holds(cursor, lines)
+        cursor.execute(
+            f"UPDATE stock_reservations SET state = %s WHERE order_id IN ({placeholders})",
+            (RELEASED, *order_ids),
+        )
+        conn.commit()
+        return order_ids, line_totals(lines)
+
+
+class AvailableStock:
+    """Available quantity of each item, in a Redis hash."""
+
+    def __init__(self, redis_client, key="stock:available"):
+        self.redis = redis_client
+        self.key = key
+        self._add_if_exists = redis_client.register_script(ADD_IF_EXISTS)
+
+    def add(self, changes):
+        """
+        Apply the committed change of available quantities.
+
+        Args:
+            changes (dict): Change per item id, negative when stock was taken
+        """
+        changes = {item_id: change for item_id, change in changes.items() if change}
+        if not changes:
+            return
+        try:
+            self._add_if_exists(
+                keys=[self.key], args=[value for line in changes.items() for value in line]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update available stock of {list(changes)}: {str(e)}")
+
+    def rebuild(self, rows):
+        """Replace the hash with (item_id, available) rows read from MySQL."""
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(self.key)
+            if rows:
+                pipe.hset(self.key, mapping=dict(rows))
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to rebuild available stock: {str(e)}")
+
+    def get(self):
+        """Available quantity per item id, or None if the hash is not built."""
+        try:
+            fields = self.redis.hgetall(self.key)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read available stock: {str(e)}")
+            return None
+        if not fields:
+            return None
+        return {int(item_id): int(available) for item_id, available in fields.items()}
+
+
+def load_available(pool):
+    """Read the available quantity of every item from MySQL."""
+    with pool.borrow() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(AVAILABLE_STOCK_QUERY)
+            return cursor.fetchall()
+
+
+def run_reaper(
+    pool,
+    table_versions,
+    available_stock,
+    interval=RESERVATION_REAP_INTERVAL,
+    batch_size=RESERVATION_REAP_BATCH_SIZE,
+):
+    """Reap forever; only the replica holding the reaper lock releases holds."""
+    conn = None
+    while True:
+        try:
+            if conn is None:
+                conn = pool.acquire()
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT GET_LOCK(%s, -1)", (RESERVATION_REAPER_LOCK,))
+                    cursor.fetchone()
+                logger.info("Acquired reservation reaper lock")
+
+            while True:
+                order_ids, released = reap_expired(conn, batch_size=batch_size)
+                if order_ids:
+                    table_versions.bump("stock")
+                    publish_stock_changes(table_versions.redis, item_ids=released)
+                    logger.info(f"Released {len(order_ids)} expired stock reservations")
+                if len(order_ids) < batch_size:
+                    break
+            available_stock.rebuild(load_available(pool))
+        except (MySQLError, PoolTimeoutError) as e:
+            logger.error(f"Reservation reaper database error: {str(e)}")
+            if conn is not None:
+                pool.release(conn, discard=True)
+                conn = None
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # One connection holds the lock and reaps, the other reads the stock
+    pool = ConnectionPool(db_config_from_env(), pool_size=2)
+    apply_migrations(pool)
+    redis_client = redis_from_env()
+    run_reaper(pool, TableVersions(redis_client), AvailableStock(redis_client))
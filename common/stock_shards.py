@@ -0,0 +1,268 @@
+"""
+Sharded stock counters for hot items.
+
+Orders take stock with a guarded UPDATE of each item's `stock` row (see
+common/reservations.py). When a few items are in most orders, their
+concurrent transactions queue behind one InnoDB row lock per item. Such an
+item can be split into `stock.shards` rows of `stock_shards` (migration
+0012). Each row is an independent counter with its own quantity, held and
+version. A take picks one shard that has enough free units, so concurrent
+orders for the item mostly lock different rows. The item's totals are its
+stock row plus all of its shards, and STOCK_TOTALS sums them for readers.
+
+The fast path reads the free units of the shards without locking and updates
+the picked shard of each line with a guard. If no single shard can serve a
+line, or a picked shard was drained in between, ShardsDrained is raised. The
+caller rolls back and takes again with `lock_shards`, which locks every
+shard of the items and spreads each line over as many shards as needed (see
+with_locked_retry). Only that second attempt refuses an order. Writers lock
+stock rows before shard rows, each set with one statement in key order, so
+takes, holds, restocks and resharding never deadlock each other.
+
+Holds remember their shard in `stock_reservation_items`, so commits and
+releases update the rows they were taken from. Restocks spread the added
+units evenly over the item's shards. set_shards turns the mode on or off
+(0 shards) and changes the number of shards, moving the free units. Held
+units stay on their row until the hold ends. Shards beyond the new count are
+deleted once they hold nothing.
+"""
+
+import random
+
+# Per-item totals with the columns of `stock`, to select from like the table
+STOCK_TOTALS = (
+    "(SELECT stock.item_id, stock.item_name, stock.max_quantity, stock.shards,"
+    " CAST(stock.quantity + COALESCE(SUM(stock_shards.quantity), 0) AS SIGNED) AS quantity,"
+    " CAST(stock.held + COALESCE(SUM(stock_shards.held), 0) AS SIGNED) AS held,"
+    " CAST(stock.version + COALESCE(SUM(stock_shards.version), 0) AS SIGNED) AS version"
+    " FROM stock LEFT JOIN stock_shards USING (item_id) GROUP BY stock.item_id) AS stock_totals"
+)
+
+
+class ShardsDrained(Exception):
+    """No shard picked without locks could serve a line; take again with lock_shards."""
+
+
+def split_evenly(units, count):
+    """Split `units` into `count` shares that differ by at most one."""
+    return [units // count + (1 if i < units % count else 0) for i in range(count)]
+
+
+def line_totals(lines):
+    """Quantity per item id of (item_id, shard, quantity) lines."""
+    totals = {}
+    for item_id, _, quantity in lines:
+        totals[item_id] = totals.get(item_id, 0) + quantity
+    return totals
+
+
+def read_shards(cursor, item_ids, lock=False):
+    """
+    Read the shards of some items, in key order.
+
+    Args:
+        cursor: Cursor of the open transaction
+        item_ids: Item ids
+        lock (bool): Lock the rows; without it the read takes no locks
+
+    Returns:
+        dict: (quantity, held, version) per shard, per item id
+    """
+    item_ids = list(item_ids)
+    shards = {item_id: {} for item_id in item_ids}
+    if not item_ids:
+        return shards
+    placeholders = ", ".join(["%s"] * len(item_ids))
+    cursor.execute(
+        "SELECT item_id, shard, quantity, held, version FROM stock_shards"
+        f" WHERE item_id IN ({placeholders}) ORDER BY item_id, shard"
+        + (" FOR UPDATE" if lock else ""),
+        tuple(item_ids),
+    )
+    for item_id, shard, quantity, held, version in cursor.fetchall():
+        shards[item_id][shard] = (quantity, held, version)
+    return shards
+
+
+def pick_shards(shards, requested, rng=random):
+    """
+    Pick one random shard with enough free units for each line.
+
+    Returns:
+        list: (item_id, shard, quantity) lines in key order, or None if some
+            line fits in no single shard
+    """
+    lines = []
+    for item_id, quantity in requested.items():
+        candidates = [
+            shard
+            for shard, (on_hand, held, _) in shards[item_id].items()
+            if on_hand - held >= quantity
+        ]
+        if not candidates:
+            return None
+        lines.append((item_id, rng.choice(candidates), quantity))
+    return lines
+
+
+def spread_over_shards(shards, requested):
+    """
+    Take each line from the shards with the most free units first.
+
+    Returns:
+        list: (item_id, shard, quantity) lines in key order, or None if an
+            item does not have enough free units in all of its shards
+    """
+    lines = []
+    for item_id, quantity in requested.items():
+        free = {shard: on_hand - held for shard, (on_hand, held, _) in shards[item_id].items()}
+        taken = {}
+        for shard in sorted(free, key=lambda shard: -free[shard]):
+            if quantity == 0 or free[shard] <= 0:
+                break
+            taken[shard] = min(free[shard], quantity)
+            quantity -= taken[shard]
+        if quantity:
+            return None
+        lines.extend((item_id, shard, taken[shard]) for shard in sorted(taken))
+    return lines
+
+
+def update_shards(cursor, assignments, lines, guard=False):
+    """
+    Update one shard per line with one statement, locking rows in key order.
+
+    Args:
+        cursor: Cursor of the open transaction
+        assignments (str): SET clause, `{case}` standing for the quantity of
+            each line, e.g. "held = held + {case}"
+        lines (list): (item_id, shard, quantity) lines in key order
+        guard (bool): Only update shards with that quantity free
+
+    Returns:
+        int: Number of updated shards
+    """
+    case = "CASE " + " ".join(["WHEN item_id = %s AND shard = %s THEN %s"] * len(lines)) + " END"
+    case_params = tuple(value for line in lines for value in line)
+    keys = ", ".join(["(%s, %s)"] * len(lines))
+    key_params = tuple(value for item_id, shard, _ in lines for value in (item_id, shard))
+    cursor.execute(
+        f"UPDATE stock_shards SET {assignments.format(case=case)}, version = version + 1"
+        f" WHERE (item_id, shard) IN ({keys})"
+        + (f" AND quantity - held >= {case}" if guard else "")
+        + " ORDER BY item_id, shard",
+        (
+            *(case_params * assignments.count("{case}")),
+            *key_params,
+            *(case_params if guard else ()),
+        ),
+    )
+    return cursor.rowcount
+
+
+def take_from_shards(cursor, requested, hold=False, picked=None):
+    """
+    Take the requested quantities from the shards of hot items.
+
+    Args:
+        cursor: Cursor of the open transaction
+        requested (dict): Positive quantity per item id, in item id order
+        hold (bool): Add to `held` instead of removing from `quantity`
+        picked (list): Lines from pick_shards, updated with a guard; without
+            them every shard of the items is locked first
+
+    Returns:
+        list: (item_id, shard, quantity) lines taken, or None if an item is
+            short and the caller must roll back
+
+    Raises:
+        ShardsDrained: A picked shard no longer had the units
+    """
+    assignments = "held = held + {case}" if hold else "quantity = quantity - {case}"
+    if picked is not None:
+        if update_shards(cursor, assignments, picked, guard=True) < len(picked):
+            raise ShardsDrained(f"Stock shards of items {list(requested)} drained")
+        return picked
+    lines = spread_over_shards(read_shards(cursor, requested, lock=True), requested)
+    if lines is not None:
+        update_shards(cursor, assignments, lines)
+    return lines
+
+
+def with_locked_retry(conn, take):
+    """
+    Run `take(False)`, then `take(True)` in a new transaction if shards drained.
+
+    Args:
+        conn: Connection of the transaction
+        take (callable): Takes stock given `lock_shards`
+
+    Returns:
+        The result of the attempt that did not raise ShardsDrained
+    """
+    try:
+        return take(False)
+    except ShardsDrained:
+        conn.rollback()
+        return take(True)
+
+
+def set_shards(cursor, item_id, shards):
+    """
+    Spread the free units of an item over `shards` shard rows.
+
+    With 0 shards the free units go back to the stock row. Rows keep their
+    held units, and shards beyond the new count are deleted once they hold
+    nothing. Their versions are carried over to the stock row, so the item's
+    total version keeps growing.
+
+    Args:
+        cursor: Cursor of the open transaction
+        item_id (int): Item to reshard
+        shards (int): New number of shards
+
+    Returns:
+        bool: Whether the item exists
+    """
+    cursor.execute(
+        "SELECT quantity - held FROM stock WHERE item_id = %s FOR UPDATE", (item_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return False
+    current = read_shards(cursor, [item_id], lock=True)[item_id]
+    units = row[0] + sum(on_hand - held for on_hand, held, _ in current.values())
+    shares = dict(zip(range(1, shards + 1), split_evenly(units, shards))) if shards else {}
+    dropped = [
+        shard for shard, (_, held, _) in current.items() if shard > shards and held == 0
+    ]
+
+    cursor.execute(
+        "UPDATE stock SET quantity = held + %s, shards = %s, version = version + 1 + %s"
+        " WHERE item_id = %s",
+        (
+            0 if shards else units,
+            shards,
+            sum(current[shard][2] for shard in dropped),
+            item_id,
+        ),
+    )
+    kept = [
+        (item_id, shard, shares.get(shard, 0)) for shard in sorted(current) if shard not in dropped
+    ]
+    if kept:
+        update_shards(cursor, "quantity = held + {case}", kept)
+    added = [(item_id, shard, share) for shard, share in shares.items() if shard not in current]
+    if added:
+        cursor.execute(
+            "INSERT INTO stock_shards (item_id, shard, quantity) VALUES "
+            + ", ".join(["(%s, %s, %s)"] * len(added)),
+            tuple(value for line in added for value in line),
+        )
+    if dropped:
+        placeholders = ", ".join(["%s"] * len(dropped))
+        cursor.execute(
+            f"DELETE FROM stock_shards WHERE item_id = %s AND shard IN ({placeholders})",
+            (item_id, *dropped),
+        )
+    return True
@@ -0,0 +1,203 @@
+"""
+In-process snapshot of the `stock` table behind /current_stock.
+
+Every stock service replica keeps the rows of `stock` in memory together
+with the JSON bodies of `/current_stock` and `/current_stock/{item_id}`,
+serialized once per change, so the clients polling them are answered
+without a MySQL round trip.
+
+Rows carry the `version` column of migration 0011, which every write to a
+stock row increments, and a row only replaces the copy in the snapshot if
+its version is newer; updates applied out of order can't go back in time.
+The version of a sharded item is the sum of its stock and shard rows' versions.
+After committing, a writer that knows the new rows (the restock path)
+applies them to its own snapshot and publishes them on the Redis channel
+STOCK_SNAPSHOT_CHANNEL. Writers that only know which items changed (holds,
+commits, releases, the reaper) publish the item ids, and every replica
+reloads those rows. Each replica listens on the channel in a background
+thread.
+
+Pub/sub drops the messages sent while a subscriber is disconnected, so the
+snapshot is fully reloaded whenever the listener (re)subscribes and at
+least every STOCK_SNAPSHOT_MAX_AGE seconds. While the listener is not
+subscribed the snapshot is not trusted and reads go to MySQL.
+
+The `/current_stock` ETag of a snapshot read hashes the body it serves, not
+the `stock` table version: the version is bumped as soon as a write commits,
+before this replica's snapshot has the change, and an ETag taken from it
+could tag the old body and keep clients on it with 304s.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import redis
+from mysql.connector.errors import Error as MySQLError
+
+from common.db import PoolTimeoutError
+from common.stock_shards import STOCK_TOTALS
+
+logger = logging.getLogger(__name__)
+
+STOCK_SNAPSHOT_CHANNEL = os.getenv("STOCK_SNAPSHOT_CHANNEL", "stock_snapshot")
+STOCK_SNAPSHOT_MAX_AGE = float(os.getenv("STOCK_SNAPSHOT_MAX_AGE", "60"))
+STOCK_COLUMNS = ("item_id", "item_name", "quantity", "max_quantity", "held", "version", "shards")
+# Totals of sharded items, see common/stock_shards.py
+STOCK_SNAPSHOT_QUERY = f"SELECT {', '.join(STOCK_COLUMNS)} FROM {STOCK_TOTALS}"
+
+
+def dump_json(value):
+    return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+def publish_stock_changes(redis_client, item_ids=(), rows=(), channel=STOCK_SNAPSHOT_CHANNEL):
+    """
+    Tell every replica which stock rows changed; call after the commit.
+
+    Args:
+        redis_client: Redis client
+        item_ids: Ids of changed items, reloaded by every replica
+        rows: New rows (dicts of STOCK_COLUMNS), applied as they are
+    """
+    message = {"rows": list(rows)} if rows else {"item_ids": list(item_ids)}
+    if not message.get("rows") and not message.get("item_ids"):
+        return
+    try:
+        redis_client.publish(channel, dump_json(message))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish stock changes: {str(e)}")
+
+
+class StockSnapshot:
+    """Versioned in-memory copy of the stock rows of one service replica."""
+
+    def __init__(
+        self,
+        loader,
+        redis_client,
+        channel=STOCK_SNAPSHOT_CHANNEL,
+        max_age=STOCK_SNAPSHOT_MAX_AGE,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            loader (callable): Returns stock rows (dicts of STOCK_COLUMNS), of
+                the item ids it is given or of every item when given None
+            redis_client: Redis client to listen for changes with
+            channel (str): Pub/sub channel of the stock changes
+            max_age (float): Seconds between two full reloads
+            clock (callable): Monotonic time source
+        """
+        self._loader = loader
+        self.redis = redis_client
+        self.channel = channel
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._list_body = None
+        self._item_bodies = {}
+        self._live = False
+        self._loaded_at = None
+        self._stop = threading.Event()
+
+    def apply(self, rows, complete=False):
+        """
+        Merge rows into the snapshot, keeping the newer version of each.
+
+        Args:
+            rows (list): Stock rows
+            complete (bool): Whether `rows` is the whole table; items missing
+                from it are dropped
+        """
+        with self._lock:
+            if complete:
+                previous, self._rows = self._rows, {}
+                self._item_bodies = {}
+            else:
+                previous = self._rows
+            for row in rows:
+                current = previous.get(row["item_id"])
+                if current is not None and current["version"] >= row["version"]:
+                    row = current
+                elif not complete:
+                    self._item_bodies.pop(row["item_id"], None)
+                self._rows[row["item_id"]] = row
+            self._list_body = None
+
+    def reload(self, item_ids=None):
+        """Load the rows of `item_ids`, or of every item, from MySQL."""
+        rows = self._loader(item_ids)
+        self.apply(rows, complete=item_ids is None)
+        if item_ids is None:
+            self._loaded_at = self._clock()
+
+    def list_body(self):
+        """JSON body of /current_stock and its ETag, or None while not live."""
+        with self._lock:
+            if not self._live:
+                return None
+            if self._list_body is None:
+                body = dump_json([self._rows[i] for i in sorted(self._rows)])
+                self._list_body = (body, f'W/"{hashlib.sha1(body).hexdigest()[:20]}"')
+            return self._list_body
+
+    def item_body(self, item_id):
+        """JSON body of /current_stock/{item_id}, or None if not live or unknown."""
+        with self._lock:
+            if not self._live or item_id not in self._rows:
+                return None
+            if item_id not in self._item_bodies:
+                self._item_bodies[item_id] = dump_json(self._rows[item_id])
+            return self._item_bodies[item_id]
+
+    def _set_live(self, live):
+        with self._lock:
+            self._live = live
+
+    def _handle(self, data):
+        message = json.loads(data)
+        if message.get("rows"):
+            self.apply(message["rows"])
+        elif message.get("item_ids"):
+            self.reload(message["item_ids"])
+
+    def start(self):
+        """Listen for changes in a daemon thread."""
+        threading.Thread(target=self._listen, name="stock-snapshot", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Changes committed before the subscription are in the full load
+                self.reload()
+                self._set_live(True)
+                logger.info(f"Stock snapshot loaded {len(self._rows)} items")
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._handle(message["data"])
+                    if self._clock() - self._loaded_at >= self.max_age:
+                        self.reload()
+            except redis.RedisError as e:
+                logger.warning(f"Stock snapshot listener Redis error: {str(e)}")
+            except (MySQLError, PoolTimeoutError) as e:
+                logger.warning(f"Stock snapshot listener database error: {str(e)}")
+            finally:
+                self._set_live(False)
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except redis.RedisError:
+                        pass
+            self._stop.wait(1.0)
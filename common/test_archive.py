@@ -0,0 +1,39 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from common.archive import archive_batch
+
+
+def test_archive_batch_moves_children_before_orders():
+    """View and reservation rows are dropped, children moved before their orders"""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [("a",), ("b",)]
+
+    archived = archive_batch(conn, datetime(2024, 1, 1), batch_size=2)
+
+    assert archived == ["a", "b"]
+    statements = [call.args[0] for call in cursor.execute.call_args_list[1:]]
+    assert statements == [
+        "DELETE FROM delivery_view WHERE order_id IN (%s, %s)",
+        "DELETE FROM stock_reservation_items WHERE order_id IN (%s, %s)",
+        "DELETE FROM stock_reservations WHERE order_id IN (%s, %s)",
+        "INSERT INTO deliveries_history SELECT * FROM deliveries WHERE order_id IN (%s, %s)",
+        "DELETE FROM deliveries WHERE order_id IN (%s, %s)",
+        "INSERT INTO order_items_history SELECT * FROM order_items WHERE order_id IN (%s, %s)",
+        "DELETE FROM order_items WHERE order_id IN (%s, %s)",
+        "INSERT INTO orders_history SELECT * FROM orders WHERE id IN (%s, %s)",
+        "DELETE FROM orders WHERE id IN (%s, %s)",
+    ]
+    conn.commit.assert_called_once()
+
+
+def test_archive_batch_nothing_to_archive():
+    """An empty batch ends the transaction without writing"""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = []
+
+    assert archive_batch(conn, datetime(2024, 1, 1)) == []
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
@@ -0,0 +1,47 @@
+from itertools import permutations
+
+import numpy as np
+
+from common.assignment import solve_assignment
+
+
+def brute_force(cost):
+    """Lowest total cost over every way of pairing the smaller side."""
+    n_rows, n_columns = cost.shape
+    if n_rows <= n_columns:
+        return min(
+            sum(cost[i, j] for i, j in enumerate(columns))
+            for columns in permutations(range(n_columns), n_rows)
+        )
+    return brute_force(cost.T)
+
+
+def test_solve_assignment_is_optimal():
+    """Square and rectangular problems match an exhaustive search"""
+    rng = np.random.default_rng(7)
+    for shape in [(1, 1), (4, 4), (6, 6), (3, 7), (7, 3), (1, 5)]:
+        cost = np.round(rng.random(shape) * 20, 3)
+
+        rows, columns = solve_assignment(cost)
+
+        assert len(rows) == min(shape)
+        assert len(set(rows)) == len(rows) and len(set(columns)) == len(columns)
+        assert abs(cost[rows, columns].sum() - brute_force(cost)) < 1e-9
+
+
+def test_solve_assignment_equal_preferences():
+    """Rows ranking the columns alike still end up on distinct, cheapest columns"""
+    pickup = np.array([5.0, 1.0, 3.0, 0.5])
+    dropoff = np.array([2.0, 2.0, 7.0])
+    cost = pickup[:, None] + dropoff[None, :]
+
+    rows, columns = solve_assignment(cost)
+
+    assert sorted(rows) == [1, 2, 3]
+    assert sorted(columns) == [0, 1, 2]
+
+
+def test_solve_assignment_empty():
+    rows, columns = solve_assignment(np.empty((0, 3)))
+
+    assert len(rows) == 0 and len(columns) == 0
@@ -0,0 +1,58 @@
+import json
+from unittest.mock import MagicMock
+
+import redis
+
+from common.cache import ReadThroughCache
+
+
+def make_cache(cached=None, version=None):
+    client = MagicMock()
+    client.mget.return_value = [cached, version]
+    return client, ReadThroughCache(client, "order_details", ttl=60)
+
+
+def test_hit_skips_loader():
+    """A cached value is returned without calling the loader"""
+    _, cache = make_cache(cached=json.dumps({"id": "abc"}))
+    loader = MagicMock()
+
+    assert cache.get_or_load("abc", loader) == {"id": "abc"}
+    loader.assert_not_called()
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_fills_with_version_seen_before_load():
+    """A miss loads from MySQL and fills only for the version read beforehand"""
+    client, cache = make_cache(version="7")
+
+    assert cache.get_or_load("abc", lambda: {"id": "abc"}) == {"id": "abc"}
+
+    fill = client.register_script.return_value
+    assert fill.call_args.kwargs["keys"] == ["order_details:abc", "order_details:abc:version"]
+    assert fill.call_args.kwargs["args"] == ["7", json.dumps({"id": "abc"}), 60]
+    assert cache.stats()["misses"] == 1
+
+
+def test_invalidate_bumps_version_and_deletes():
+    """Invalidation bumps the version and counts removed entries"""
+    client, cache = make_cache()
+    pipe = client.pipeline.return_value
+    pipe.execute.return_value = [1, True, 1, 3, True, 0]
+
+    cache.invalidate("a", "b")
+
+    assert [call.args[0] for call in pipe.incr.call_args_list] == [
+        "order_details:a:version",
+        "order_details:b:version",
+    ]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_redis_outage_falls_back_to_loader():
+    """Reads keep working from MySQL while Redis is down"""
+    client, cache = make_cache()
+    client.mget.side_effect = redis.ConnectionError("down")
+
+    assert cache.get_or_load("abc", lambda: {"id": "abc"}) == {"id": "abc"}
+    assert cache.stats()["errors"] == 1
@@ -0,0 +1,61 @@
+from unittest.mock import MagicMock
+
+from common.catalog import Catalog
+
+ROWS = [{"item_id": 1, "item_name": "Product 1", "max_quantity": 500, "shards": 0}]
+
+
+def make_catalog(version="7"):
+    loader = MagicMock(return_value=ROWS)
+    versions = MagicMock()
+    versions.current.return_value = [version]
+    now = [0.0]
+    catalog = Catalog(loader, versions, refresh_interval=5, clock=lambda: now[0])
+    return catalog, loader, versions, now
+
+
+def test_catalog_reloads_only_when_the_version_changes():
+    """Version checks are throttled and an unchanged version keeps the items"""
+    catalog, loader, versions, now = make_catalog()
+
+    assert catalog.get(1)["item_name"] == "Product 1"
+    now[0] = 1.0
+    catalog.get(1)
+    assert versions.current.call_count == 1
+
+    now[0] = 6.0
+    catalog.get(1)
+    assert versions.current.call_count == 2
+    assert loader.call_count == 1
+
+    versions.current.return_value = ["8"]
+    now[0] = 12.0
+    catalog.get(1)
+    assert loader.call_count == 2
+
+
+def test_unknown_item_checks_the_version_immediately():
+    """A new item becomes visible once its writer bumped the version"""
+    catalog, loader, versions, now = make_catalog()
+    catalog.get(1)
+
+    loader.return_value = ROWS + [
+        {"item_id": 2, "item_name": "Product 2", "max_quantity": 400, "shards": 0}
+    ]
+    versions.current.return_value = ["8"]
+
+    assert catalog.get(2)["item_name"] == "Product 2"
+
+
+def test_catalog_without_redis_reloads_on_the_interval():
+    """Without a version every check reloads from MySQL"""
+    catalog, loader, versions, now = make_catalog()
+    versions.current.return_value = None
+
+    catalog.get(1)
+    now[0] = 1.0
+    catalog.get(1)
+    now[0] = 6.0
+    catalog.get(1)
+
+    assert loader.call_count == 2
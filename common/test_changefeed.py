@@ -0,0 +1,48 @@
+import json
+from unittest.mock import MagicMock
+
+import redis
+
+from common.changefeed import ChangeFeed
+
+
+def test_publish_appends_to_stream():
+    """A transition is appended to the stream with its entity and payload"""
+    client = MagicMock()
+    client.pipeline.return_value.execute.return_value = ["1700000000000-0"]
+    feed = ChangeFeed(client, stream="changes", maxlen=10)
+
+    seq = feed.publish("order", "abc", "status_changed", order_status="completed")
+
+    assert seq == "1700000000000-0"
+    stream, fields = client.pipeline.return_value.xadd.call_args.args
+    assert stream == "changes"
+    assert fields["entity"] == "order"
+    data = json.loads(fields["data"])
+    assert data["id"] == "abc"
+    assert data["event"] == "status_changed"
+    assert data["order_status"] == "completed"
+
+
+def test_publish_survives_redis_outage():
+    """Publishing never fails the already committed write"""
+    client = MagicMock()
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+    feed = ChangeFeed(client)
+
+    assert feed.publish("delivery", 1, "created") is None
+
+
+def test_dropped_changes_are_followed_by_a_reset():
+    """Clients learn about changes lost in an outage from a reset entry"""
+    client = MagicMock()
+    pipe = client.pipeline.return_value
+    pipe.execute.side_effect = [redis.ConnectionError("down"), ["1-0", "2-0"], ["3-0"]]
+    feed = ChangeFeed(client, stream="changes")
+
+    assert feed.publish("order", "abc", "created") is None
+    assert feed.publish("order", "def", "created") == "2-0"
+    assert feed.publish("order", "ghi", "created") == "3-0"
+
+    entities = [call.args[1]["entity"] for call in pipe.xadd.call_args_list]
+    assert entities == ["order", "reset", "order", "order"]
@@ -0,0 +1,107 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+from mysql.connector.errors import OperationalError
+
+from common.courier_index import CourierIndex, encode_courier, run_reconciler
+
+
+def courier(person_id, person_status, **fields):
+    row = {
+        "id": person_id,
+        "name": f"Courier {person_id}",
+        "phone_number": "555-0100",
+        "person_status": person_status,
+        "position_x": 0.0,
+        "position_y": 0.0,
+        "idle_since": None,
+    }
+    row.update(fields)
+    return row
+
+
+def test_members_skip_write_through_in_progress():
+    """Only members whose hash agrees with the set are returned, sorted by id"""
+    client = MagicMock()
+    pipe = client.pipeline.return_value
+    pipe.exists.return_value.smembers.return_value.execute.return_value = [1, {"2", "1"}]
+    pipe.execute.return_value = [
+        encode_courier(courier(1, "idle", idle_since=datetime(2024, 1, 1, 12, 0, 0, 250000))),
+        encode_courier(courier(2, "en_route")),
+    ]
+
+    members = CourierIndex(client).members("idle")
+
+    assert [row["id"] for row in members] == [1]
+    assert members[0]["idle_since"] == datetime(2024, 1, 1, 12, 0, 0, 250000)
+
+
+def test_members_unavailable_until_built():
+    """Without the ready marker callers fall back to MySQL"""
+    client = MagicMock()
+    pipe = client.pipeline.return_value
+    pipe.exists.return_value.smembers.return_value.execute.return_value = [0, set()]
+
+    assert CourierIndex(client).members("idle") is None
+
+
+def test_reconcile_repairs_drift():
+    """Drifted and missing delivery persons are rewritten if their indexed status still holds"""
+    client = MagicMock()
+    client.exists.return_value = 1
+    pipe = client.pipeline.return_value
+    pipe.execute.side_effect = [
+        [{"1", "2"}, set(), {"1", "2"}],  # idle, en_route and all sets
+        [encode_courier(courier(1, "idle")), encode_courier(courier(2, "idle"))],
+        [1, 1],
+    ]
+    rows = [courier(1, "idle"), courier(2, "en_route"), courier(3, "idle")]
+
+    assert CourierIndex(client).reconcile(lambda: rows) == 2
+
+    set_state = client.register_script.return_value
+    repairs = [call.kwargs["args"][:3] for call in set_state.call_args_list]
+    assert repairs == [["idle", 2, "en_route"], ["", 3, "idle"]]
+
+
+def test_reconcile_rebuilds_lost_index():
+    """An index without its ready marker is rebuilt from MySQL"""
+    client = MagicMock()
+    client.exists.return_value = 0
+    client.smembers.return_value = set()
+
+    assert CourierIndex(client).reconcile(lambda: [courier(1, "idle")]) == -1
+    client.pipeline.return_value.set.assert_called_once_with("couriers:ready", 1)
+
+
+@pytest.mark.parametrize("repaired, bumped", [(0, False), (2, True), (-1, True)])
+def test_reconciler_bumps_delivery_persons_after_repair(repaired, bumped):
+    """Listings answered from the drifted index must not be revalidated"""
+    index, table_versions = MagicMock(), MagicMock()
+    index.reconcile.return_value = repaired
+
+    with patch("common.courier_index.time.sleep", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            run_reconciler(MagicMock(), index, table_versions)
+
+    assert table_versions.bump.called == bumped
+    if bumped:
+        table_versions.bump.assert_called_once_with("delivery_persons")
+
+
+def test_reconciler_survives_database_errors():
+    """A failed read of the delivery persons is retried on the next pass"""
+    pool, index = MagicMock(), MagicMock()
+    connection = pool.borrow.return_value.__enter__.return_value
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [OperationalError("gone away"), [courier(1, "idle")]]
+    index.reconcile.side_effect = lambda read_rows: len(read_rows())
+
+    with patch("common.courier_index.time.sleep", side_effect=[None, KeyboardInterrupt]):
+        with pytest.raises(KeyboardInterrupt):
+            run_reconciler(pool, index, MagicMock())
+
+    assert index.reconcile.call_count == 2
+    # The lock connection is replaced after the error
+    assert pool.acquire.call_count == 2
@@ -0,0 +1,109 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from mysql.connector.errors import OperationalError
+
+from common.db import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def mock_connect():
+    """Mock MySQL connect so every call returns a fresh connection"""
+    with patch("mysql.connector.connect", side_effect=lambda **_: MagicMock()) as mock:
+        yield mock
+
+
+def test_connections_are_reused(mock_connect):
+    """A released connection is handed out again instead of reconnecting"""
+    pool = ConnectionPool({}, pool_size=2, timeout=0.1)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert mock_connect.call_count == 1
+    first.rollback.assert_called()
+
+
+def test_checkout_times_out_when_pool_exhausted(mock_connect):
+    """Checkout fails once every connection is in use"""
+    pool = ConnectionPool({}, pool_size=1, timeout=0.05)
+    conn = pool.acquire()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+    pool.release(conn)
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_expired_connections_are_recycled(mock_connect):
+    """Connections older than max_lifetime are replaced on checkout"""
+    pool = ConnectionPool({}, pool_size=1, timeout=0.1, max_lifetime=0)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    replacement = pool.acquire()
+
+    assert replacement is not conn
+    conn.close.assert_called_once()
+    assert pool.stats()["recycled"] == 1
+    assert pool.stats()["created"] == 2
+
+
+def test_failed_ping_replaces_connection(mock_connect):
+    """A connection that fails the pre-ping is discarded"""
+    from mysql.connector.errors import Error as MySQLError
+
+    pool = ConnectionPool({}, pool_size=1, timeout=0.1, pre_ping=True)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.ping.side_effect = MySQLError("gone away")
+
+    assert pool.acquire() is not conn
+
+
+def test_stats(mock_connect):
+    """Stats reflect connections in use and idle"""
+    pool = ConnectionPool({}, pool_size=3, timeout=0.1)
+    a = pool.acquire()
+    b = pool.acquire()
+    pool.release(b)
+
+    stats = pool.stats()
+    assert stats["in_use"] == 1
+    assert stats["idle"] == 1
+    assert stats["created"] == 2
+    pool.release(a)
+
+
+def test_run_offloads_to_executor(mock_connect):
+    """Blocking calls run on a DB thread, not the event loop thread"""
+    import asyncio
+    import threading
+
+    pool = ConnectionPool({}, pool_size=2, timeout=0.1)
+
+    def blocking_call(value):
+        return threading.current_thread().name, value
+
+    thread_name, value = asyncio.run(pool.run(blocking_call, 42))
+
+    assert thread_name.startswith("db")
+    assert value == 42
+    assert pool.stats()["executor_pending"] == 0
+    pool.close()
+
+
+def test_borrow_passes_database_errors_through(mock_connect):
+    """Workers see the MySQL error itself and the broken connection is dropped"""
+    pool = ConnectionPool({}, pool_size=1, timeout=0.1)
+
+    with pytest.raises(OperationalError):
+        with pool.borrow() as conn:
+            raise OperationalError("gone away")
+
+    conn.close.assert_called_once()
+    assert pool.stats()["open"] == 0
@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+
+from common.delivery_view import (
+    DELIVERY_VIEW_COLUMNS,
+    record_deliveries,
+    record_order_statuses,
+)
+
+
+def test_record_deliveries_copies_joined_rows():
+    """New deliveries are copied with their order columns, orders share-locked"""
+    cursor = MagicMock()
+
+    record_deliveries(cursor, [7, 3])
+
+    query, params = cursor.execute.call_args.args
+    assert query.startswith(f"INSERT INTO delivery_view ({', '.join(DELIVERY_VIEW_COLUMNS)}) SELECT")
+    assert "FROM deliveries dl" in query
+    assert "LEFT JOIN orders o ON o.id = dl.order_id" in query
+    assert query.endswith("WHERE dl.id IN (%s, %s) ORDER BY dl.id FOR SHARE OF o")
+    assert params == (7, 3)
+
+
+def test_record_order_statuses_locks_in_key_order():
+    """Status changes reach the view rows of their orders, in order id order"""
+    cursor = MagicMock()
+
+    record_order_statuses(cursor, {"b": 1, "a": 2})
+
+    query, params = cursor.execute.call_args.args
+    assert query.startswith("UPDATE delivery_view v JOIN orders o ON o.id = v.order_id")
+    assert params == ("a", "b")
+
+
+def test_nothing_to_record():
+    """Empty batches don't touch the database"""
+    cursor = MagicMock()
+
+    record_deliveries(cursor, [])
+    record_order_statuses(cursor, [])
+
+    cursor.execute.assert_not_called()
@@ -0,0 +1,75 @@
+import json
+import math
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.dispatch import dropoff_position, match_batch
+
+
+def executed(cursor, fragment):
+    """Arguments of the first statement containing `fragment`."""
+    return next(
+        call.args for call in cursor.execute.call_args_list if fragment in call.args[0]
+    )
+
+
+def test_dropoff_position_lies_at_customer_distance():
+    """Drop-offs are stable per order and customer_distance km from the kitchen"""
+    x, y = dropoff_position("01HZX3K5", 7.5)
+
+    assert math.hypot(x, y) == pytest.approx(7.5)
+    assert dropoff_position("01HZX3K5", 7.5) == (x, y)
+
+
+def test_match_batch_sends_nearest_delivery_person():
+    """With more idle delivery persons than orders the closest one is assigned,
+    counting the way idle delivery persons rode back to the kitchen"""
+    now = datetime(2024, 1, 1, 12, 0)
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [
+        [],  # nothing expired
+        [
+            {
+                "id": 9,
+                "order_id": "abc",
+                "customer_distance": 4.0,
+                "dropoff_x": 4.0,
+                "dropoff_y": 0.0,
+                "enqueued_at": now - timedelta(seconds=20),
+            }
+        ],
+        [
+            # 10 km out, riding back for 45 s: 1 km left
+            {"id": 1, "position_x": 6.0, "position_y": 8.0, "idle_since": now - timedelta(seconds=45)},
+            {"id": 2, "position_x": 0.0, "position_y": 1.5, "idle_since": None},
+        ],
+        [{"id": 42, "order_id": "abc"}],
+    ]
+
+    assignments = match_batch(conn, batch_size=10, now=now)
+
+    assert assignments == [
+        {"order_id": "abc", "delivery_id": 42, "delivery_person_id": 1, "pickup_distance": 1.0}
+    ]
+    assert executed(cursor, "UPDATE delivery_persons")[1] == (1,)
+    assert executed(cursor, "INSERT INTO delivery_view")[1] == (42,)
+    assert executed(cursor, "INSERT INTO dispatch_wait_histogram")[1][1:] == (1, 20000)
+    outbox = executed(cursor, "INSERT INTO task_outbox")[1]
+    assert outbox[1] == "deliver_order"
+    assert json.loads(outbox[2]) == ["abc", 4.0, 1, 1.0]
+    conn.commit.assert_called_once()
+
+
+def test_match_batch_nobody_idle():
+    """Queued orders stay queued until somebody is idle"""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [[], [{"id": 9, "order_id": "abc"}], []]
+
+    assert match_batch(conn, now=datetime(2024, 1, 1)) == []
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert not any(statement.startswith("DELETE") for statement in statements)
+    conn.commit.assert_called_once()
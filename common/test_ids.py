@@ -0,0 +1,92 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.ids import (
+    CROCKFORD_ALPHABET,
+    UlidGenerator,
+    order_id_generator,
+    rekey_legacy_orders,
+    ulid_at,
+    ulid_from_bytes,
+    ulid_timestamp,
+    ulid_to_bytes,
+)
+
+
+def test_ulids_increase_within_a_millisecond():
+    """Ids generated in the same millisecond are still strictly ordered"""
+    generate = UlidGenerator(clock=lambda: 1700000000.123)
+
+    ids = [generate() for _ in range(1000)]
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(ulid_timestamp(ulid) == 1700000000123 for ulid in ids)
+
+
+def test_ulids_stay_ordered_when_the_clock_steps_back():
+    """A clock moving backwards never produces a smaller id"""
+    times = iter([1700000001.0, 1700000000.0, 1700000002.0])
+    generate = UlidGenerator(clock=lambda: next(times))
+
+    ids = [generate(), generate(), generate()]
+
+    assert ids == sorted(ids)
+
+
+def test_ulid_format_and_binary_roundtrip():
+    """ULIDs are 26 Crockford characters and survive the BINARY(16) encoding"""
+    first = ulid_at(1700000000000)
+    second = ulid_at(1700000000001)
+
+    assert len(first) == 26
+    assert set(first) <= set(CROCKFORD_ALPHABET)
+    assert ulid_from_bytes(ulid_to_bytes(first)) == first
+    assert len(ulid_to_bytes(first)) == 16
+    assert ulid_to_bytes(first) < ulid_to_bytes(second)
+
+
+def test_order_id_generator_schemes():
+    """The legacy scheme keeps issuing 8 hex character ids"""
+    legacy_id = order_id_generator("legacy")()
+
+    assert len(legacy_id) == 8
+    int(legacy_id, 16)
+    assert len(order_id_generator("ulid")()) == 26
+    with pytest.raises(ValueError):
+        order_id_generator("snowflake")
+
+
+def test_rekey_pages_by_primary_key():
+    """Batches continue after the last id seen and skip orders that have a ULID"""
+    pool = MagicMock()
+    cursor = pool.connection.return_value.__enter__.return_value.cursor.return_value
+    cursor = cursor.__enter__.return_value
+    ulid = ulid_at(1700000000000)
+    cursor.fetchall.side_effect = [
+        [("abcd1234", datetime(2023, 1, 1, 12, 0)), (ulid, datetime(2023, 1, 2))],
+        [],
+        [("0000ffff", datetime(2022, 1, 1))],
+        [],
+    ]
+
+    assert rekey_legacy_orders(pool, batch_size=2) == 2
+
+    selects = [call.args for call in cursor.execute.call_args_list if "SELECT" in call.args[0]]
+    assert [(query.split()[4], params) for query, params in selects] == [
+        ("orders", ("", 2)),
+        ("orders", (ulid, 2)),
+        ("orders_history", ("", 2)),
+        ("orders_history", ("0000ffff", 2)),
+    ]
+    assert all("CHAR_LENGTH" not in query for query, _ in selects)
+    renamed = [
+        (call.args[0].split()[1], [old for _, old in call.args[1]])
+        for call in cursor.executemany.call_args_list
+    ]
+    assert ("orders", ["abcd1234"]) in renamed
+    assert ("orders_history", ["0000ffff"]) in renamed
+    updated = {table for table, _ in renamed}
+    assert {"dispatch_queue", "order_items_history", "deliveries_history"} <= updated
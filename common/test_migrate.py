@@ -0,0 +1,24 @@
+from common.migrate import load_migrations, split_statements
+
+
+def test_split_statements_drops_comments():
+    """Comment lines are ignored and statements split on semicolons"""
+    sql = """-- leading comment
+CREATE INDEX a ON t (x);
+
+-- another comment
+CREATE INDEX b ON t (y, z);
+"""
+
+    assert split_statements(sql) == [
+        "CREATE INDEX a ON t (x)",
+        "CREATE INDEX b ON t (y, z)",
+    ]
+
+
+def test_migrations_are_numbered_and_ordered():
+    """Shipped migrations have unique, increasing versions"""
+    versions = [version for version, _, _ in load_migrations()]
+
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
@@ -0,0 +1,77 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from common.order_stats import (
+    duration_bucket,
+    histogram_percentile,
+    load_stats,
+    record_created,
+    record_transitions,
+)
+
+
+def test_record_created_groups_orders_per_minute():
+    """Inserted orders are counted once per status and once per minute"""
+    cursor = MagicMock()
+
+    record_created(
+        cursor,
+        ["2024-01-01T12:00:05", "2024-01-01T12:00:40", "2024-01-01T12:01:00"],
+    )
+
+    status_sql, status_params = cursor.execute.call_args_list[0].args
+    assert "order_status_counts" in status_sql
+    assert status_params == ("active", 3)
+    minute_sql, minute_params = cursor.execute.call_args_list[1].args
+    assert "order_minute_stats" in minute_sql
+    assert minute_params == (
+        datetime(2024, 1, 1, 12, 0),
+        2,
+        datetime(2024, 1, 1, 12, 1),
+        1,
+    )
+
+
+def test_record_transitions_moves_counts_and_fills_histogram():
+    """A completed order leaves 'active' and adds its delivery time"""
+    cursor = MagicMock()
+
+    record_transitions(
+        cursor,
+        [
+            ("active", "completed", datetime(2024, 1, 1, 12, 0), "2024-01-01T12:10:00"),
+            ("completed", "completed", datetime(2024, 1, 1, 12, 0), "2024-01-01T12:20:00"),
+        ],
+    )
+
+    assert cursor.execute.call_args_list[0].args[1] == ("active", -1, "completed", 1)
+    assert cursor.execute.call_args_list[1].args[1] == (datetime(2024, 1, 1, 12, 10), 1, 0)
+    assert cursor.execute.call_args_list[2].args[1] == (duration_bucket(600), 1, 600)
+
+
+def test_histogram_percentiles():
+    """Percentiles come from the bucket holding the requested rank"""
+    buckets = [(10, 50, 500), (20, 45, 2250), (30, 5, 1000)]
+
+    assert histogram_percentile(buckets, 100, 50) == 10.0
+    assert histogram_percentile(buckets, 100, 95) == 50.0
+    assert histogram_percentile(buckets, 100, 99) == 200.0
+
+
+def test_load_stats_summary():
+    """The summary is built from the rollup tables only"""
+    cursor = MagicMock()
+    cursor.fetchall.side_effect = [
+        [("active", 3), ("completed", 7)],
+        [(datetime(2024, 1, 1, 12, 0), 6, 2, 0), (datetime(2024, 1, 1, 12, 1), 4, 5, 1)],
+        [(duration_bucket(600), 7, 4200)],
+    ]
+
+    stats = load_stats(cursor, minutes=2, now=datetime(2024, 1, 1, 12, 1, 30))
+
+    assert stats["counts"] == {"active": 3, "completed": 7}
+    assert stats["total"] == 10
+    assert stats["orders_per_minute"] == 5.0
+    assert stats["delivery_time"]["mean_seconds"] == 600.0
+    assert stats["delivery_time"]["p95_seconds"] == 600.0
+    assert cursor.execute.call_args_list[1].args[1] == (datetime(2024, 1, 1, 12, 0),)
@@ -0,0 +1,45 @@
+import json
+from unittest.mock import MagicMock
+
+from common.outbox import enqueue_task, relay_batch
+
+
+def test_enqueue_task_writes_outbox_row():
+    """Tasks are recorded with the caller's cursor and get an id up front"""
+    cursor = MagicMock()
+
+    task_id = enqueue_task(cursor, "process_order", ["abc", 2.5, []])
+
+    query, params = cursor.execute.call_args.args
+    assert "INSERT INTO task_outbox" in query
+    assert params == (task_id, "process_order", json.dumps(["abc", 2.5, []]))
+
+
+def test_relay_batch_publishes_then_deletes():
+    """A batch is published over one producer and removed from the outbox"""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        (1, "t1", "process_order", '["a", 1.0, []]'),
+        (2, "t2", "process_order", '["b", 2.0, []]'),
+    ]
+    celery = MagicMock()
+
+    assert relay_batch(conn, celery, batch_size=10) == 2
+
+    celery.producer_or_acquire.assert_called_once()
+    assert [call.kwargs["task_id"] for call in celery.send_task.call_args_list] == ["t1", "t2"]
+    delete_query, delete_params = cursor.execute.call_args.args
+    assert delete_query.startswith("DELETE FROM task_outbox")
+    assert delete_params == (1, 2)
+    conn.commit.assert_called_once()
+
+
+def test_relay_batch_empty_outbox():
+    """Nothing is published when the outbox is empty"""
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value.fetchall.return_value = []
+    celery = MagicMock()
+
+    assert relay_batch(conn, celery) == 0
+    celery.send_task.assert_not_called()
@@ -0,0 +1,94 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+from mysql.connector.errors import OperationalError
+
+from common.reservations import (
+    COMMITTED,
+    RELEASED,
+    finish_reservation,
+    hold_stock,
+    reap_expired,
+    run_reaper,
+)
+
+
+def test_hold_stock_again_returns_existing_state():
+    """A retried hold finds the reservation and takes no stock"""
+    cursor = MagicMock()
+    cursor.rowcount = 0
+    cursor.fetchone.return_value = ("committed",)
+
+    state = hold_stock(cursor, "abc", {1: 2}, datetime(2024, 1, 1))
+
+    assert state == "committed"
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert not any(statement.startswith("UPDATE stock") for statement in statements)
+
+
+def test_commit_takes_held_units_off_quantity_and_held():
+    """Committing removes the units from the stock and from the held count"""
+    cursor = MagicMock()
+    cursor.fetchone.return_value = ("held",)
+    cursor.fetchall.return_value = [(1, 0, 2), (3, 0, 1)]
+
+    previous, quantities = finish_reservation(cursor, "abc", COMMITTED)
+
+    assert (previous, quantities) == ("held", {1: 2, 3: 1})
+    query, params = cursor.execute.call_args_list[2].args
+    assert query.startswith("UPDATE stock SET quantity = quantity - CASE item_id")
+    assert ", held = held - CASE item_id" in query
+    assert params == (1, 2, 3, 1, 1, 2, 3, 1, 1, 3)
+    assert cursor.execute.call_args.args == (
+        "UPDATE stock_reservations SET state = %s WHERE order_id = %s",
+        (COMMITTED, "abc"),
+    )
+
+
+def test_release_of_finished_reservation_changes_nothing():
+    """Only a held reservation can be released"""
+    cursor = MagicMock()
+    cursor.fetchone.return_value = ("released",)
+
+    assert finish_reservation(cursor, "abc", RELEASED) == ("released", {})
+    cursor.execute.assert_called_once()
+
+
+def test_reap_expired_releases_batch_in_bulk():
+    """Expired holds are summed per item and released by one UPDATE"""
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [
+        [("a",), ("b",)],
+        [(1, 0, Decimal(3)), (2, 0, Decimal(1))],
+    ]
+
+    order_ids, released = reap_expired(conn, now=datetime(2024, 1, 1), batch_size=2)
+
+    assert order_ids == ["a", "b"]
+    assert released == {1: 3, 2: 1}
+    statements = [call.args for call in cursor.execute.call_args_list]
+    assert "FOR UPDATE SKIP LOCKED" in statements[0][0]
+    assert statements[2][0].startswith("UPDATE stock SET held = held - CASE item_id")
+    assert statements[3][1] == (RELEASED, "a", "b")
+    conn.commit.assert_called_once()
+
+
+def test_reaper_survives_database_errors():
+    """A failed rebuild of available stock is retried on the next pass"""
+    pool, available_stock = MagicMock(), MagicMock()
+    lock_cursor = pool.acquire.return_value.cursor.return_value.__enter__.return_value
+    lock_cursor.fetchall.return_value = []
+    cursor = pool.borrow.return_value.__enter__.return_value
+    cursor = cursor.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [OperationalError("gone away"), [(1, 5)]]
+
+    with patch("common.reservations.time.sleep", side_effect=[None, KeyboardInterrupt]):
+        with pytest.raises(KeyboardInterrupt):
+            run_reaper(pool, MagicMock(), available_stock)
+
+    available_stock.rebuild.assert_called_once_with([(1, 5)])
+    # The lock connection is replaced after the error
+    assert pool.acquire.call_count == 2
@@ -0,0 +1,99 @@
+import random
+from unittest.mock import MagicMock
+
+import pytest
+
+from common.reservations import end_holds, take_stock
+from common.stock_shards import (
+    ShardsDrained,
+    pick_shards,
+    set_shards,
+    spread_over_shards,
+    with_locked_retry,
+)
+
+# (quantity, held, version) per shard of item 7
+SHARDS = {7: {1: (10, 8, 4), 2: (5, 0, 2), 3: (9, 0, 1)}}
+
+
+def test_pick_shards_only_picks_shards_with_room():
+    """A line goes to one shard that alone has enough free units"""
+    for seed in range(20):
+        lines = pick_shards(SHARDS, {7: 6}, rng=random.Random(seed))
+        assert lines == [(7, 3, 6)]
+    assert pick_shards(SHARDS, {7: 10}) is None
+
+
+def test_spread_over_shards_takes_from_the_fullest_first():
+    """Locked takes split a line over shards, and refuse only a real shortage"""
+    assert spread_over_shards(SHARDS, {7: 12}) == [(7, 2, 3), (7, 3, 9)]
+    assert spread_over_shards(SHARDS, {7: 17}) is None
+
+
+def test_take_stock_raises_when_a_picked_shard_drained():
+    """A guarded shard update that misses asks for a locked retry"""
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(7, 1, 10, 0, 4)]
+    cursor.rowcount = 0
+
+    with pytest.raises(ShardsDrained):
+        take_stock(cursor, {7: 2}, hold=True, sharded={7})
+
+    query = cursor.execute.call_args.args[0]
+    assert query.startswith("UPDATE stock_shards SET held = held + CASE WHEN item_id = %s")
+    assert "AND quantity - held >= CASE" in query
+
+
+def test_locked_retry_locks_every_shard_and_keeps_row_lines():
+    """The retry locks shards after the stock rows and returns every line taken"""
+    conn, cursor = MagicMock(), MagicMock()
+    cursor.rowcount = 1
+    cursor.fetchall.return_value = [(7, 1, 3, 0, 4), (7, 2, 4, 0, 2)]
+
+    def take(lock_shards):
+        if not lock_shards:
+            raise ShardsDrained("drained")
+        return take_stock(cursor, {2: 1, 7: 6}, sharded={7}, lock_shards=True)
+
+    lines = with_locked_retry(conn, take)
+
+    conn.rollback.assert_called_once()
+    assert lines == [(2, 0, 1), (7, 1, 2), (7, 2, 4)]
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert statements[0].startswith("UPDATE stock SET quantity = quantity -")
+    assert statements[1].endswith("ORDER BY item_id, shard FOR UPDATE")
+    assert statements[2].startswith("UPDATE stock_shards SET quantity = quantity - CASE")
+
+
+def test_end_holds_updates_the_rows_lines_were_held_on():
+    """Lines held on the stock row and on shards are committed separately"""
+    cursor = MagicMock()
+
+    end_holds(cursor, [(2, 0, 1), (7, 1, 2), (7, 3, 4)], commit=True)
+
+    (row_query, row_params), (shard_query, shard_params) = [
+        call.args for call in cursor.execute.call_args_list
+    ]
+    assert row_query.startswith("UPDATE stock SET quantity = quantity - CASE item_id")
+    assert row_params == (2, 1, 2, 1, 2)
+    assert shard_query.startswith("UPDATE stock_shards SET quantity = quantity - CASE")
+    assert shard_params[-4:] == (7, 1, 7, 3)
+
+
+def test_set_shards_spreads_free_units_and_drops_empty_shards():
+    """Resharding moves every free unit and keeps held ones where they are"""
+    cursor = MagicMock()
+    cursor.fetchone.return_value = (4,)
+    cursor.fetchall.return_value = [(7, 1, 10, 8, 4), (7, 2, 5, 0, 2), (7, 3, 9, 0, 1)]
+
+    assert set_shards(cursor, 7, 1)
+
+    calls = [call.args for call in cursor.execute.call_args_list]
+    # 4 free units on the row plus 2 + 5 + 9 on the shards all go to shard 1
+    assert calls[2] == (
+        "UPDATE stock SET quantity = held + %s, shards = %s, version = version + 1 + %s"
+        " WHERE item_id = %s",
+        (0, 1, 3, 7),
+    )
+    assert calls[3][1][:3] == (7, 1, 20)
+    assert calls[4][1] == (7, 2, 3)
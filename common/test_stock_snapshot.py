@@ -0,0 +1,113 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+from mysql.connector.errors import OperationalError
+
+from common.stock_snapshot import StockSnapshot, publish_stock_changes
+
+
+def row(item_id, quantity, version):
+    return {
+        "item_id": item_id,
+        "item_name": f"item-{item_id}",
+        "quantity": quantity,
+        "max_quantity": 100,
+        "held": 0,
+        "version": version,
+    }
+
+
+def live_snapshot(rows):
+    snapshot = StockSnapshot(MagicMock(return_value=rows), MagicMock())
+    snapshot.reload()
+    snapshot._set_live(True)
+    return snapshot
+
+
+def test_older_rows_never_replace_newer_ones():
+    """An update that arrives after a newer one is ignored"""
+    snapshot = live_snapshot([row(1, 10, 1)])
+
+    snapshot.apply([row(1, 15, 3)])
+    snapshot.apply([row(1, 12, 2)])
+
+    assert json.loads(snapshot.item_body(1))["quantity"] == 15
+
+
+def test_full_reload_drops_deleted_items():
+    """Items missing from a full reload leave the snapshot"""
+    snapshot = live_snapshot([row(1, 10, 1), row(2, 5, 1)])
+
+    snapshot._loader.return_value = [row(2, 5, 1)]
+    snapshot.reload()
+
+    assert [item["item_id"] for item in json.loads(snapshot.list_body()[0])] == [2]
+    assert snapshot.item_body(1) is None
+
+
+def test_bodies_are_serialized_once_per_change():
+    """Reads reuse the serialized body until a row changes"""
+    snapshot = live_snapshot([row(1, 10, 1), row(2, 5, 1)])
+
+    body = snapshot.list_body()
+    assert snapshot.list_body() is body
+    item = snapshot.item_body(2)
+
+    snapshot.apply([row(1, 9, 2)])
+
+    assert snapshot.list_body() is not body
+    assert snapshot.list_body()[1] != body[1]
+    assert snapshot.item_body(2) is item
+    assert json.loads(snapshot.list_body()[0])[0]["quantity"] == 9
+
+
+def test_snapshot_is_not_served_until_live():
+    """Reads fall back to MySQL while the listener is not subscribed"""
+    snapshot = StockSnapshot(MagicMock(return_value=[row(1, 10, 1)]), MagicMock())
+    snapshot.reload()
+
+    assert snapshot.list_body() is None
+    assert snapshot.item_body(1) is None
+
+
+def test_item_id_messages_reload_those_rows():
+    """Writers that only know the changed items make every replica reload them"""
+    redis_client = MagicMock()
+    publish_stock_changes(redis_client, item_ids=[2, 5])
+    channel, data = redis_client.publish.call_args.args
+    snapshot = live_snapshot([])
+
+    snapshot._handle(data)
+
+    assert channel == "stock_snapshot"
+    snapshot._loader.assert_called_with([2, 5])
+
+
+def test_listener_recovers_from_database_errors():
+    """A failed load is retried and the snapshot comes live once it succeeds"""
+    loaded = threading.Event()
+
+    def loader(item_ids):
+        if not loader.failed:
+            loader.failed = True
+            raise OperationalError("gone away")
+        loaded.set()
+        return [row(1, 10, 1)]
+
+    loader.failed = False
+    redis_client = MagicMock()
+    redis_client.pubsub.return_value.get_message.return_value = None
+    snapshot = StockSnapshot(loader, redis_client)
+    snapshot._stop.wait = lambda timeout: snapshot._stop.is_set()
+
+    snapshot.start()
+    try:
+        assert loaded.wait(5)
+        for _ in range(100):
+            if snapshot.list_body() is not None:
+                break
+            threading.Event().wait(0.01)
+        assert json.loads(snapshot.list_body()[0])[0]["quantity"] == 10
+    finally:
+        snapshot.stop()
@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock
+
+import redis
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from common.versions import TableVersions, etag_matches
+
+
+def make_app(versions, loads):
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items(request: Request, response: Response):
+        not_modified = await versions.not_modified(request, response, "stock")
+        if not_modified:
+            return not_modified
+        loads.append(1)
+        return [{"item_id": 1}]
+
+    return app
+
+
+def test_etag_matches_weak_and_lists():
+    """If-None-Match is compared weakly and may list several tags"""
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('W/"xyz", W/"abc"', 'W/"abc"')
+    assert etag_matches("*", 'W/"abc"')
+    assert not etag_matches('W/"xyz"', 'W/"abc"')
+    assert not etag_matches(None, 'W/"abc"')
+
+
+def test_matching_etag_skips_the_load():
+    """A current client copy gets a 304 without loading the data"""
+    client = MagicMock()
+    client.mget.return_value = ["41"]
+    loads = []
+    api = TestClient(make_app(TableVersions(client), loads))
+
+    first = api.get("/items")
+    second = api.get("/items", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert len(loads) == 1
+
+
+def test_bumped_version_changes_the_etag():
+    """A write after the client's copy was served returns the full body"""
+    client = MagicMock()
+    client.mget.return_value = ["41"]
+    api = TestClient(make_app(TableVersions(client), []))
+    etag = api.get("/items").headers["ETag"]
+
+    client.mget.return_value = ["42"]
+    response = api.get("/items", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_redis_outage_serves_without_etag():
+    """Without the counters every request is answered from MySQL"""
+    client = MagicMock()
+    client.mget.side_effect = redis.ConnectionError("down")
+    loads = []
+    api = TestClient(make_app(TableVersions(client), loads))
+
+    response = api.get("/items", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert loads == [1]
+
+
+def test_variant_changes_the_etag():
+    """A response that depends on more than its tables, e.g. the clock, is not a 304"""
+    client = MagicMock()
+    client.mget.return_value = ["41"]
+    variant = ["12:00"]
+    app = FastAPI()
+
+    @app.get("/stats")
+    async def stats(request: Request, response: Response):
+        not_modified = await TableVersions(client).not_modified(
+            request, response, "orders", variant=variant[0]
+        )
+        return not_modified or {}
+
+    api = TestClient(app)
+    etag = api.get("/stats").headers["ETag"]
+    assert api.get("/stats", headers={"If-None-Match": etag}).status_code == 304
+
+    variant[0] = "12:01"
+    response = api.get("/stats", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,127 @@
+"""
+Table version counters for conditional GETs.
+
+Every write path bumps the counter of each table it changed once its
+transaction has committed. List endpoints derive their ETag from the counters
+of the tables they read plus the request URL, so a client whose
+`If-None-Match` still matches gets a 304 without the service touching MySQL.
+
+Counters live in the Redis database shared by all services, because some
+listings join tables owned by another service (deliveries show the status of
+their order). A counter that is missing, e.g. after Redis lost its data,
+restarts from a random value so ETags handed out before can't match again.
+"""
+
+import hashlib
+import logging
+import secrets
+
+import redis
+from fastapi import Response, status
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class TableVersions:
+    """Per-table change counters stored under `<namespace>:<table>`."""
+
+    def __init__(self, redis_client, namespace="table_version"):
+        self.redis = redis_client
+        self.namespace = namespace
+
+    def _key(self, table):
+        return f"{self.namespace}:{table}"
+
+    def bump(self, *tables):
+        """Mark `tables` as changed; call after the write has committed."""
+        pipe = self.redis.pipeline(transaction=False)
+        for table in tables:
+            pipe.set(self._key(table), secrets.randbits(32), nx=True)
+            pipe.incr(self._key(table))
+        try:
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to bump table versions of {tables}: {str(e)}")
+
+    def current(self, *tables):
+        """
+        Return the current counters of `tables`.
+
+        Returns:
+            list: One counter per table, or None if Redis is unavailable
+        """
+        keys = [self._key(table) for table in tables]
+        try:
+            versions = self.redis.mget(keys)
+            if None in versions:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, version in zip(keys, versions):
+                    if version is None:
+                        pipe.set(key, secrets.randbits(32), nx=True)
+                pipe.execute()
+                versions = self.redis.mget(keys)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read table versions of {tables}: {str(e)}")
+            return None
+        return versions
+
+    def etag(self, tables, variant=""):
+        """
+        Build the ETag of a response that reads `tables`.
+
+        Args:
+            tables (tuple): Tables the response is built from
+            variant (str): Anything else the response depends on, e.g. the URL
+
+        Returns:
+            str: Weak ETag, or None if the versions are unavailable
+        """
+        versions = self.current(*tables)
+        if versions is None:
+            return None
+        key = "|".join([variant, *(f"{t}={v}" for t, v in zip(tables, versions))])
+        return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+    async def not_modified(self, request, response, *tables, variant=""):
+        """
+        Tag a GET response with its ETag, or answer 304 if the client's copy is current.
+
+        The versions are read before the data is loaded: a write that commits
+        in between only makes the ETag older than the body, which costs the
+        client one more full response but never hides a change.
+
+        Args:
+            request (Request): Incoming request
+            response (Response): Response whose headers receive the ETag
+            *tables: Tables the response is built from
+            variant (str): Anything else the response depends on besides the
+                URL, e.g. the current time bucket of a sliding window
+
+        Returns:
+            Response: 304 response to return as is, or None to serve the data
+        """
+        variant = f"{request.url.path}?{request.url.query}|{variant}"
+        etag = await run_in_threadpool(self.etag, tables, variant)
+        if etag is None:
+            return None
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return None
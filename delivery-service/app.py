@@ -1,24 +1,56 @@
+import logging
 import os
-from contextlib import contextmanager
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional, Union
 
-import mysql.connector
 from celery import Celery
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from mysql.connector.errors import Error as MySQLError
 from pydantic import BaseModel, field_serializer
 
+from common.changefeed import change_feed_from_env
+from common.courier_index import CourierIndex, load_delivery_persons
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.delivery_view import DELIVERY_VIEW_COLUMNS, DELIVERY_VIEW_SELECT, record_deliveries
+from common.migrate import apply_migrations
+from common.dispatch import (
+    DISPATCH_MODE,
+    dropoff_position,
+    expire_waiting_orders,
+    idle_seconds,
+    lock_dispatch_queue,
+    pickup_distance,
+    record_dispatch_waits,
+)
+from common.order_stats import histogram_percentile
+from common.outbox import enqueue_task
+from common.pagination import (
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    encode_cursor,
+    stream_rows,
+)
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Delivery Service API")
 celery = Celery(os.getenv("TASK_QUEUE_NAME"), broker=os.getenv("TASK_QUEUE_BROKER_URL"))
 
 # MySQL configuration
-db_config = {
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "database": os.getenv("DB_NAME"),
-}
+db_config = db_config_from_env()
+db_pool = ConnectionPool(db_config)
+redis_client = redis_from_env()
+change_feed = change_feed_from_env(redis_client)
+table_versions = TableVersions(redis_client)
+# Idle / en_route delivery persons, see common/courier_index.py
+courier_index = CourierIndex(redis_client)
 
 
 class DeliveryPerson(BaseModel):
@@ -26,6 +58,8 @@ class DeliveryPerson(BaseModel):
     name: str
     phone_number: str
     person_status: str
+    position_x: float = 0.0
+    position_y: float = 0.0
 
 
 class Delivery(BaseModel):
@@ -38,6 +72,8 @@ class Delivery(BaseModel):
     delivery_person_name: str
     order_time: Union[datetime, str]
     delivered_at: Optional[Union[datetime, str]]
+    dropoff_x: Optional[float] = None
+    dropoff_y: Optional[float] = None
 
     @field_serializer("order_time", "delivered_at")
     def serialize_datetime(self, value, _info):
@@ -46,6 +82,12 @@ class Delivery(BaseModel):
         return value
 
 
+class OrderStatus(str, Enum):
+    active = "active"
+    completed = "completed"
+    cancelled = "cancelled"
+
+
 class AssignDeliveryRequest(BaseModel):
     order_id: str
 
@@ -60,21 +102,17 @@ class CreateDeliveryRecordRequest(BaseModel):
     delivery_person_id: int
 
 
-@contextmanager
+class ClaimDeliveryRequest(BaseModel):
+    order_id: str
+    customer_distance: float
+    priority: int = 0
+    dropoff_x: Optional[float] = None
+    dropoff_y: Optional[float] = None
+
+
 def get_db_connection():
-    """Context manager for database connections."""
-    conn = None
-    try:
-        conn = mysql.connector.connect(**db_config)
-        yield conn
-    except MySQLError as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection failed: {str(e)}",
-        )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    """Context manager for pooled database connections."""
+    return db_pool.connection()
 
 
 def get_delivery_personnel(person_status="all"):
@@ -105,43 +143,125 @@ def get_delivery_personnel(person_status="all"):
                 )
 
 
-def get_list_of_deliveries():
+def count_delivery_personnel():
     """
-    Retrieve deliveries from database
+    Count delivery personnel per status
     Returns:
-        list: List of deliveries matching the type criteria
+        dict: Number of idle and en_route delivery persons
     """
-    query = """
-    SELECT
-        dl.id,
-        dl.order_id,
-        o.order_status,
-        o.order_time,
-        o.customer_name,
-        o.customer_distance,
-        dl.delivery_person_id,
-        o.delivered_at,
-        dp.name AS delivery_person_name
-    FROM
-        deliveries dl
-    LEFT JOIN delivery_persons dp 
-    ON
-        dl.delivery_person_id = dp.id
-    LEFT JOIN orders o
-    ON
-        dl.order_id = o.id;"""
+    with get_db_connection() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            try:
+                cursor.execute(
+                    "SELECT person_status, COUNT(*) AS count FROM delivery_persons"
+                    " GROUP BY person_status"
+                )
+                counts = {row["person_status"]: row["count"] for row in cursor.fetchall()}
+            except MySQLError as e:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to count delivery persons: {str(e)}",
+                )
+    return {"idle": counts.get("idle", 0), "en_route": counts.get("en_route", 0)}
+
+
+# Archived deliveries have no view rows; they are read through the join, the
+# merged derived table keeping the indexes of the history tables usable
+HISTORY_DELIVERIES = "({}) AS v".format(
+    DELIVERY_VIEW_SELECT.format(deliveries="deliveries_history", orders="orders_history")
+)
+
+
+def build_deliveries_query(
+    order_status=None,
+    delivery_person_id=None,
+    since=None,
+    until=None,
+    cursor=None,
+    limit=None,
+    include_history=False,
+    peek=True,
+):
+    """
+    Build the keyset-paginated deliveries query.
 
+    Rows are ordered by the (order_time, id) of their order, which has a
+    single delivery since claims are idempotent; `cursor` is the key of the
+    last row of the previous page. Live deliveries are read from
+    delivery_view alone. With `include_history` the same range is read from
+    the archived orders and deliveries and the two are merged. With `peek`
+    one row past `limit` is read to tell whether a next page exists; streams
+    have no next page and read exactly `limit` rows.
+
+    Returns:
+        tuple: SQL query and its parameters
+    """
+    conditions, params = [], []
+    if order_status:
+        conditions.append("order_status = %s")
+        params.append(order_status)
+    if delivery_person_id is not None:
+        conditions.append("delivery_person_id = %s")
+        params.append(delivery_person_id)
+    if since:
+        conditions.append("order_time >= %s")
+        params.append(since)
+    if until:
+        conditions.append("order_time < %s")
+        params.append(until)
+    if cursor:
+        last_order_time, last_order_id = decode_cursor(cursor, 2)
+        conditions.append("(order_time > %s OR (order_time = %s AND order_id > %s))")
+        params.extend([last_order_time, last_order_time, last_order_id])
+
+    columns = ", ".join(DELIVERY_VIEW_COLUMNS)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    order_by = " ORDER BY order_time, order_id"
+    limit_clause = " LIMIT %s" if limit else ""
+    page_rows = limit + 1 if limit and peek else limit
+    if limit:
+        params.append(page_rows)
+    query = f"SELECT {columns} FROM delivery_view{where}{order_by}{limit_clause}"
+    if include_history:
+        # Orders are archived together with their deliveries; each source
+        # contributes at most one page, the outer query merges them
+        history_query = f"SELECT {columns} FROM {HISTORY_DELIVERIES}{where}{order_by}{limit_clause}"
+        query = (
+            f"SELECT * FROM (({query}) UNION ALL ({history_query})) AS d"
+            " ORDER BY order_time, order_id" + limit_clause
+        )
+        params = params * 2 + ([page_rows] if limit else [])
+    return query, tuple(params)
+
+
+def get_list_of_deliveries(limit=None, **filters):
+    """
+    Retrieve deliveries from database
+    Args:
+        limit (int): Page size, or None for every matching delivery
+        **filters: order_status, delivery_person_id, since, until, cursor and
+            include_history, see build_deliveries_query
+    Returns:
+        tuple: List of deliveries and the cursor of the next page (or None)
+    """
+    query, params = build_deliveries_query(limit=limit, **filters)
     with get_db_connection() as conn:
         with conn.cursor(dictionary=True) as cursor:
             try:
-                cursor.execute(query)
-                return cursor.fetchall()
+                cursor.execute(query, params)
+                deliveries = cursor.fetchall()
             except MySQLError as e:
                 conn.rollback()
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to retrieve deliveries: {str(e)}",
                 )
+    next_cursor = None
+    if limit and len(deliveries) > limit:
+        deliveries = deliveries[:limit]
+        next_cursor = encode_cursor(deliveries[-1]["order_time"], deliveries[-1]["order_id"])
+    return deliveries, next_cursor
 
 
 def fetch_delivery_person(person_id):
@@ -167,19 +287,138 @@ def fetch_delivery_person(person_id):
                 )
 
 
+def pop_idle_delivery_person(cursor):
+    """
+    Lock the delivery person popped from the idle index, if MySQL agrees.
+
+    A delivery person indexed as idle who no longer is in MySQL, or whom
+    another transaction holds, is dropped; their next write-through or the
+    reconciler puts them back where they belong.
+    """
+    person_id = courier_index.pop_idle()
+    if person_id is None:
+        return None
+    cursor.execute(
+        """SELECT id, name, position_x, position_y, idle_since FROM delivery_persons
+        WHERE id = %s AND person_status = 'idle'
+        FOR UPDATE SKIP LOCKED""",
+        (person_id,),
+    )
+    return cursor.fetchone()
+
+
+def find_idle_delivery_person(cursor):
+    """Lock an idle delivery person, skipping the ones other claims hold."""
+    cursor.execute(
+        """SELECT id, name, position_x, position_y, idle_since FROM delivery_persons
+        WHERE person_status = 'idle'
+        ORDER BY id LIMIT 1
+        FOR UPDATE SKIP LOCKED"""
+    )
+    return cursor.fetchone()
+
+
 def update_delivery_person_status(person_id, person_status):
     """
     Update the status of a delivery person
+
+    A delivery person who becomes idle sets off from the drop-off point of
+    their last delivery back to the kitchen. With immediate dispatch they
+    also take the next order of the dispatch queue in the same transaction
+    and stay en_route; the delivery of that order is handed to the
+    `deliver_order` task through the outbox. With batch dispatch the matcher
+    assigns them instead. The new state is written through to the courier
+    index once committed.
+
     Args:
         person_id: ID of the delivery person
         person_status (str): New person_status to be set
+    Returns:
+        dict: The order assigned from the dispatch queue, or None
     """
+    assignment = None
+    position = None
+    # Milliseconds, as stored in idle_since and written through to the index
+    now = datetime.now()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
     with get_db_connection() as conn:
-        with conn.cursor() as cursor:
+        # READ COMMITTED: no gap locks on the status index, which claims scan
+        conn.start_transaction(isolation_level="READ COMMITTED")
+        with conn.cursor(dictionary=True) as cursor:
             try:
+                if person_status == "idle":
+                    # Delivery persons ride back from where they dropped off their last order
+                    cursor.execute(
+                        """SELECT dropoff_x, dropoff_y FROM deliveries
+                        WHERE delivery_person_id = %s
+                        ORDER BY id DESC LIMIT 1""",
+                        (person_id,),
+                    )
+                    last_delivery = cursor.fetchone()
+                    if last_delivery and last_delivery["dropoff_x"] is not None:
+                        position = (last_delivery["dropoff_x"], last_delivery["dropoff_y"])
+                if person_status == "idle" and DISPATCH_MODE == "immediate":
+                    lock_dispatch_queue(cursor)
+                    expire_waiting_orders(cursor, now)
+                    cursor.execute(
+                        """SELECT id, order_id, customer_distance, dropoff_x, dropoff_y, enqueued_at
+                        FROM dispatch_queue
+                        ORDER BY priority DESC, id LIMIT 1"""
+                    )
+                    waiting = cursor.fetchone()
+                    if waiting:
+                        if position is None:
+                            cursor.execute(
+                                "SELECT position_x, position_y FROM delivery_persons WHERE id = %s",
+                                (person_id,),
+                            )
+                            person = cursor.fetchone() or {"position_x": 0.0, "position_y": 0.0}
+                            position = (person["position_x"], person["position_y"])
+                        person_status = "en_route"
+                        cursor.execute(
+                            "DELETE FROM dispatch_queue WHERE id = %s", (waiting["id"],)
+                        )
+                        cursor.execute(
+                            """INSERT INTO deliveries
+                            (order_id, delivery_person_id, dropoff_x, dropoff_y)
+                            VALUES (%s, %s, %s, %s)""",
+                            (
+                                waiting["order_id"],
+                                person_id,
+                                waiting["dropoff_x"],
+                                waiting["dropoff_y"],
+                            ),
+                        )
+                        assignment = {
+                            "order_id": waiting["order_id"],
+                            "delivery_id": cursor.lastrowid,
+                            "delivery_person_id": person_id,
+                            "pickup_distance": pickup_distance(*position),
+                        }
+                        record_deliveries(cursor, [assignment["delivery_id"]])
+                        record_dispatch_waits(
+                            cursor, [(now - waiting["enqueued_at"]).total_seconds() * 1000]
+                        )
+                        enqueue_task(
+                            cursor,
+                            "deliver_order",
+                            [
+                                waiting["order_id"],
+                                float(waiting["customer_distance"]),
+                                person_id,
+                                assignment["pickup_distance"],
+                            ],
+                        )
                 cursor.execute(
-                    "UPDATE delivery_persons SET person_status = %s WHERE id = %s",
-                    (person_status, person_id),
+                    """UPDATE delivery_persons SET person_status = %s, idle_since = %s,
+                    position_x = COALESCE(%s, position_x), position_y = COALESCE(%s, position_y)
+                    WHERE id = %s""",
+                    (
+                        person_status,
+                        now if person_status == "idle" else None,
+                        *(position or (None, None)),
+                        person_id,
+                    ),
                 )
                 conn.commit()
             except MySQLError as e:
@@ -188,6 +427,27 @@ def update_delivery_person_status(person_id, person_status):
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to update delivery person status: {str(e)}",
                 )
+    indexed_fields = {"idle_since": now} if person_status == "idle" else {}
+    if position:
+        indexed_fields.update(position_x=position[0], position_y=position[1])
+    courier_index.set_status(person_status, person_id, **indexed_fields)
+    changes = [
+        ("delivery_person", person_id, "status_changed", {"person_status": person_status})
+    ]
+    if assignment:
+        table_versions.bump("delivery_persons", "deliveries")
+        changes.append(
+            (
+                "delivery",
+                assignment["delivery_id"],
+                "created",
+                {"order_id": assignment["order_id"], "delivery_person_id": person_id},
+            )
+        )
+    else:
+        table_versions.bump("delivery_persons")
+    change_feed.publish_many(changes)
+    return assignment
 
 
 def fetch_delivery(delivery_id):
@@ -202,26 +462,7 @@ def fetch_delivery(delivery_id):
         with conn.cursor(dictionary=True) as cursor:
             try:
                 cursor.execute(
-                    """
-                    SELECT
-                        dl.id,
-                        dl.order_id,
-                        o.order_status,
-                        o.order_time,
-                        o.customer_name,
-                        o.customer_distance,
-                        dl.delivery_person_id,
-                        o.delivered_at,
-                        dp.name AS delivery_person_name
-                    FROM
-                        deliveries dl
-                    LEFT JOIN delivery_persons dp 
-                    ON
-                        dl.delivery_person_id = dp.id
-                    LEFT JOIN orders o
-                    ON
-                        dl.order_id = o.id
-                    WHERE dl.id = %s;""",
+                    f"SELECT {', '.join(DELIVERY_VIEW_COLUMNS)} FROM delivery_view WHERE id = %s",
                     (delivery_id,),
                 )
                 return cursor.fetchone()
@@ -250,14 +491,200 @@ def create_delivery_record_in_db(order_id, delivery_person_id):
                     (order_id, delivery_person_id),
                 )
                 delivery_id = cursor.lastrowid
+                record_deliveries(cursor, [delivery_id])
                 conn.commit()
-                return delivery_id
             except MySQLError as e:
                 conn.rollback()
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to create delivery record: {str(e)}",
                 )
+    table_versions.bump("deliveries")
+    change_feed.publish(
+        "delivery",
+        delivery_id,
+        "created",
+        order_id=order_id,
+        delivery_person_id=delivery_person_id,
+    )
+    return delivery_id
+
+
+def claim_delivery_person(order_id, customer_distance, priority=0, dropoff=None):
+    """
+    Assign an idle delivery person to an order, or queue the order for the next one.
+
+    The idle row is locked with SKIP LOCKED, so concurrent claims each get a
+    different delivery person instead of waiting on the same row. When nobody
+    is idle the order joins the dispatch queue, which delivery persons drain
+    as they become idle (see update_delivery_person_status). With batch
+    dispatch every order is queued for the matcher. Claiming again for an
+    order that is queued or already has a delivery returns that state.
+
+    Args:
+        order_id: ID of the order to be delivered
+        customer_distance (float): Distance of the customer, kept with a queued order
+        priority (int): Queued orders with a higher priority are assigned first
+        dropoff (tuple): (x, y) of the customer, derived from the distance if None
+    Returns:
+        dict: The assignment, or the queued state of the order
+    """
+    dropoff = dropoff or dropoff_position(order_id, customer_distance)
+    queued = {"order_id": order_id, "assigned": False, "queued": True}
+    with get_db_connection() as conn:
+        # READ COMMITTED: no gap locks on the status index, and every check
+        # below sees what concurrent dispatch transactions committed
+        conn.start_transaction(isolation_level="READ COMMITTED")
+        with conn.cursor(dictionary=True) as cursor:
+            try:
+                # The queue is checked before the deliveries: a queued order
+                # leaves the queue in the transaction that creates its delivery
+                cursor.execute(
+                    "SELECT id FROM dispatch_queue WHERE order_id = %s", (order_id,)
+                )
+                if cursor.fetchone():
+                    conn.rollback()
+                    return queued
+                cursor.execute(
+                    "SELECT id, delivery_person_id FROM deliveries WHERE order_id = %s",
+                    (order_id,),
+                )
+                existing = cursor.fetchone()
+                if existing:
+                    conn.rollback()
+                    return {
+                        "order_id": order_id,
+                        "assigned": True,
+                        "delivery_id": existing["id"],
+                        "delivery_person_id": existing["delivery_person_id"],
+                    }
+
+                now = datetime.now()
+                immediate = DISPATCH_MODE == "immediate"
+                delivery_person = None
+                if immediate:
+                    # The index usually names an idle delivery person right away
+                    delivery_person = pop_idle_delivery_person(cursor)
+                    delivery_person = delivery_person or find_idle_delivery_person(cursor)
+                if not delivery_person:
+                    # Look again under the queue lock: a delivery person who
+                    # went idle meanwhile has either seen the queue empty and
+                    # committed, or will see this order
+                    lock_dispatch_queue(cursor)
+                    expire_waiting_orders(cursor, now)
+                    if immediate:
+                        delivery_person = find_idle_delivery_person(cursor)
+                    if not delivery_person:
+                        cursor.execute(
+                            """INSERT INTO dispatch_queue
+                            (order_id, customer_distance, dropoff_x, dropoff_y, priority, enqueued_at)
+                            VALUES (%s, %s, %s, %s, %s, %s)
+                            ON DUPLICATE KEY UPDATE id = id""",
+                            (order_id, customer_distance, *dropoff, priority, now),
+                        )
+                        conn.commit()
+                        return queued
+
+                cursor.execute(
+                    """UPDATE delivery_persons SET person_status = 'en_route', idle_since = NULL
+                    WHERE id = %s""",
+                    (delivery_person["id"],),
+                )
+                cursor.execute(
+                    """INSERT INTO deliveries
+                    (order_id, delivery_person_id, dropoff_x, dropoff_y)
+                    VALUES (%s, %s, %s, %s)""",
+                    (order_id, delivery_person["id"], *dropoff),
+                )
+                delivery_id = cursor.lastrowid
+                record_deliveries(cursor, [delivery_id])
+                record_dispatch_waits(cursor, [0])
+                conn.commit()
+            except MySQLError as e:
+                conn.rollback()
+                if delivery_person:
+                    courier_index.restore_idle(delivery_person["id"])
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to claim delivery person: {str(e)}",
+                )
+    courier_index.set_status("en_route", delivery_person["id"])
+    table_versions.bump("delivery_persons", "deliveries")
+    change_feed.publish_many(
+        [
+            (
+                "delivery_person",
+                delivery_person["id"],
+                "status_changed",
+                {"person_status": "en_route"},
+            ),
+            (
+                "delivery",
+                delivery_id,
+                "created",
+                {"order_id": order_id, "delivery_person_id": delivery_person["id"]},
+            ),
+        ]
+    )
+    return {
+        "order_id": order_id,
+        "assigned": True,
+        "delivery_id": delivery_id,
+        "delivery_person_id": delivery_person["id"],
+        "delivery_person_name": delivery_person["name"],
+        "pickup_distance": pickup_distance(
+            delivery_person["position_x"],
+            delivery_person["position_y"],
+            idle_seconds(delivery_person["idle_since"], now),
+        ),
+    }
+
+
+def get_dispatch_stats():
+    """
+    Summarize the dispatch queue and the claim-to-assignment waits.
+
+    Returns:
+        dict: Queue length, age of its oldest entry and wait time summary
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute("SELECT COUNT(*), MIN(enqueued_at) FROM dispatch_queue")
+                waiting, oldest = cursor.fetchone()
+                cursor.execute(
+                    "SELECT bucket, order_count, total_ms FROM dispatch_wait_histogram"
+                    " ORDER BY bucket"
+                )
+                buckets = [
+                    (bucket, int(count), int(total_ms))
+                    for bucket, count, total_ms in cursor.fetchall()
+                ]
+            except MySQLError as e:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to retrieve dispatch statistics: {str(e)}",
+                )
+    dispatched = sum(count for _, count, _ in buckets)
+    total_ms = sum(wait for _, _, wait in buckets)
+
+    def seconds(wait_ms):
+        return None if wait_ms is None else round(wait_ms / 1000, 3)
+
+    return {
+        "waiting": int(waiting),
+        "oldest_wait_seconds": (
+            round((datetime.now() - oldest).total_seconds(), 1) if oldest else None
+        ),
+        "dispatched": dispatched,
+        "wait": {
+            "mean_seconds": seconds(total_ms / dispatched) if dispatched else None,
+            "p50_seconds": seconds(histogram_percentile(buckets, dispatched, 50)),
+            "p95_seconds": seconds(histogram_percentile(buckets, dispatched, 95)),
+            "p99_seconds": seconds(histogram_percentile(buckets, dispatched, 99)),
+        },
+    }
 
 
 def fetch_order(order_id):
@@ -282,39 +709,130 @@ def fetch_order(order_id):
 
 
 @app.get("/delivery_persons", response_model=List[DeliveryPerson])
-async def get_delivery_personnel_list():
+async def get_delivery_personnel_list(request: Request, response: Response):
     """Get a list of all delivery personnel"""
-    return get_delivery_personnel()
+    not_modified = await table_versions.not_modified(request, response, "delivery_persons")
+    if not_modified:
+        return not_modified
+    return await db_pool.run(get_delivery_personnel)
 
 
 @app.get("/delivery_persons/en_route", response_model=List[DeliveryPerson])
-async def get_delivery_personnel_list_en_route():
+async def get_delivery_personnel_list_en_route(request: Request, response: Response):
     """Get a list of delivery personnel who are currently delivering"""
-    return get_delivery_personnel(person_status="en_route")
+    not_modified = await table_versions.not_modified(request, response, "delivery_persons")
+    if not_modified:
+        return not_modified
+    indexed = await run_in_threadpool(courier_index.members, "en_route")
+    if indexed is not None:
+        return indexed
+    return await db_pool.run(get_delivery_personnel, person_status="en_route")
 
 
 @app.get("/delivery_persons/idle", response_model=List[DeliveryPerson])
-async def get_idle_delivery_personnel_list():
+async def get_idle_delivery_personnel_list(request: Request, response: Response):
     """Get a list of available delivery personnel"""
-    return get_delivery_personnel(person_status="idle")
+    not_modified = await table_versions.not_modified(request, response, "delivery_persons")
+    if not_modified:
+        return not_modified
+    indexed = await run_in_threadpool(courier_index.members, "idle")
+    if indexed is not None:
+        return indexed
+    return await db_pool.run(get_delivery_personnel, person_status="idle")
+
+
+@app.get("/delivery_persons/counts", response_model=dict)
+async def get_delivery_personnel_counts():
+    """Get the number of idle and en_route delivery personnel"""
+    counts = await run_in_threadpool(courier_index.counts)
+    if counts is not None:
+        return counts
+    return await db_pool.run(count_delivery_personnel)
 
 
 @app.get("/delivery_persons/{person_id}", response_model=DeliveryPerson)
 async def get_delivery_person(person_id: int):
     """Get details of a specific delivery person"""
-    return fetch_delivery_person(person_id)
+    return await db_pool.run(fetch_delivery_person, person_id)
+
+
+def delivery_list_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    delivery_person_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: bool = False,
+    include_history: bool = False,
+):
+    """Query parameters shared by the delivery listing endpoints."""
+    return {
+        "limit": limit,
+        "cursor": cursor,
+        "delivery_person_id": delivery_person_id,
+        "since": since,
+        "until": until,
+        "stream": stream,
+        "include_history": include_history,
+    }
+
+
+async def list_deliveries(order_status, request, response, params):
+    """Serve one page of deliveries, or every matching delivery as an NDJSON stream."""
+    # Deliveries show the status and timestamps of their order
+    not_modified = await table_versions.not_modified(
+        request, response, "deliveries", "orders", "delivery_persons"
+    )
+    if not_modified:
+        return not_modified
+    params = dict(params, order_status=order_status)
+    if params.pop("stream"):
+        query, query_params = build_deliveries_query(peek=False, **params)
+        etag = response.headers.get("ETag")
+        return StreamingResponse(
+            stream_rows(get_db_connection, query, query_params),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"ETag": etag} if etag else None,
+        )
+    deliveries, next_cursor = await db_pool.run(get_list_of_deliveries, **params)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return deliveries
 
 
 @app.get("/deliveries", response_model=List[Delivery])
-async def get_all_deliveries():
-    """Get a list of all deliveries"""
-    return get_list_of_deliveries()
+async def get_all_deliveries(
+    request: Request,
+    response: Response,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    params: dict = Depends(delivery_list_params),
+):
+    """Get a list of deliveries, optionally filtered by the status of their order"""
+    return await list_deliveries(
+        order_status.value if order_status else None, request, response, params
+    )
+
+
+@app.get("/deliveries/active", response_model=List[Delivery])
+async def get_active_deliveries(
+    request: Request, response: Response, params: dict = Depends(delivery_list_params)
+):
+    """Get a list of deliveries whose order is still active"""
+    return await list_deliveries("active", request, response, params)
+
+
+@app.get("/deliveries/completed", response_model=List[Delivery])
+async def get_completed_deliveries(
+    request: Request, response: Response, params: dict = Depends(delivery_list_params)
+):
+    """Get a list of deliveries whose order was delivered"""
+    return await list_deliveries("completed", request, response, params)
 
 
 @app.get("/deliveries/{delivery_id}", response_model=Delivery)
 async def get_delivery(delivery_id: int):
     """Get details of a specific delivery"""
-    delivery = fetch_delivery(delivery_id)
+    delivery = await db_pool.run(fetch_delivery, delivery_id)
     if not delivery:
         raise HTTPException(status_code=404, detail="Delivery not found")
     return delivery
@@ -324,12 +842,14 @@ async def get_delivery(delivery_id: int):
 async def assign_delivery(request: AssignDeliveryRequest):
     """Queue the delivery simulation task"""
     # Fetch order to get customer_distance
-    order = fetch_order(request.order_id)
+    order = await db_pool.run(fetch_order, request.order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    task = celery.send_task(
-        "simulate_delivery", args=[request.order_id, order["customer_distance"]]
+    task = await run_in_threadpool(
+        celery.send_task,
+        "simulate_delivery",
+        args=[request.order_id, order["customer_distance"]],
     )
     return {"order_id": request.order_id, "task_id": task.id}
 
@@ -341,19 +861,73 @@ async def update_delivery_person(request: UpdateDeliveryPersonStatusRequest):
         raise HTTPException(
             status_code=400, detail="Invalid status. Must be 'idle' or 'en_route'"
         )
-    update_delivery_person_status(request.person_id, request.person_status)
-    return {"message": "Delivery person status updated"}
+    assignment = await db_pool.run(
+        update_delivery_person_status, request.person_id, request.person_status
+    )
+    return {
+        "message": "Delivery person status updated",
+        "assigned_order_id": assignment["order_id"] if assignment else None,
+    }
 
 
 @app.post("/create_delivery_record", response_model=dict)
 async def create_delivery_record(request: CreateDeliveryRecordRequest):
     """Create a new delivery record"""
-    delivery_id = create_delivery_record_in_db(
-        request.order_id, request.delivery_person_id
+    delivery_id = await db_pool.run(
+        create_delivery_record_in_db, request.order_id, request.delivery_person_id
     )
     return {"message": "Delivery created", "delivery_id": delivery_id}
 
 
+@app.post("/dispatch/claim", response_model=dict)
+async def dispatch_claim(request: ClaimDeliveryRequest):
+    """
+    Atomically assign an idle delivery person to an order.
+
+    Returns `assigned: false, queued: true` when nobody is idle (or dispatch
+    runs in batches); the order is then assigned by the next delivery person
+    who becomes idle or by the matcher, which queue the `deliver_order` task.
+    """
+    return await db_pool.run(
+        claim_delivery_person,
+        request.order_id,
+        request.customer_distance,
+        request.priority,
+        (request.dropoff_x, request.dropoff_y) if request.dropoff_x is not None else None,
+    )
+
+
+@app.get("/dispatch/stats", response_model=dict)
+async def dispatch_stats():
+    """Get the dispatch queue length and the time orders waited for a delivery person"""
+    return await db_pool.run(get_dispatch_stats)
+
+
+@app.get("/db_pool_stats", response_model=dict)
+async def db_pool_stats():
+    """Get connection pool usage counters for this replica."""
+    return db_pool.stats()
+
+
+@app.on_event("startup")
+def run_migrations():
+    apply_migrations(db_pool)
+    # Replicas share the index; each rebuilds it from MySQL when it starts.
+    # If MySQL is not reachable yet the reconciler builds it later.
+    try:
+        rows = load_delivery_persons(db_pool)
+    except (MySQLError, PoolTimeoutError) as e:
+        logger.warning(f"Failed to load delivery persons for the index: {str(e)}")
+    else:
+        if courier_index.rebuild(rows):
+            table_versions.bump("delivery_persons")
+
+
+@app.on_event("shutdown")
+def close_db_pool():
+    db_pool.close()
+
+
 if __name__ == "__main__":
     import uvicorn
 
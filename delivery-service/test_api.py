@@ -15,6 +15,10 @@ Steps to run the tests:
     `pytest -v test_api.py`
 """
 
+import json
+import math
+from datetime import datetime, timedelta
+
 import pytest
 from app import app
 from unittest.mock import patch, MagicMock
@@ -184,3 +188,213 @@ def test_no_idle_personnel(client, mock_db_connection):
 
     assert response.status_code == 400
     assert response.json["error"] == "No delivery personnel available"
+
+
+@pytest.fixture
+def api_client():
+    """Configure test client for the FastAPI application (startup hooks skipped)"""
+    from fastapi.testclient import TestClient
+    from app import db_pool
+
+    yield TestClient(app)
+    # Drop pooled connections so the next test sees its own mocked connection
+    db_pool.close()
+
+
+def test_dispatch_claim_assigns_idle_person(api_client, mock_db_connection):
+    """An idle delivery person is locked, marked en_route and given the delivery"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchone.side_effect = [
+        None,
+        None,
+        {
+            "id": 3,
+            "name": "Alice Smith",
+            "position_x": 3.0,
+            "position_y": 4.0,
+            "idle_since": None,
+        },
+    ]
+    mock_db_connection.lastrowid = 42
+
+    response = api_client.post(
+        "/dispatch/claim",
+        json={"order_id": "abc", "customer_distance": 4.5, "dropoff_x": 4.5, "dropoff_y": 0},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "assigned": True,
+        "order_id": "abc",
+        "delivery_id": 42,
+        "delivery_person_id": 3,
+        "delivery_person_name": "Alice Smith",
+        "pickup_distance": 5.0,
+    }
+    calls = mock_db_connection.execute.call_args_list
+    assert "FOR UPDATE SKIP LOCKED" in calls[2].args[0]
+    assert calls[3].args[0].startswith("UPDATE delivery_persons SET person_status = 'en_route'")
+    assert "INSERT INTO deliveries" in calls[4].args[0]
+    assert calls[4].args[1] == ("abc", 3, 4.5, 0.0)
+    assert calls[5].args[0].startswith("INSERT INTO delivery_view")
+    assert calls[6].args[0].startswith("INSERT INTO dispatch_wait_histogram")
+
+
+def test_dispatch_claim_nobody_idle(api_client, mock_db_connection):
+    """Without an idle delivery person the order joins the dispatch queue"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchone.side_effect = [None, None, None, {"id": 1}, None]
+    mock_db_connection.fetchall.return_value = []
+
+    response = api_client.post(
+        "/dispatch/claim", json={"order_id": "abc", "customer_distance": 4.5}
+    )
+
+    assert response.json() == {"order_id": "abc", "assigned": False, "queued": True}
+    calls = mock_db_connection.execute.call_args_list
+    assert "FROM dispatch_mutex" in calls[3].args[0]
+    assert "FOR UPDATE SKIP LOCKED" in calls[5].args[0]
+    assert "INSERT INTO dispatch_queue" in calls[6].args[0]
+    order_id, customer_distance, dropoff_x, dropoff_y, priority, _ = calls[6].args[1]
+    assert (order_id, customer_distance, priority) == ("abc", 4.5, 0)
+    # Drop-off derived from the distance to the kitchen
+    assert math.hypot(dropoff_x, dropoff_y) == pytest.approx(4.5)
+
+
+def test_idle_delivery_person_takes_next_queued_order(api_client, mock_db_connection):
+    """Going idle starts from the last drop-off and assigns the head of the queue"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = []
+    mock_db_connection.fetchone.side_effect = [
+        {"dropoff_x": 0.0, "dropoff_y": -2.0},
+        {"id": 1},
+        {
+            "id": 7,
+            "order_id": "abc",
+            "customer_distance": 4.5,
+            "dropoff_x": 4.5,
+            "dropoff_y": 0.0,
+            "enqueued_at": datetime.now() - timedelta(seconds=30),
+        },
+    ]
+    mock_db_connection.lastrowid = 42
+
+    response = api_client.post(
+        "/update_delivery_person_status", json={"person_id": 3, "person_status": "idle"}
+    )
+
+    assert response.json()["assigned_order_id"] == "abc"
+    calls = mock_db_connection.execute.call_args_list
+    outbox = [call for call in calls if "INSERT INTO task_outbox" in call.args[0]]
+    assert outbox[0].args[1][1] == "deliver_order"
+    assert json.loads(outbox[0].args[1][2]) == ["abc", 4.5, 3, 2.0]
+    assert calls[-1].args[0].startswith("UPDATE delivery_persons SET person_status")
+    assert calls[-1].args[1] == ("en_route", None, 0.0, -2.0, 3)
+
+
+def test_build_deliveries_query_keyset():
+    """Delivery pages continue after the (order_time, id) of the cursor's order"""
+    from app import build_deliveries_query
+    from common.pagination import encode_cursor
+
+    cursor = encode_cursor("2023-01-01T12:00:00", "abc")
+    query, params = build_deliveries_query(
+        "active", delivery_person_id=3, cursor=cursor, limit=50
+    )
+
+    assert "FROM delivery_view WHERE" in query
+    assert "JOIN" not in query
+    assert "order_status = %s AND delivery_person_id = %s" in query
+    assert "(order_time > %s OR (order_time = %s AND order_id > %s))" in query
+    assert query.endswith("ORDER BY order_time, order_id LIMIT %s")
+    assert params == (
+        "active",
+        3,
+        "2023-01-01T12:00:00",
+        "2023-01-01T12:00:00",
+        "abc",
+        51,
+    )
+
+
+def test_build_deliveries_query_stream_reads_exactly_limit():
+    """Streams have no next page, so they don't read the extra row of a page"""
+    from app import build_deliveries_query
+
+    _, params = build_deliveries_query("completed", limit=10, peek=False)
+    assert params == ("completed", 10)
+
+    _, params = build_deliveries_query("completed", limit=10, include_history=True, peek=False)
+    assert params == ("completed", 10, "completed", 10, 10)
+
+
+def test_build_deliveries_query_with_history():
+    """History pages merge one page from the live and one from the archived tables"""
+    from app import build_deliveries_query
+
+    query, params = build_deliveries_query("completed", limit=10, include_history=True)
+
+    assert "FROM delivery_view WHERE" in query
+    assert "FROM deliveries_history dl" in query
+    assert "JOIN orders_history o" in query
+    assert query.endswith("ORDER BY order_time, order_id LIMIT %s")
+    assert params == ("completed", 11, "completed", 11, 11)
+
+
+def test_get_active_deliveries_paginated(api_client, mock_db_connection):
+    """A full page of active deliveries returns the cursor of its last row"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = [
+        {
+            "id": number,
+            "order_id": f"order-{number}",
+            "order_status": "active",
+            "customer_name": "John Doe",
+            "customer_distance": 5.0,
+            "delivery_person_id": 1,
+            "delivery_person_name": "Alice Smith",
+            "order_time": datetime(2023, 1, 1, 12, number),
+            "delivered_at": None,
+        }
+        for number in range(3)
+    ]
+
+    response = api_client.get("/deliveries/active", params={"limit": 2})
+
+    assert response.status_code == 200
+    assert [delivery["id"] for delivery in response.json()] == [0, 1]
+    assert "X-Next-Cursor" in response.headers
+    query, params = mock_db_connection.execute.call_args.args
+    assert "FROM delivery_view WHERE order_status = %s" in query
+    assert params == ("active", 3)
+
+
+def test_dispatch_claim_takes_indexed_idle_person(api_client, mock_db_connection, mocker):
+    """The delivery person popped from the index is checked and locked by id"""
+    from app import courier_index
+
+    mocker.patch.object(courier_index, "pop_idle", return_value=3)
+    set_status = mocker.patch.object(courier_index, "set_status")
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchone.side_effect = [
+        None,
+        None,
+        {
+            "id": 3,
+            "name": "Alice Smith",
+            "position_x": 0.0,
+            "position_y": 0.0,
+            "idle_since": None,
+        },
+    ]
+    mock_db_connection.lastrowid = 42
+
+    response = api_client.post(
+        "/dispatch/claim", json={"order_id": "abc", "customer_distance": 4.5}
+    )
+
+    assert response.json()["delivery_person_id"] == 3
+    calls = mock_db_connection.execute.call_args_list
+    assert "WHERE id = %s AND person_status = 'idle'" in calls[2].args[0]
+    assert calls[2].args[1] == (3,)
+    set_status.assert_called_once_with("en_route", 3)
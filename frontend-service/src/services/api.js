@@ -48,6 +48,9 @@ export default {
   getIdlePersons() {
     return api.get('/delivery_persons/idle')
   },
+  getDeliveryPersonCounts() {
+    return api.get('/delivery_persons/counts')
+  },
   getDeliveryPerson(personId) {
     return api.get(`/delivery_persons/${personId}`)
   },
@@ -56,8 +59,13 @@ export default {
   },
 
   // Deliveries
-  getAllDeliveries() {
-    return api.get('/deliveries')
+  // One page of deliveries; pass the X-Next-Cursor header of a page as
+  // `cursor` to get the next one
+  getDeliveries(params) {
+    return api.get('/deliveries', { params })
+  },
+  getActiveDeliveries(params) {
+    return api.get('/deliveries/active', { params })
   },
   getDelivery(deliveryId) {
     return api.get(`/deliveries/${deliveryId}`)
@@ -81,5 +89,15 @@ export default {
   },
   validateStock(stockData) {
     return api.post('/validate_stock', stockData)
+  },
+
+  // Change feed (server-sent events). The browser resumes from the last
+  // received sequence number on reconnect via the Last-Event-ID header.
+  subscribeChanges(onChange) {
+    const source = new EventSource(`${API_BASE_URL}/changes`)
+    for (const entity of ['order', 'delivery', 'delivery_person', 'reset']) {
+      source.addEventListener(entity, event => onChange(entity, JSON.parse(event.data)))
+    }
+    return source
   }
 }
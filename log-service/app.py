@@ -19,9 +19,7 @@ def log_data(endpoint, data):
 def collect_logs():
     endpoints = {
         "stock": "http://stock-service:5003/current_stock",
-        "orders": "http://order-service:5001/orders",
-        "active_orders": "http://order-service:5001/orders/active",
-        "completed_orders": "http://order-service:5001/orders/completed"
+        "order_stats": "http://order-service:5001/orders/stats"
     }
 
     while True:
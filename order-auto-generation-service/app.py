@@ -86,7 +86,7 @@ def make_request(method, url, **kwargs):
     return response
 
 
-response = make_request("GET", f"{STOCK_SERVICE_URL}/current_stock")
+response = make_request("GET", f"{STOCK_SERVICE_URL}/catalog")
 ITEMS = [x["item_id"] for x in response.json()]
 print(">>> ITEMS:", ITEMS)
 
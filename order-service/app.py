@@ -1,25 +1,54 @@
 import os
-import uuid
-from contextlib import contextmanager
 from datetime import datetime
-from typing import List
+from enum import Enum
+from typing import List, Optional
 
-import mysql.connector
-from celery import Celery
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from mysql.connector.errors import Error as MySQLError
 from pydantic import BaseModel
 
+from common.cache import ReadThroughCache
+from common.catalog import CATALOG_QUERY, Catalog
+from common.changefeed import change_feed_from_env
+from common.db import ConnectionPool, db_config_from_env
+from common.delivery_view import record_order_statuses
+from common.ids import order_id_generator
+from common.migrate import apply_migrations
+from common.order_stats import load_stats, minute_of, record_created, record_transitions
+from common.outbox import enqueue_task
+from common.redis_store import redis_from_env
+from common.versions import TableVersions
+from common.pagination import (
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    encode_cursor,
+    stream_rows,
+)
+
 app = FastAPI(title="Order Service API")
-celery = Celery(os.getenv("TASK_QUEUE_NAME"), broker=os.getenv("TASK_QUEUE_BROKER_URL"))
 
 # MySQL configuration
-db_config = {
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "database": os.getenv("DB_NAME"),
-}
+db_config = db_config_from_env()
+db_pool = ConnectionPool(db_config)
+redis_client = redis_from_env()
+change_feed = change_feed_from_env(redis_client)
+table_versions = TableVersions(redis_client)
+# Item names for order details, see common/catalog.py
+catalog = Catalog(lambda: load_catalog(), table_versions)
+
+# Read-through cache of /order/{order_id}, invalidated by every order write
+ORDER_CACHE_TTL = int(os.getenv("ORDER_CACHE_TTL", "300"))
+order_cache = ReadThroughCache(redis_client, "order_details", ORDER_CACHE_TTL)
+
+# Time-ordered ULIDs by default, see ORDER_ID_SCHEME in common/ids.py
+next_order_id = order_id_generator()
+
+# Largest number of orders accepted by a single /create_orders call
+MAX_ORDER_BATCH_SIZE = int(os.getenv("MAX_ORDER_BATCH_SIZE", "500"))
 
 
 class OrderItem(BaseModel):
@@ -33,30 +62,47 @@ class CreateOrderRequest(BaseModel):
     items: List[OrderItem]
 
 
+class CreateOrdersRequest(BaseModel):
+    orders: List[CreateOrderRequest]
+
+
+class OrderStatus(str, Enum):
+    active = "active"
+    completed = "completed"
+    cancelled = "cancelled"
+
+
+class OrderEvent(BaseModel):
+    order_id: str
+    order_status: Optional[OrderStatus] = None
+    message: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+
+class OrderEventsRequest(BaseModel):
+    events: List[OrderEvent]
+
+
 class UpdateOrderRequest(BaseModel):
     order_id: str
     message: str
 
 
-@contextmanager
 def get_db_connection():
-    """Context manager for database connections."""
-    conn = None
-    try:
-        conn = mysql.connector.connect(**db_config)
-        yield conn
-    except MySQLError as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection failed: {str(e)}",
-        )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    """Context manager for pooled database connections."""
+    return db_pool.connection()
 
 
 def update_order_with_items(order, items):
-    """Insert a new order and its items in a single transaction."""
+    """
+    Insert a new order and its items in a single transaction.
+
+    The process_order task is written to the outbox in the same transaction
+    and published by the outbox relay.
+
+    Returns:
+        str: Id of the queued process_order task
+    """
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
@@ -82,6 +128,19 @@ def update_order_with_items(order, items):
                     values,
                 )
 
+                record_created(cursor, [order["order_time"]])
+
+                # Queue the process_order task
+                task_id = enqueue_task(
+                    cursor,
+                    "process_order",
+                    [
+                        order["id"],
+                        order["customer_distance"],
+                        [item.dict() for item in items],
+                    ],
+                )
+
                 conn.commit()
             except MySQLError as e:
                 conn.rollback()
@@ -89,6 +148,16 @@ def update_order_with_items(order, items):
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to create order with items: {str(e)}",
                 )
+    order_cache.invalidate(order["id"])
+    table_versions.bump("orders")
+    change_feed.publish(
+        "order",
+        order["id"],
+        "created",
+        order_status=order["order_status"],
+        customer_name=order["customer_name"],
+    )
+    return task_id
 
 
 def update_order(order):
@@ -142,6 +211,30 @@ def update_order_items(order_id, items: List[OrderItem]):
                 )
 
 
+def record_order_events(cursor, events):
+    """
+    Append transitions to the order_events history within the caller's transaction.
+
+    Args:
+        cursor: Cursor of the open transaction
+        events (list): (order_id, order_status, message, event_time) tuples
+    """
+    cursor.executemany(
+        "INSERT INTO order_events (order_id, order_status, message, event_time) VALUES (%s, %s, %s, %s)",
+        events,
+    )
+
+
+# Task ending the stock hold of an order that reaches each final status
+STOCK_TASKS = {"completed": "commit_stock", "cancelled": "release_stock"}
+
+
+def enqueue_stock_task(cursor, order_id, old_status, new_status):
+    """Commit or release the held stock of an order entering a final status."""
+    if new_status != old_status and new_status in STOCK_TASKS:
+        enqueue_task(cursor, STOCK_TASKS[new_status], [order_id])
+
+
 def update_status_of_an_order(order_id, order_status, response_msg=None):
     """
     Update the order_status of an existing order.
@@ -153,8 +246,18 @@ def update_status_of_an_order(order_id, order_status, response_msg=None):
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
+                cursor.execute(
+                    "SELECT order_status, order_time FROM orders WHERE id = %s FOR UPDATE",
+                    (order_id,),
+                )
+                current = cursor.fetchone()
+                if current is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
+                    )
+                event_time = datetime.now().isoformat()
                 if order_status == "completed":
-                    delivered_at = datetime.now().isoformat()
+                    delivered_at = event_time
                     if response_msg:
                         cursor.execute(
                             "UPDATE orders SET order_status = %s, delivered_at = %s, response_msg = %s WHERE id = %s",
@@ -176,10 +279,13 @@ def update_status_of_an_order(order_id, order_status, response_msg=None):
                             "UPDATE orders SET order_status = %s WHERE id = %s",
                             (order_status, order_id),
                         )
-                if cursor.rowcount == 0:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
-                    )
+                record_order_statuses(cursor, [order_id])
+                old_status, order_time = current
+                enqueue_stock_task(cursor, order_id, old_status, order_status)
+                record_transitions(cursor, [(old_status, order_status, order_time, event_time)])
+                record_order_events(
+                    cursor, [(order_id, order_status, response_msg, event_time)]
+                )
                 conn.commit()
             except MySQLError as e:
                 conn.rollback()
@@ -187,6 +293,12 @@ def update_status_of_an_order(order_id, order_status, response_msg=None):
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to update order status: {str(e)}",
                 )
+    order_cache.invalidate(order_id)
+    table_versions.bump("orders")
+    change = {"order_status": order_status, "response_msg": response_msg}
+    if order_status == "completed":
+        change["delivered_at"] = delivered_at
+    change_feed.publish("order", order_id, "status_changed", **change)
 
 
 def update_msg_of_an_order(order_id, response_msg):
@@ -214,6 +326,9 @@ def update_msg_of_an_order(order_id, response_msg):
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
                     )
+                record_order_events(
+                    cursor, [(order_id, None, response_msg, datetime.now().isoformat())]
+                )
                 conn.commit()
             except MySQLError as e:
                 conn.rollback()
@@ -221,35 +336,233 @@ def update_msg_of_an_order(order_id, response_msg):
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to update order message: {str(e)}",
                 )
+    order_cache.invalidate(order_id)
+    table_versions.bump("orders")
+    change_feed.publish("order", order_id, "message_updated", response_msg=response_msg)
 
 
-def get_all_orders(order_type="All"):
+def apply_order_events(events):
+    """
+    Apply an ordered list of transitions for one or many orders in one transaction.
+
+    Every event is appended to order_events, but each order row is updated
+    only once, with its latest status and message.
+
+    Args:
+        events (list): OrderEvent objects in the order they happened
+
+    Returns:
+        dict: Final state applied per order id
+    """
+    final_states = {}
+    status_times = {}
+    history = []
+    for event in events:
+        event_time = (event.timestamp or datetime.now()).isoformat()
+        order_status = event.order_status.value if event.order_status else None
+        history.append((event.order_id, order_status, event.message, event_time))
+
+        state = final_states.setdefault(event.order_id, {})
+        if order_status:
+            state["order_status"] = order_status
+            status_times[event.order_id] = event_time
+            if order_status == "completed":
+                state["delivered_at"] = event_time
+        if event.message:
+            state["response_msg"] = event.message
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                # Lock the orders to find missing ones and count the transitions;
+                # rowcount can't tell, an UPDATE that changes nothing counts 0 rows
+                placeholders = ", ".join(["%s"] * len(final_states))
+                cursor.execute(
+                    f"SELECT id, order_status, order_time FROM orders WHERE id IN ({placeholders})"
+                    " ORDER BY id FOR UPDATE",
+                    tuple(final_states),
+                )
+                current = {row[0]: row[1:] for row in cursor.fetchall()}
+                missing = [order_id for order_id in final_states if order_id not in current]
+                if missing:
+                    conn.rollback()
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Orders not found: {', '.join(missing)}",
+                    )
+                for order_id, state in final_states.items():
+                    assignments = ", ".join(f"{column} = %s" for column in state)
+                    cursor.execute(
+                        f"UPDATE orders SET {assignments} WHERE id = %s",
+                        (*state.values(), order_id),
+                    )
+                record_order_statuses(cursor, list(status_times))
+                for order_id in status_times:
+                    enqueue_stock_task(
+                        cursor,
+                        order_id,
+                        current[order_id][0],
+                        final_states[order_id]["order_status"],
+                    )
+                record_transitions(
+                    cursor,
+                    [
+                        (
+                            current[order_id][0],
+                            final_states[order_id]["order_status"],
+                            current[order_id][1],
+                            changed_at,
+                        )
+                        for order_id, changed_at in status_times.items()
+                    ],
+                )
+                record_order_events(cursor, history)
+                conn.commit()
+            except MySQLError as e:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to apply order events: {str(e)}",
+                )
+
+    order_cache.invalidate(*final_states)
+    table_versions.bump("orders")
+    change_feed.publish_many(
+        [
+            (
+                "order",
+                order_id,
+                "status_changed" if order_status else "message_updated",
+                {"order_status": order_status, "response_msg": message, "at": event_time}
+                if order_status
+                else {"response_msg": message, "at": event_time},
+            )
+            for order_id, order_status, message, event_time in history
+        ]
+    )
+    return final_states
+
+
+def build_orders_query(
+    order_status=None,
+    customer_name=None,
+    since=None,
+    until=None,
+    cursor=None,
+    limit=None,
+    include_history=False,
+    peek=True,
+):
+    """
+    Build the keyset-paginated orders query.
+
+    Rows are ordered by (order_time, id); `cursor` is the key of the last row
+    of the previous page, so each page is an index range scan regardless of
+    how deep the client has paged. With `include_history` the same range is
+    read from orders and orders_history and the two are merged. With `peek`
+    one row past `limit` is read to tell whether a next page exists; streams
+    have no next page and read exactly `limit` rows.
+
+    Returns:
+        tuple: SQL query and its parameters
+    """
+    conditions, params = [], []
+    if order_status:
+        conditions.append("order_status = %s")
+        params.append(order_status)
+    if customer_name:
+        conditions.append("customer_name = %s")
+        params.append(customer_name)
+    if since:
+        conditions.append("order_time >= %s")
+        params.append(since)
+    if until:
+        conditions.append("order_time < %s")
+        params.append(until)
+    if cursor:
+        last_order_time, last_id = decode_cursor(cursor, 2)
+        conditions.append("(order_time > %s OR (order_time = %s AND id > %s))")
+        params.extend([last_order_time, last_order_time, last_id])
+
+    query = "SELECT * FROM orders"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY order_time, id"
+    page_rows = limit + 1 if limit and peek else limit
+    if limit:
+        query += " LIMIT %s"
+        params.append(page_rows)
+    if include_history:
+        # Each table contributes at most one page, the outer query merges them
+        history_query = query.replace("FROM orders", "FROM orders_history", 1)
+        query = (
+            f"SELECT * FROM (({query}) UNION ALL ({history_query})) AS o"
+            " ORDER BY order_time, id"
+        )
+        params = params * 2
+        if limit:
+            query += " LIMIT %s"
+            params.append(page_rows)
+    return query, tuple(params)
+
+
+def get_all_orders(order_type="All", limit=None, **filters):
     """
     Retrieve orders based on their type.
 
     Args:
-        order_type (str): Filter for orders ('active', 'completed', or 'All')
+        order_type (str): Filter for orders ('active', 'completed', 'cancelled' or 'All')
+        limit (int): Page size, or None for every matching order
+        **filters: customer_name, since, until, cursor and include_history,
+            see build_orders_query
 
     Returns:
-        list: List of order dictionaries
+        tuple: List of order dictionaries and the cursor of the next page (or None)
     """
+    order_status = None if order_type == "All" else order_type
+    query, params = build_orders_query(order_status, limit=limit, **filters)
     with get_db_connection() as conn:
         with conn.cursor(dictionary=True) as cursor:
             try:
-                cursor = conn.cursor(dictionary=True)
-                if order_type == "active":
-                    query = "SELECT * FROM orders WHERE order_status = 'active';"
-                elif order_type == "completed":
-                    query = "SELECT * FROM orders WHERE order_status = 'completed';"
-                else:
-                    query = "SELECT * FROM orders;"
-                cursor.execute(query)
-                return cursor.fetchall()
+                cursor.execute(query, params)
+                orders = cursor.fetchall()
             except MySQLError as e:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to retrieve orders: {str(e)}",
                 )
+    next_cursor = None
+    if limit and len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1]["order_time"], orders[-1]["id"])
+    return orders, next_cursor
+
+
+def get_order_stats_from_db(minutes):
+    """Read the incrementally maintained order statistics."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                return load_stats(cursor, minutes)
+            except MySQLError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to get order stats: {str(e)}",
+                )
+
+
+def load_catalog():
+    """Read the item catalog for the in-memory catalog cache."""
+    with get_db_connection() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            try:
+                cursor.execute(CATALOG_QUERY)
+                return cursor.fetchall()
+            except MySQLError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to load item catalog: {str(e)}",
+                )
 
 
 def get_order_details(order_id):
@@ -267,44 +580,72 @@ def get_order_details(order_id):
             try:
                 cursor.execute("SELECT * FROM orders WHERE id = %s", (order_id,))
                 order_details = cursor.fetchone()
+                items_table = "order_items"
+                if not order_details:
+                    # Archived orders keep resolving by id
+                    cursor.execute("SELECT * FROM orders_history WHERE id = %s", (order_id,))
+                    order_details = cursor.fetchone()
+                    items_table = "order_items_history"
                 if not order_details:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
                     )
 
-                get_items_query = """SELECT oi.item_id, s.item_name, oi.quantity 
-                                    FROM order_items oi
-                                    JOIN stock s ON oi.item_id = s.item_id
-                                    WHERE order_id = %s"""
-                cursor.execute(get_items_query, (order_id,))
+                cursor.execute(
+                    f"SELECT item_id, quantity FROM {items_table} WHERE order_id = %s",
+                    (order_id,),
+                )
                 items = cursor.fetchall()
-                order_details["items"] = items
-                return order_details
             except MySQLError as e:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail=f"Failed to retrieve order details: {str(e)}",
                 )
 
+    # Item names come from the in-memory catalog, not from the hot stock rows
+    order_details["items"] = [
+        {
+            "item_id": item["item_id"],
+            "item_name": (catalog.get(item["item_id"]) or {}).get("item_name"),
+            "quantity": item["quantity"],
+        }
+        for item in items
+    ]
+    return order_details
 
-@app.post("/create_order", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def create_order(order_request: CreateOrderRequest):
-    """Create a new order and assign delivery."""
-    if not order_request.items:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order must contain at least one item",
-        )
 
+def get_cached_order_details(order_id):
+    """
+    Get order details through the Redis read-through cache.
+
+    Every write path invalidates the entry after committing, so a cached
+    status is never older than the last committed update.
+    """
+    return order_cache.get_or_load(
+        order_id, lambda: jsonable_encoder(get_order_details(order_id))
+    )
+
+
+def validate_order_request(order_request: CreateOrderRequest):
+    """
+    Check the fields of an order request.
+
+    Returns:
+        str: Reason the order is rejected, or None if it is valid
+    """
+    if not order_request.items:
+        return "Order must contain at least one item"
     if order_request.customer_distance <= 0:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Customer distance must be greater than 0",
-        )
-    order_id = uuid.uuid4().hex
-    order_id = order_id[-8:]
-    order = {
-        "id": order_id,
+        return "Customer distance must be greater than 0"
+    if any(item.quantity <= 0 for item in order_request.items):
+        return "Item quantities must be greater than 0"
+    return None
+
+
+def build_order(order_request: CreateOrderRequest):
+    """Build the orders row for a validated order request."""
+    return {
+        "id": next_order_id(),
         "order_time": datetime.now().isoformat(),
         "customer_name": order_request.customer_name,
         "customer_distance": order_request.customer_distance,
@@ -312,62 +653,348 @@ async def create_order(order_request: CreateOrderRequest):
         "items": order_request.items,
         "response_msg": "Order taken",
     }
-    update_order_with_items(order, order_request.items)
 
-    # Convert Pydantic models to dictionaries for Celery serialization
-    serializable_items = [item.dict() for item in order_request.items]
 
-    # Queue the process_order task
-    task = celery.send_task(
-        "process_order",
-        args=[order["id"], order["customer_distance"], serializable_items],
+def insert_orders_with_items(orders):
+    """
+    Insert a batch of orders and their items in a single transaction.
+
+    Orders referencing an unknown item are rejected individually; all other
+    orders are written with one multi-row INSERT into orders and one into
+    order_items (mysql-connector folds executemany of an INSERT ... VALUES
+    into a single multi-row statement).
+
+    Args:
+        orders (list): Order dictionaries as built by build_order
+
+    A single process_order_batch task for the accepted orders is written to
+    the outbox in the same transaction.
+
+    Returns:
+        tuple: Rejection reason per order id for the orders that were not
+        inserted, and the id of the queued task (None if nothing was inserted)
+    """
+    item_ids = sorted({item.item_id for order in orders for item in order["items"]})
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                placeholders = ", ".join(["%s"] * len(item_ids))
+                cursor.execute(
+                    f"SELECT item_id FROM stock WHERE item_id IN ({placeholders})",
+                    tuple(item_ids),
+                )
+                known_items = {row[0] for row in cursor.fetchall()}
+
+                rejected = {}
+                accepted = []
+                for order in orders:
+                    unknown = [
+                        item.item_id
+                        for item in order["items"]
+                        if item.item_id not in known_items
+                    ]
+                    if unknown:
+                        rejected[order["id"]] = f"Item with ID={unknown[0]} not found"
+                    else:
+                        accepted.append(order)
+
+                if accepted:
+                    cursor.executemany(
+                        """INSERT INTO orders
+                        (id, order_time, customer_name, customer_distance, order_status, response_msg)
+                        VALUES (%s, %s, %s, %s, %s, %s)""",
+                        [
+                            (
+                                order["id"],
+                                order["order_time"],
+                                order["customer_name"],
+                                order["customer_distance"],
+                                order["order_status"],
+                                "Order created",
+                            )
+                            for order in accepted
+                        ],
+                    )
+                    cursor.executemany(
+                        "INSERT INTO order_items (order_id, item_id, quantity) VALUES (%s, %s, %s)",
+                        [
+                            (order["id"], item.item_id, item.quantity)
+                            for order in accepted
+                            for item in order["items"]
+                        ],
+                    )
+                    record_created(cursor, [order["order_time"] for order in accepted])
+                    # One task for the whole batch; the worker fans it out per order
+                    task_id = enqueue_task(
+                        cursor,
+                        "process_order_batch",
+                        [
+                            [
+                                [
+                                    order["id"],
+                                    order["customer_distance"],
+                                    [item.dict() for item in order["items"]],
+                                ]
+                                for order in accepted
+                            ]
+                        ],
+                    )
+                else:
+                    task_id = None
+                conn.commit()
+            except MySQLError as e:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to create orders with items: {str(e)}",
+                )
+    if accepted:
+        order_cache.invalidate(*[order["id"] for order in accepted])
+        table_versions.bump("orders")
+        change_feed.publish_many(
+            [
+                (
+                    "order",
+                    order["id"],
+                    "created",
+                    {
+                        "order_status": order["order_status"],
+                        "customer_name": order["customer_name"],
+                    },
+                )
+                for order in accepted
+            ]
+        )
+    return rejected, task_id
+
+
+@app.post("/create_order", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def create_order(order_request: CreateOrderRequest):
+    """Create a new order and assign delivery."""
+    error = validate_order_request(order_request)
+    if error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+    order = build_order(order_request)
+    task_id = await db_pool.run(update_order_with_items, order, order_request.items)
+    return {"order_id": order["id"], "task_id": task_id}
+
+
+@app.post("/create_orders", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def create_orders(request: CreateOrdersRequest, response: Response):
+    """
+    Create a batch of orders in one transaction and queue their processing.
+
+    Every order is validated on its own; the response lists the outcome of
+    each order in request order, so a batch can partially succeed.
+    """
+    if not request.orders:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch must contain at least one order",
+        )
+    if len(request.orders) > MAX_ORDER_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch must not contain more than {MAX_ORDER_BATCH_SIZE} orders",
+        )
+
+    results = []
+    orders = []
+    for order_request in request.orders:
+        error = validate_order_request(order_request)
+        if error:
+            results.append({"status": "rejected", "error": error})
+        else:
+            order = build_order(order_request)
+            orders.append(order)
+            results.append({"status": "created", "order_id": order["id"]})
+
+    rejected, task_id = (
+        await db_pool.run(insert_orders_with_items, orders) if orders else ({}, None)
     )
-    return {"order_id": order["id"], "task_id": task.id}
+    for result in results:
+        if result.get("order_id") in rejected:
+            result["status"] = "rejected"
+            result["error"] = rejected[result["order_id"]]
+            del result["order_id"]
+
+    created = [order for order in orders if order["id"] not in rejected]
+    if not created:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+
+    return {
+        "created": len(created),
+        "rejected": len(results) - len(created),
+        "task_id": task_id,
+        "results": results,
+    }
 
 
 @app.post("/close_order", response_model=dict)
 async def close_order(request: UpdateOrderRequest):
     """Mark an order as closed."""
-    update_status_of_an_order(request.order_id, "completed", request.message)
+    await db_pool.run(
+        update_status_of_an_order, request.order_id, "completed", request.message
+    )
     return {"order_status": "Order delivered"}
 
 
 @app.post("/cancel_order", response_model=dict)
 async def cancel_order(request: UpdateOrderRequest):
     """Cancel an order."""
-    update_status_of_an_order(request.order_id, "cancelled", request.message)
+    await db_pool.run(
+        update_status_of_an_order, request.order_id, "cancelled", request.message
+    )
     return {"order_status": "Order cancelled"}
 
 
 @app.post("/update_msg", response_model=dict)
 async def update_msg(request: UpdateOrderRequest):
     """Update message for an order."""
-    update_msg_of_an_order(request.order_id, request.message)
+    await db_pool.run(update_msg_of_an_order, request.order_id, request.message)
     return {"order_status": "Order message updated"}
 
 
+@app.post("/order_events", response_model=dict)
+async def order_events(request: OrderEventsRequest):
+    """
+    Apply a batch of order transitions in one call.
+
+    Events are applied in list order; an event sets the status, the message
+    or both.
+    """
+    if not request.events:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one event is required",
+        )
+    if any(not event.order_status and not event.message for event in request.events):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Each event must set an order_status or a message",
+        )
+    final_states = await db_pool.run(apply_order_events, request.events)
+    return {"applied": len(request.events), "orders": final_states}
+
+
+def order_list_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    customer_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    stream: bool = False,
+    include_history: bool = False,
+):
+    """Query parameters shared by the order listing endpoints."""
+    return {
+        "limit": limit,
+        "cursor": cursor,
+        "customer_name": customer_name,
+        "since": since,
+        "until": until,
+        "stream": stream,
+        "include_history": include_history,
+    }
+
+
+async def list_orders(order_type, request, response, params):
+    """Serve one page of orders, or every matching order as an NDJSON stream."""
+    not_modified = await table_versions.not_modified(request, response, "orders")
+    if not_modified:
+        return not_modified
+    params = dict(params)
+    if params.pop("stream"):
+        order_status = None if order_type == "All" else order_type
+        query, query_params = build_orders_query(order_status, peek=False, **params)
+        etag = response.headers.get("ETag")
+        return StreamingResponse(
+            stream_rows(get_db_connection, query, query_params),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"ETag": etag} if etag else None,
+        )
+    orders, next_cursor = await db_pool.run(get_all_orders, order_type, **params)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return orders
+
+
 @app.get("/orders")
-async def get_orders():
-    """Retrieve all orders."""
-    return get_all_orders()
+async def get_orders(
+    request: Request,
+    response: Response,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    params: dict = Depends(order_list_params),
+):
+    """Retrieve all orders, optionally filtered by status."""
+    order_type = order_status.value if order_status else "All"
+    return await list_orders(order_type, request, response, params)
 
 
 @app.get("/orders/active")
-async def get_active_orders():
+async def get_active_orders(
+    request: Request, response: Response, params: dict = Depends(order_list_params)
+):
     """Retrieve all active orders."""
-    return get_all_orders("active")
+    return await list_orders("active", request, response, params)
 
 
 @app.get("/orders/completed")
-async def get_completed_orders():
+async def get_completed_orders(
+    request: Request, response: Response, params: dict = Depends(order_list_params)
+):
     """Retrieve all completed orders."""
-    return get_all_orders("completed")
+    return await list_orders("completed", request, response, params)
+
+
+@app.get("/orders/stats", response_model=dict)
+async def get_order_stats(
+    request: Request,
+    response: Response,
+    minutes: int = Query(60, ge=1, le=1440),
+):
+    """
+    Get order counts per status, orders per minute and delivery times.
+
+    Served from the statistics tables maintained by the write paths, so the
+    cost does not grow with the number of orders. The per-minute windows
+    slide with the clock, so the ETag also changes every minute.
+    """
+    not_modified = await table_versions.not_modified(
+        request, response, "orders", variant=minute_of(datetime.now()).isoformat()
+    )
+    if not_modified:
+        return not_modified
+    return await db_pool.run(get_order_stats_from_db, minutes)
 
 
 @app.get("/order/{order_id}")
 async def get_order(order_id: str):
     """Retrieve details of a specific order."""
-    return get_order_details(order_id)
+    return await db_pool.run(get_cached_order_details, order_id)
+
+
+@app.get("/cache_stats", response_model=dict)
+async def cache_stats():
+    """Get order details cache counters for this replica."""
+    return order_cache.stats()
+
+
+@app.get("/db_pool_stats", response_model=dict)
+async def db_pool_stats():
+    """Get connection pool usage counters for this replica."""
+    return db_pool.stats()
+
+
+@app.on_event("startup")
+def run_migrations():
+    apply_migrations(db_pool)
+
+
+@app.on_event("shutdown")
+def close_db_pool():
+    db_pool.close()
 
 
 if __name__ == "__main__":
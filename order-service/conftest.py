@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Make the shared `common` package importable when the tests run from a
+# checkout rather than from the service container.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -16,6 +16,7 @@ Steps to run the tests:
 """
 
 import json
+from datetime import datetime
 import pytest
 from app import app
 from unittest.mock import patch, MagicMock
@@ -156,3 +157,161 @@ def test_order_not_found(client, mock_db_connection):
     assert response.status_code == 404
     data = json.loads(response.data)
     assert data["error"] == "Order not found"
+
+
+@pytest.fixture
+def api_client():
+    """Configure test client for the FastAPI application (startup hooks skipped)"""
+    from fastapi.testclient import TestClient
+    from app import db_pool
+
+    yield TestClient(app)
+    # Drop pooled connections so the next test sees its own mocked connection
+    db_pool.close()
+
+
+def test_build_orders_query_keyset():
+    """Keyset pages continue after the (order_time, id) of the cursor"""
+    from app import build_orders_query
+    from common.pagination import encode_cursor
+
+    cursor = encode_cursor("2023-01-01T12:00:00", "abc")
+    query, params = build_orders_query("active", cursor=cursor, limit=50)
+
+    assert "order_status = %s" in query
+    assert "(order_time > %s OR (order_time = %s AND id > %s))" in query
+    assert query.endswith("ORDER BY order_time, id LIMIT %s")
+    assert params == (
+        "active",
+        "2023-01-01T12:00:00",
+        "2023-01-01T12:00:00",
+        "abc",
+        51,
+    )
+
+
+def test_get_orders_paginated(api_client, mock_db_connection):
+    """A full page returns the cursor of its last row"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = [
+        {"id": "1", "order_time": "2023-01-01T12:00:00", "order_status": "active"},
+        {"id": "2", "order_time": "2023-01-01T13:00:00", "order_status": "active"},
+        {"id": "3", "order_time": "2023-01-01T14:00:00", "order_status": "active"},
+    ]
+
+    response = api_client.get("/orders", params={"limit": 2})
+
+    assert response.status_code == 200
+    assert [order["id"] for order in response.json()] == ["1", "2"]
+    assert "X-Next-Cursor" in response.headers
+
+
+def test_get_orders_invalid_cursor(api_client, mock_db_connection):
+    """A malformed cursor is rejected"""
+    response = api_client.get("/orders", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+def test_create_orders_partial_failure(api_client, mock_db_connection):
+    """Invalid orders are rejected individually while the rest are created"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = [(1,)]
+    test_data = {
+        "orders": [
+            {"customer_name": "Alice", "customer_distance": 5.0, "items": [{"item_id": 1, "quantity": 2}]},
+            {"customer_name": "Bob", "customer_distance": 0, "items": [{"item_id": 1, "quantity": 1}]},
+            {"customer_name": "Carol", "customer_distance": 3.0, "items": [{"item_id": 99, "quantity": 1}]},
+        ]
+    }
+
+    response = api_client.post("/create_orders", json=test_data)
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["created"] == 1
+    assert data["rejected"] == 2
+    assert [result["status"] for result in data["results"]] == ["created", "rejected", "rejected"]
+    assert data["results"][2]["error"] == "Item with ID=99 not found"
+    assert data["task_id"]
+    assert mock_db_connection.executemany.call_count == 2
+    # The batch task is queued through the outbox in the same transaction
+    outbox_insert = mock_db_connection.execute.call_args_list[-1]
+    assert "INSERT INTO task_outbox" in outbox_insert.args[0]
+    assert outbox_insert.args[1][1] == "process_order_batch"
+
+
+def test_order_events_collapse_updates(api_client, mock_db_connection):
+    """Several transitions of one order update its row once and record every event"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.rowcount = 1
+    mock_db_connection.fetchall.return_value = [("abc", "active", datetime(2023, 1, 1, 12, 0))]
+    test_data = {
+        "events": [
+            {"order_id": "abc", "message": "Delivery person assigned"},
+            {"order_id": "abc", "message": "Delivery on the road"},
+            {"order_id": "abc", "order_status": "completed", "message": "Order delivered"},
+        ]
+    }
+
+    response = api_client.post("/order_events", json=test_data)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["applied"] == 3
+    assert data["orders"]["abc"]["order_status"] == "completed"
+    assert data["orders"]["abc"]["response_msg"] == "Order delivered"
+    updates = [
+        call.args[0]
+        for call in mock_db_connection.execute.call_args_list
+        if call.args[0].startswith("UPDATE orders")
+    ]
+    assert len(updates) == 1
+    history = mock_db_connection.executemany.call_args.args[1]
+    assert [event[2] for event in history] == [
+        "Delivery person assigned",
+        "Delivery on the road",
+        "Order delivered",
+    ]
+
+
+def test_order_events_unchanged_row_is_not_missing(api_client, mock_db_connection):
+    """A repeated event changes no row but its order exists; only unknown ids are 404"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.rowcount = 0
+    mock_db_connection.fetchall.return_value = [("abc", "active", datetime(2023, 1, 1, 12, 0))]
+
+    response = api_client.post(
+        "/order_events", json={"events": [{"order_id": "abc", "message": "Same message"}]}
+    )
+    assert response.status_code == 200
+
+    response = api_client.post(
+        "/order_events",
+        json={"events": [{"order_id": "abc", "message": "x"}, {"order_id": "zzz", "message": "y"}]},
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Orders not found: zzz"
+
+
+def test_build_orders_query_stream_reads_exactly_limit():
+    """Streams have no next page, so they don't read the extra row of a page"""
+    from app import build_orders_query
+
+    _, params = build_orders_query("completed", limit=10, peek=False)
+    assert params == ("completed", 10)
+
+    _, params = build_orders_query("completed", limit=10, include_history=True, peek=False)
+    assert params == ("completed", 10, "completed", 10, 10)
+
+
+def test_build_orders_query_with_history():
+    """History pages merge one page from each of the live and history tables"""
+    from app import build_orders_query
+
+    query, params = build_orders_query("completed", limit=10, include_history=True)
+
+    assert "FROM orders WHERE" in query
+    assert "FROM orders_history WHERE" in query
+    assert "UNION ALL" in query
+    assert params == ("completed", 11, "completed", 11, 11)
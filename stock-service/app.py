@@ -1,21 +1,63 @@
-import os
-from contextlib import contextmanager
-from typing import List
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-import mysql.connector
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, Response, status
 from mysql.connector.errors import Error as MySQLError
 from pydantic import BaseModel
 
+from common.catalog import CATALOG_QUERY, CATALOG_TABLE, Catalog
+from common.db import ConnectionPool, PoolTimeoutError, db_config_from_env
+from common.migrate import apply_migrations
+from common.redis_store import redis_from_env
+from common.reservations import (
+    AVAILABLE_STOCK_QUERY,
+    COMMITTED,
+    HELD,
+    RELEASED,
+    RESERVATION_TTL,
+    AvailableStock,
+    finish_reservation,
+    hold_stock,
+    load_available,
+    take_stock,
+)
+from common.stock_shards import (
+    STOCK_TOTALS,
+    read_shards,
+    set_shards,
+    split_evenly,
+    update_shards,
+    with_locked_retry,
+)
+from common.stock_snapshot import (
+    STOCK_COLUMNS,
+    STOCK_SNAPSHOT_QUERY,
+    StockSnapshot,
+    publish_stock_changes,
+)
+from common.versions import TableVersions, etag_matches
+
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Stock Service API")
 
 # MySQL configuration
-db_config = {
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "database": os.getenv("DB_NAME"),
-}
+db_config = db_config_from_env()
+db_pool = ConnectionPool(db_config)
+redis_client = redis_from_env()
+table_versions = TableVersions(redis_client)
+
+# Available quantities (on hand minus held) for availability checks, see
+# common/reservations.py
+available_stock = AvailableStock(redis_client)
+
+# Item names for availability messages, see common/catalog.py
+item_catalog = Catalog(lambda: get_catalog(), table_versions)
+
+# In-memory copy of the stock rows behind /current_stock, see
+# common/stock_snapshot.py
+stock_snapshot = StockSnapshot(lambda item_ids: load_stock_rows(item_ids), redis_client)
 
 
 class OrderItem(BaseModel):
@@ -27,21 +69,46 @@ class OrderItems(BaseModel):
     order_items: List[OrderItem]
 
 
-@contextmanager
+class ShardsRequest(BaseModel):
+    shards: int
+
+
+class HoldRequest(BaseModel):
+    order_id: str
+    order_items: List[OrderItem]
+    # Seconds before the reaper releases the hold, RESERVATION_TTL by default
+    ttl: Optional[float] = None
+
+
 def get_db_connection():
-    """Context manager for database connections."""
-    conn = None
-    try:
-        conn = mysql.connector.connect(**db_config)
-        yield conn
-    except MySQLError as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection failed: {str(e)}",
-        )
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+    """Context manager for pooled database connections."""
+    return db_pool.connection()
+
+
+def load_stock_rows(item_ids=None):
+    """Read the stock rows of `item_ids`, or of every item, for the snapshot."""
+    # Errors reach the listener as MySQLError / PoolTimeoutError, not as a 503
+    with db_pool.borrow() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            if item_ids is None:
+                cursor.execute(STOCK_SNAPSHOT_QUERY)
+            else:
+                placeholders = ", ".join(["%s"] * len(item_ids))
+                cursor.execute(
+                    f"{STOCK_SNAPSHOT_QUERY} WHERE item_id IN ({placeholders})",
+                    tuple(item_ids),
+                )
+            return cursor.fetchall()
+
+
+def sharded_items(requested):
+    """Ids of the requested items that the catalog lists with shards."""
+    return {item_id for item_id in requested if (item_catalog.get(item_id) or {}).get("shards")}
+
+
+def announce_stock_changes(item_ids):
+    """Have every replica reload the stock rows of `item_ids`; call after commit."""
+    publish_stock_changes(redis_client, item_ids=list(item_ids))
 
 
 def get_current_stock():
@@ -49,7 +116,7 @@ def get_current_stock():
     with get_db_connection() as conn:
         with conn.cursor(dictionary=True) as cursor:
             try:
-                cursor.execute("SELECT * FROM stock")
+                cursor.execute(STOCK_SNAPSHOT_QUERY)
                 return cursor.fetchall()
             except MySQLError as e:
                 raise HTTPException(
@@ -58,12 +125,26 @@ def get_current_stock():
                 )
 
 
+def get_catalog():
+    """Retrieve item names and capacities, without the quantities."""
+    with get_db_connection() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            try:
+                cursor.execute(CATALOG_QUERY)
+                return cursor.fetchall()
+            except MySQLError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to get catalog: {str(e)}",
+                )
+
+
 def get_item_stock(item_id):
     """Retrieve the current stock quantity for a specific item."""
     with get_db_connection() as conn:
         with conn.cursor(dictionary=True) as cursor:
             try:
-                cursor.execute("SELECT * FROM stock WHERE item_id = %s", (item_id,))
+                cursor.execute(f"{STOCK_SNAPSHOT_QUERY} WHERE item_id = %s", (item_id,))
                 return cursor.fetchone()
             except MySQLError as e:
                 raise HTTPException(
@@ -73,77 +154,428 @@ def get_item_stock(item_id):
 
 
 def batch_update_stock(items, operation="add"):
-    """Update stock quantities for multiple items in a single transaction. operation can be 'add' or 'remove'."""
+    """
+    Update stock quantities for multiple items in a single transaction.
+    operation can be 'add' or 'remove'.
+
+    The affected rows are locked and checked with one SELECT, in item id
+    order, and updated with one multi-row statement, so a restock costs the
+    same number of round trips whatever its number of items. Sharded items
+    also lock their shards and get the units spread evenly over them, along
+    with any free units left on their stock row.
+    """
+    quantities = requested_quantities(items)
+    if not quantities:
+        return {"message": "Stock updated successfully"}, status.HTTP_200_OK
+    sign = 1 if operation == "add" else -1
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
             try:
-                # If adding stock, validate against max_quantity
-                if operation == "add":
-                    for item in items:
-                        cursor.execute(
-                            "SELECT quantity, max_quantity, item_name FROM stock WHERE item_id = %s",
-                            (item.item_id,),
+                placeholders = ", ".join(["%s"] * len(quantities))
+                cursor.execute(
+                    f"SELECT {', '.join(STOCK_COLUMNS)} FROM stock"
+                    f" WHERE item_id IN ({placeholders}) ORDER BY item_id FOR UPDATE",
+                    tuple(quantities),
+                )
+                rows = {row[0]: dict(zip(STOCK_COLUMNS, row)) for row in cursor.fetchall()}
+                for item_id, quantity in quantities.items():
+                    if item_id not in rows:
+                        conn.rollback()
+                        return {
+                            "error": f"Item with ID={item_id} not found"
+                        }, status.HTTP_404_NOT_FOUND
+                # Stock row deltas, and the units to spread over the shards
+                # of sharded items, which are counted into their totals
+                deltas = {item_id: sign * quantity for item_id, quantity in quantities.items()}
+                spread, active = {}, {}
+                hot = [item_id for item_id in quantities if rows[item_id]["shards"]]
+                shards = read_shards(cursor, hot, lock=True)
+                for item_id, item_shards in shards.items():
+                    row = rows[item_id]
+                    active[item_id] = [shard for shard in item_shards if shard <= row["shards"]]
+                    if active[item_id]:
+                        spread[item_id] = deltas[item_id] + row["quantity"] - row["held"]
+                        deltas[item_id] = row["held"] - row["quantity"]
+                    for shard_quantity, shard_held, shard_version in item_shards.values():
+                        row["quantity"] += shard_quantity
+                        row["held"] += shard_held
+                        row["version"] += shard_version
+                for item_id, quantity in quantities.items():
+                    current_qty = rows[item_id]["quantity"]
+                    max_qty = rows[item_id]["max_quantity"]
+                    item_name = rows[item_id]["item_name"]
+                    # If adding stock, validate against max_quantity
+                    if operation == "add" and current_qty + quantity > max_qty:
+                        conn.rollback()
+                        return {
+                            "error": f"Adding {quantity} units to {item_name} would exceed maximum capacity ({max_qty}). Current: {current_qty}"
+                        }, status.HTTP_400_BAD_REQUEST
+
+                # Every row exists and is locked, so this only updates
+                cursor.execute(
+                    "INSERT INTO stock (item_id, item_name, quantity, max_quantity) VALUES "
+                    + ", ".join(["(%s, %s, %s, %s)"] * len(quantities))
+                    + " ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity),"
+                    " version = version + 1",
+                    tuple(
+                        value
+                        for item_id, quantity in quantities.items()
+                        for value in (
+                            item_id,
+                            rows[item_id]["item_name"],
+                            deltas[item_id],
+                            rows[item_id]["max_quantity"],
                         )
-                        result = cursor.fetchone()
-                        if not result:
-                            conn.rollback()
-                            return {
-                                "error": f"Item with ID={item.item_id} not found"
-                            }, status.HTTP_404_NOT_FOUND
-                        current_qty, max_qty, item_name = result
-                        new_qty = current_qty + item.quantity
-                        if new_qty > max_qty:
-                            conn.rollback()
-                            return {
-                                "error": f"Adding {item.quantity} units to {item_name} would exceed maximum capacity ({max_qty}). Current: {current_qty}"
-                            }, status.HTTP_400_BAD_REQUEST
-
-                query = """
-                    UPDATE stock 
-                    SET quantity = quantity {} %s 
-                    WHERE item_id = %s
-                """.format("+" if operation == "add" else "-")
-
-                cursor.executemany(
-                    query, [(item.quantity, item.item_id) for item in items]
+                    ),
                 )
+                lines = [
+                    (item_id, shard, share)
+                    for item_id, units in spread.items()
+                    for shard, share in zip(
+                        active[item_id], split_evenly(units, len(active[item_id]))
+                    )
+                ]
+                if lines:
+                    update_shards(cursor, "quantity = quantity + {case}", lines)
                 conn.commit()
+                # The rows are locked, so their new values are known: write
+                # them through to this replica and send them to the others,
+                # before the version bump lets clients revalidate
+                updated = [
+                    {
+                        **rows[item_id],
+                        "quantity": rows[item_id]["quantity"] + sign * quantity,
+                        # The stock row and the shards given units were updated
+                        "version": rows[item_id]["version"] + 1 + len(active.get(item_id, ())),
+                    }
+                    for item_id, quantity in quantities.items()
+                ]
+                stock_snapshot.apply(updated)
+                publish_stock_changes(redis_client, rows=updated)
+                table_versions.bump("stock")
+                available_stock.add(
+                    {item_id: sign * quantity for item_id, quantity in quantities.items()}
+                )
                 return {"message": "Stock updated successfully"}, status.HTTP_200_OK
             except MySQLError as err:
                 conn.rollback()
                 return {"error": str(err)}, status.HTTP_500_INTERNAL_SERVER_ERROR
 
 
+def requested_quantities(items):
+    """Total quantity requested per item id, in item id order."""
+    requested = {}
+    for item in items:
+        requested[item.item_id] = requested.get(item.item_id, 0) + item.quantity
+    return dict(sorted(requested.items()))
+
+
+def compare_stock(requested, stock):
+    """
+    Compare requested quantities with the available stock.
+
+    Args:
+        requested (dict): Quantity per item id
+        stock (dict): (item_name, available quantity) per existing item id
+
+    Returns:
+        tuple: (all items available, message, per-item results)
+    """
+    results, problems = [], []
+    for item_id, quantity in requested.items():
+        if item_id not in stock:
+            message = f"Item with ID={item_id} not found"
+        elif stock[item_id][1] < quantity:
+            message = f"Insufficient stock for item {stock[item_id][0]}"
+        else:
+            message = None
+        if message:
+            problems.append(message)
+        results.append(
+            {
+                "item_id": item_id,
+                "quantity": quantity,
+                "in_stock": message is None,
+                "message": message or "Item currently in stock",
+            }
+        )
+    if problems:
+        return False, problems[0], results
+    return True, "Items currently in stock", results
+
+
+def check_stock(cursor, requested):
+    """Compare requested quantities with the stock in MySQL, in one query."""
+    placeholders = ", ".join(["%s"] * len(requested))
+    cursor.execute(
+        f"SELECT item_id, item_name, quantity - held FROM {STOCK_TOTALS}"
+        f" WHERE item_id IN ({placeholders})",
+        tuple(requested),
+    )
+    return compare_stock(requested, {row[0]: row[1:] for row in cursor.fetchall()})
+
+
+def explain_refusal(cursor, requested):
+    """
+    Tell why stock could not be taken, after the transaction rolled back.
+
+    Returns:
+        tuple: Message and per-item results
+    """
+    available, message, results = check_stock(cursor, requested)
+    if available:
+        # Stock was added between the update and the check
+        message = "Stock changed during reservation, try again"
+    return message, results
+
+
 def validate_stock(items):
-    """Validate if requested stock operations are possible."""
+    """
+    Validate if requested stock operations are possible.
+
+    Answered from the available stock counter when it is built, so checks
+    don't query MySQL.
+    """
+    requested = requested_quantities(items)
+    if not requested:
+        return True, "Items currently in stock"
+    available = available_stock.get()
+    if available is not None:
+        stock = {
+            item_id: ((item_catalog.get(item_id) or {}).get("item_name"), available[item_id])
+            for item_id in requested
+            if item_id in available
+        }
+        valid, message, _ = compare_stock(requested, stock)
+        return valid, message
     with get_db_connection() as conn:
-        with conn.cursor() as cursor:  # Use cursor context manager
+        with conn.cursor() as cursor:
             try:
-                for item in items:
-                    cursor.execute(
-                        "SELECT quantity, item_name, max_quantity FROM stock WHERE item_id = %s",
-                        (item.item_id,),
-                    )
-                    result = cursor.fetchone()
-                    if not result:
-                        return False, f"Item with ID={item.item_id} not found"
-                    elif result[0] - item.quantity < 0:
-                        return False, f"Insufficient stock for item {result[1]}"
-                    else:
-                        return True, "Items currently in stock"
+                valid, message, _ = check_stock(cursor, requested)
+                return valid, message
             except MySQLError as err:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(err)
                 )
 
 
+def reserve_stock(items):
+    """
+    Take the stock of every line of an order, or of none of them.
+
+    All lines are checked and decremented by one UPDATE (see
+    common.reservations.take_stock), sharded items by one more. Unless every
+    item was updated the transaction is rolled back and the stock is read
+    again to explain which lines could not be served.
+
+    Returns:
+        tuple: (reserved, message, per-item results)
+    """
+    requested = requested_quantities(items)
+    if not requested:
+        return True, "Stock reserved", []
+    if any(quantity <= 0 for quantity in requested.values()):
+        return False, "Item quantities must be greater than 0", []
+    # Read before checking out a connection: a catalog refresh needs one too
+    sharded = sharded_items(requested)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                taken = with_locked_retry(
+                    conn,
+                    lambda lock_shards: take_stock(
+                        cursor, requested, sharded=sharded, lock_shards=lock_shards
+                    ),
+                )
+                if taken is None:
+                    conn.rollback()
+                    message, results = explain_refusal(cursor, requested)
+                    return False, message, results
+                conn.commit()
+            except MySQLError as err:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to reserve stock: {str(err)}",
+                )
+    table_versions.bump("stock")
+    available_stock.add({item_id: -quantity for item_id, quantity in requested.items()})
+    announce_stock_changes(requested)
+    return (
+        True,
+        "Stock reserved",
+        [
+            {"item_id": item_id, "quantity": quantity, "in_stock": True, "message": "Reserved"}
+            for item_id, quantity in requested.items()
+        ],
+    )
+
+
+def hold_order_stock(order_id, items, ttl=None):
+    """
+    Hold the stock of every line of an order until it is committed, released
+    or expires.
+
+    Returns:
+        dict: order_id, state ('held', 'committed' or 'released' for an
+            existing reservation, 'refused' if the stock is not available),
+            message and per-item results of a refusal
+    """
+    requested = requested_quantities(items)
+    refused = {"order_id": order_id, "state": "refused", "items": []}
+    if not requested:
+        return {**refused, "message": "Order must contain at least one item"}
+    if any(quantity <= 0 for quantity in requested.values()):
+        return {**refused, "message": "Item quantities must be greater than 0"}
+    expires_at = datetime.now() + timedelta(seconds=RESERVATION_TTL if ttl is None else ttl)
+    # Read before checking out a connection: a catalog refresh needs one too
+    sharded = sharded_items(requested)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                state = with_locked_retry(
+                    conn,
+                    lambda lock_shards: hold_stock(
+                        cursor, order_id, requested, expires_at, sharded, lock_shards
+                    ),
+                )
+                if state is None:
+                    conn.rollback()
+                    message, results = explain_refusal(cursor, requested)
+                    return {**refused, "message": message, "items": results}
+                conn.commit()
+            except MySQLError as err:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to hold stock: {str(err)}",
+                )
+    if state != HELD:
+        return {
+            "order_id": order_id,
+            "state": state,
+            "message": f"Stock already {state} for this order",
+            "items": [],
+        }
+    table_versions.bump("stock")
+    available_stock.add({item_id: -quantity for item_id, quantity in requested.items()})
+    announce_stock_changes(requested)
+    return {
+        "order_id": order_id,
+        "state": HELD,
+        "message": "Stock held",
+        "expires_at": expires_at.isoformat(),
+        "items": [],
+    }
+
+
+def end_order_hold(order_id, state):
+    """
+    Commit or release the hold of an order.
+
+    Returns:
+        dict: order_id and the state of its reservation, None without one
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                previous, quantities = finish_reservation(cursor, order_id, state)
+                conn.commit()
+            except MySQLError as err:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to end stock reservation: {str(err)}",
+                )
+    if previous != HELD:
+        return {"order_id": order_id, "state": previous}
+    table_versions.bump("stock")
+    if state == RELEASED:
+        available_stock.add(quantities)
+    announce_stock_changes(quantities)
+    return {"order_id": order_id, "state": state}
+
+
+def get_reservation(order_id):
+    """Retrieve the reservation of an order with its items."""
+    with get_db_connection() as conn:
+        with conn.cursor(dictionary=True) as cursor:
+            try:
+                cursor.execute(
+                    "SELECT order_id, state, expires_at, created_at FROM stock_reservations"
+                    " WHERE order_id = %s",
+                    (order_id,),
+                )
+                reservation = cursor.fetchone()
+                if reservation is None:
+                    return None
+                cursor.execute(
+                    "SELECT item_id, CAST(SUM(quantity) AS SIGNED) AS quantity"
+                    " FROM stock_reservation_items WHERE order_id = %s"
+                    " GROUP BY item_id ORDER BY item_id",
+                    (order_id,),
+                )
+                reservation["items"] = cursor.fetchall()
+                return reservation
+            except MySQLError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to get stock reservation: {str(e)}",
+                )
+
+
+def reshard_item(item_id, shards):
+    """
+    Set the number of stock shards of an item (see common.stock_shards).
+
+    Returns:
+        dict: The item's stock totals, None if it does not exist
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                if not set_shards(cursor, item_id, shards):
+                    conn.rollback()
+                    return None
+                conn.commit()
+            except MySQLError as err:
+                conn.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to set stock shards of item {item_id}: {str(err)}",
+                )
+    table_versions.bump("stock", CATALOG_TABLE)
+    item_catalog.invalidate()
+    announce_stock_changes([item_id])
+    return get_item_stock(item_id)
+
+
+def get_available_stock():
+    """Available quantity per item id, from the counter or else from MySQL."""
+    available = available_stock.get()
+    if available is not None:
+        return available
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            try:
+                cursor.execute(AVAILABLE_STOCK_QUERY)
+                return dict(cursor.fetchall())
+            except MySQLError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Failed to get available stock: {str(e)}",
+                )
+
+
 @app.post("/add_stock", response_model=dict)
 async def add_stock(items: OrderItems):
     """
     Add stock quantities for multiple items.
     Validates that new quantity does not exceed max_quantity.
     """
-    result, status_code = batch_update_stock(items.order_items, operation="add")
+    result, status_code = await db_pool.run(
+        batch_update_stock, items.order_items, operation="add"
+    )
     if status_code != 200:
         raise HTTPException(status_code=status_code, detail=result["error"])
     return {"message": "Stock updated"}
@@ -152,41 +584,134 @@ async def add_stock(items: OrderItems):
 @app.post("/remove_stock", response_model=dict)
 async def remove_stock(request: OrderItems):
     """
-    Remove stock quantities for multiple items.
+    Remove stock quantities for multiple items, all or none of them.
     """
-    validation_status, message = validate_stock(request.order_items)
-    if not validation_status:
+    reserved, message, _ = await db_pool.run(reserve_stock, request.order_items)
+    if not reserved:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=message)
-    result, status_code = batch_update_stock(request.order_items, operation="remove")
-    if status_code != 200:
-        raise HTTPException(status_code=status_code, detail=result["error"])
     return {"message": "Stock updated"}
 
 
+@app.post("/reserve_stock", response_model=dict)
+async def reserve_stock_operation(request: OrderItems):
+    """
+    Check and take the stock of every line of an order in one transaction.
+
+    Responds 200 whether or not the stock could be reserved; `reserved`
+    tells which, and `items` has the result of each item.
+    """
+    reserved, message, results = await db_pool.run(reserve_stock, request.order_items)
+    return {"reserved": reserved, "message": message, "items": results}
+
+
 @app.post("/validate_stock", response_model=dict)
 async def validate_stock_operation(request: OrderItems):
     """
     Validate if stock operations are possible for multiple items.
     """
-    validation_status, message = validate_stock(request.order_items)
+    validation_status, message = await db_pool.run(validate_stock, request.order_items)
     return {"status": validation_status, "message": message}
 
 
+@app.post("/reservations", response_model=dict)
+async def hold_reservation(request: HoldRequest):
+    """
+    Hold the stock of an order.
+
+    Responds 200 whether or not the stock could be held; `state` is 'held'
+    on success and 'refused' otherwise. Holding again for the same order
+    returns the state of its reservation.
+    """
+    return await db_pool.run(
+        hold_order_stock, request.order_id, request.order_items, request.ttl
+    )
+
+
+@app.post("/reservations/{order_id}/commit", response_model=dict)
+async def commit_reservation(order_id: str):
+    """
+    Take the held stock of a completed order for good.
+
+    Only a held reservation changes; `state` is null for an order without one.
+    """
+    return await db_pool.run(end_order_hold, order_id, COMMITTED)
+
+
+@app.post("/reservations/{order_id}/release", response_model=dict)
+async def release_reservation(order_id: str):
+    """
+    Return the held stock of a cancelled order.
+
+    Only a held reservation changes; `state` is null for an order without one.
+    """
+    return await db_pool.run(end_order_hold, order_id, RELEASED)
+
+
+@app.get("/reservations/{order_id}")
+async def reservation(order_id: str):
+    """
+    Get the stock reservation of an order.
+    """
+    result = await db_pool.run(get_reservation, order_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Reservation not found"
+        )
+    return result
+
+
+@app.get("/available_stock")
+async def available_stock_levels():
+    """
+    Get the quantity of each item that orders can still take (on hand minus held).
+    """
+    return await db_pool.run(get_available_stock)
+
+
 @app.get("/current_stock")
-async def current_stock():
+async def current_stock(request: Request, response: Response):
     """
     Get current stock levels for all items.
+
+    Served from the stock snapshot while it is live, tagged with the hash
+    of the body, and from MySQL otherwise, tagged with the table version.
     """
-    stock = get_current_stock()
+    snapshot = stock_snapshot.list_body()
+    if snapshot is not None:
+        body, etag = snapshot
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+    not_modified = await table_versions.not_modified(request, response, "stock")
+    if not_modified:
+        return not_modified
+    stock = await db_pool.run(get_current_stock)
     return stock
 
 
+@app.get("/catalog")
+async def catalog(request: Request, response: Response):
+    """
+    Get the item catalog (ids, names and max quantities).
+
+    Quantity updates don't change it, so clients can poll it with
+    If-None-Match and almost always get a 304.
+    """
+    not_modified = await table_versions.not_modified(request, response, CATALOG_TABLE)
+    if not_modified:
+        return not_modified
+    return await db_pool.run(get_catalog)
+
+
 @app.get("/current_stock/{item_id}")
 async def item_stock(item_id: int):
     """
     Get current stock level for a specific item.
     """
-    stock = get_item_stock(item_id)
+    body = stock_snapshot.item_body(item_id)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+    stock = await db_pool.run(get_item_stock, item_id)
     if stock is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
@@ -194,6 +719,48 @@ async def item_stock(item_id: int):
     return stock
 
 
+@app.put("/current_stock/{item_id}/shards")
+async def item_shards(item_id: int, request: ShardsRequest):
+    """
+    Spread the stock of a hot item over `shards` counter rows, so concurrent
+    orders for it lock different rows; 0 keeps it on the stock row again.
+    """
+    if request.shards < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="shards must not be negative"
+        )
+    stock = await db_pool.run(reshard_item, item_id, request.shards)
+    if stock is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
+        )
+    return stock
+
+
+@app.get("/db_pool_stats", response_model=dict)
+async def db_pool_stats():
+    """Get connection pool usage counters for this replica."""
+    return db_pool.stats()
+
+
+@app.on_event("startup")
+def run_migrations():
+    apply_migrations(db_pool)
+    # Replicas share the counter; each rebuilds it from MySQL when it starts.
+    # If MySQL is not reachable yet the reaper rebuilds it after its next pass.
+    try:
+        available_stock.rebuild(load_available(db_pool))
+    except (MySQLError, PoolTimeoutError) as e:
+        logger.warning(f"Failed to load available stock: {str(e)}")
+    stock_snapshot.start()
+
+
+@app.on_event("shutdown")
+def close_db_pool():
+    stock_snapshot.stop()
+    db_pool.close()
+
+
 if __name__ == "__main__":
     import uvicorn
 
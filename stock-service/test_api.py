@@ -150,3 +150,207 @@ def test_remove_stock_item_not_found(client, mock_db_connection):
     assert response.status_code == 400
     assert "not found" in json.loads(response.data)["error"]
 
+
+
+@pytest.fixture
+def api_client():
+    """Configure test client for the FastAPI application (startup hooks skipped)"""
+    from fastapi.testclient import TestClient
+    from app import db_pool
+
+    # No item is sharded unless a test says so
+    with patch("app.item_catalog") as catalog:
+        catalog.get.return_value = None
+        yield TestClient(app)
+    # Drop pooled connections so the next test sees its own mocked connection
+    db_pool.close()
+
+
+def test_reserve_stock_takes_all_lines_in_one_update(api_client, mock_db_connection):
+    """Repeated items are added up and every line is decremented by one statement"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.rowcount = 2
+
+    response = api_client.post(
+        "/reserve_stock",
+        json={
+            "order_items": [
+                {"item_id": 2, "quantity": 1},
+                {"item_id": 1, "quantity": 3},
+                {"item_id": 2, "quantity": 4},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json()["reserved"] is True
+    assert [item["quantity"] for item in response.json()["items"]] == [3, 5]
+    query, params = mock_db_connection.execute.call_args.args
+    assert query.startswith("UPDATE stock SET quantity = quantity - CASE item_id")
+    assert query.endswith("ORDER BY item_id")
+    assert "AND quantity - held >= CASE item_id" in query
+    assert params == (1, 3, 2, 5, 1, 2, 1, 3, 2, 5)
+    assert mock_db_connection.execute.call_count == 1
+
+
+def test_reserve_stock_reads_catalog_before_checkout(api_client, mock_db_connection):
+    """A catalog refresh needs a connection, so none may be held while it runs"""
+    from app import db_pool, item_catalog
+
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.rowcount = 1
+    in_use = []
+    item_catalog.get.side_effect = lambda item_id: in_use.append(db_pool.stats()["in_use"])
+
+    response = api_client.post(
+        "/reserve_stock", json={"order_items": [{"item_id": 1, "quantity": 1}]}
+    )
+
+    assert response.status_code == 200
+    assert in_use == [0]
+
+
+def test_reserve_stock_insufficient_rolls_back(api_client, mock_db_connection):
+    """A line that can't be served leaves every item untouched"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.rowcount = 1
+    mock_db_connection.fetchall.return_value = [(1, "Pizza", 10), (2, "Soda", 1)]
+
+    response = api_client.post(
+        "/reserve_stock",
+        json={"order_items": [{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 5}]},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["reserved"] is False
+    assert body["message"] == "Insufficient stock for item Soda"
+    assert [item["in_stock"] for item in body["items"]] == [True, False]
+
+
+def test_hold_reservation_refused_leaves_stock_untouched(api_client, mock_db_connection):
+    """A hold that can't take every line is rolled back and explained per item"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    # The reservation row is inserted, then only one of the two items is held
+    mock_db_connection.rowcount = 1
+    mock_db_connection.fetchall.return_value = [(1, "Pizza", 10), (2, "Soda", 0)]
+
+    response = api_client.post(
+        "/reservations",
+        json={
+            "order_id": "abc",
+            "order_items": [{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}],
+        },
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["state"] == "refused"
+    assert body["message"] == "Insufficient stock for item Soda"
+    statements = [call.args[0] for call in mock_db_connection.execute.call_args_list]
+    assert statements[0].startswith("INSERT INTO stock_reservations")
+    assert statements[1].startswith("UPDATE stock SET held = held + CASE item_id")
+    assert not any("stock_reservation_items" in statement for statement in statements)
+
+
+def test_add_stock_locks_and_updates_all_items_at_once(api_client, mock_db_connection):
+    """A restock is one locking SELECT and one multi-row upsert, whatever its size"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = [
+        (item_id, f"item-{item_id}", 10, 100, 0, 3, 0) for item_id in range(1, 301)
+    ]
+
+    response = api_client.post(
+        "/add_stock",
+        json={"order_items": [{"item_id": item_id, "quantity": 5} for item_id in range(1, 301)]},
+    )
+
+    assert response.status_code == 200
+    calls = mock_db_connection.execute.call_args_list
+    assert len(calls) == 2
+    assert calls[0].args[0].endswith("ORDER BY item_id FOR UPDATE")
+    assert calls[1].args[0].endswith(
+        "ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), version = version + 1"
+    )
+    assert calls[1].args[1][:4] == (1, "item-1", 5, 100)
+
+
+def test_add_stock_over_capacity(api_client, mock_db_connection):
+    """Nothing is written when one item would exceed its max_quantity"""
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    mock_db_connection.fetchall.return_value = [
+        (1, "Pizza", 10, 100, 0, 1, 0),
+        (2, "Soda", 95, 100, 0, 1, 0),
+    ]
+
+    response = api_client.post(
+        "/add_stock",
+        json={"order_items": [{"item_id": 1, "quantity": 5}, {"item_id": 2, "quantity": 10}]},
+    )
+
+    assert response.status_code == 400
+    assert "exceed maximum capacity" in response.json()["detail"]
+    assert mock_db_connection.execute.call_count == 1
+
+
+def test_add_stock_writes_through_to_snapshot(api_client, mock_db_connection):
+    """A restock updates the live snapshot, which then serves reads without MySQL"""
+    from common.stock_snapshot import StockSnapshot
+
+    mock_db_connection.__enter__.return_value = mock_db_connection
+    snapshot = StockSnapshot(MagicMock(), MagicMock())
+    snapshot.apply(
+        [{"item_id": 1, "item_name": "Pizza", "quantity": 10, "max_quantity": 100,
+          "held": 2, "version": 1, "shards": 0}],
+        complete=True,
+    )
+    snapshot._set_live(True)
+    mock_db_connection.fetchall.return_value = [(1, "Pizza", 10, 100, 2, 1, 0)]
+    with patch("app.stock_snapshot", snapshot):
+        assert api_client.post(
+            "/add_stock", json={"order_items": [{"item_id": 1, "quantity": 5}]}
+        ).status_code == 200
+        mock_db_connection.execute.reset_mock()
+
+        response = api_client.get("/current_stock/1")
+
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 15
+    assert response.json()["version"] == 2
+    mock_db_connection.execute.assert_not_called()
+
+
+def test_validate_stock_uses_counter_and_catalog_names(api_client):
+    """Checks against the available stock counter name items from the catalog"""
+    with patch("app.available_stock") as available_stock, patch("app.item_catalog") as catalog:
+        available_stock.get.return_value = {1: 5}
+        catalog.get.return_value = {"item_name": "Pizza", "max_quantity": 100}
+
+        response = api_client.post(
+            "/validate_stock", json={"order_items": [{"item_id": 1, "quantity": 10}]}
+        )
+
+    assert response.status_code == 200
+    assert response.json() == {"status": False, "message": "Insufficient stock for item Pizza"}
+
+
+def test_current_stock_etag_follows_the_snapshot(api_client, mock_db_connection):
+    """Snapshot reads are tagged with their own body, not the bumped table version"""
+    from common.stock_snapshot import StockSnapshot
+
+    row = {"item_id": 1, "item_name": "Pizza", "quantity": 10, "max_quantity": 100,
+           "held": 0, "version": 1, "shards": 0}
+    snapshot = StockSnapshot(MagicMock(), MagicMock())
+    snapshot.apply([row], complete=True)
+    snapshot._set_live(True)
+    with patch("app.stock_snapshot", snapshot):
+        etag = api_client.get("/current_stock").headers["ETag"]
+        cached = api_client.get("/current_stock", headers={"If-None-Match": etag})
+        snapshot.apply([{**row, "quantity": 9, "version": 2}])
+        changed = api_client.get("/current_stock", headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert changed.status_code == 200
+    assert changed.json()[0]["quantity"] == 9
+    assert changed.headers["ETag"] != etag
+    mock_db_connection.execute.assert_not_called()
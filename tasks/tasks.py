@@ -2,9 +2,10 @@ import logging
 import os
 import random
 import time
+from datetime import datetime
 
 import requests
-from celery import Celery
+from celery import Celery, group
 from requests.adapters import HTTPAdapter
 from tenacity import (
     retry,
@@ -78,15 +79,85 @@ def make_request(method, url, **kwargs):
     return response
 
 
+def record_order_events(*events):
+    """
+    Send order transitions to the order service in a single call.
+
+    Args:
+        *events: (order_id, order_status, message) tuples in the order they happened
+    """
+    return make_request(
+        "POST",
+        f"{ORDER_SERVICE_URL}/order_events",
+        json={
+            "events": [
+                {
+                    "order_id": order_id,
+                    "order_status": order_status,
+                    "message": message,
+                    "timestamp": datetime.now().isoformat(),
+                }
+                for order_id, order_status, message in events
+            ]
+        },
+    )
+
+
+def claim_delivery_person(order_id, customer_distance):
+    """Atomically assign an idle delivery person to the order, or queue the order."""
+    return make_request(
+        "POST",
+        f"{DELIVERY_SERVICE_URL}/dispatch/claim",
+        json={"order_id": order_id, "customer_distance": customer_distance},
+    ).json()
+
+
+def deliver(order_id, customer_distance, delivery_person_id, pickup_distance=0.0):
+    """
+    Simulate the delivery of an order by its assigned delivery person.
+
+    The delivery person first rides `pickup_distance` km back to the kitchen,
+    then `customer_distance` km to the customer.
+    """
+    logger.info(f"Assigned delivery person {delivery_person_id} to order {order_id}")
+
+    # Once delivery person is assigned, record "Delivery person assigned"
+    # followed by "Delivery on the road" in one call
+    record_order_events(
+        (order_id, None, "Delivery person assigned"),
+        (order_id, None, "Delivery on the road"),
+    )
+
+    # Simulate the delivery time of order based on pickup and customer distance
+    delivery_time = random.randint(5, 10) + 5 * (pickup_distance + customer_distance)
+    logger.info(f"Delivery time for order {order_id}: {delivery_time} seconds")
+    time.sleep(delivery_time)
+
+    # Close the order in ORDER_SERVICE
+    record_order_events((order_id, "completed", "Order delivered"))
+
+    # Update the delivery person status to "idle"; the delivery service hands
+    # them the next queued order right away, through the deliver_order task
+    make_request(
+        "POST",
+        f"{DELIVERY_SERVICE_URL}/update_delivery_person_status",
+        json={"person_id": delivery_person_id, "person_status": "idle"},
+    )
+
+    logger.info(f"Delivery completed for order {order_id}")
+
+
 @celery.task(name="process_order")
 def process_order(order_id: str, customer_distance: float, order_items: list):
     logger.info(f"Processing order {order_id}")
     try:
-        # Validate stock
+        # Hold the stock of every item in one call; nothing is held unless
+        # all of it is available. The order service commits the hold when the
+        # order completes and releases it when the order is cancelled.
         response = make_request(
             "POST",
-            f"{STOCK_SERVICE_URL}/validate_stock",
-            json={"order_items": order_items},
+            f"{STOCK_SERVICE_URL}/reservations",
+            json={"order_id": order_id, "order_items": order_items},
         )
 
         if response.status_code != 200:
@@ -103,165 +174,109 @@ def process_order(order_id: str, customer_distance: float, order_items: list):
             )
             return
 
-        elif response.json()["status"] == False:
+        reservation = response.json()
+        if reservation["state"] != "held":
             logger.warning(
-                f"Stock not available for order {order_id}: {response.json()['message']}"
+                f"Stock not available for order {order_id}: {reservation['message']}"
             )
             response = make_request(
                 "POST",
                 f"{ORDER_SERVICE_URL}/cancel_order",
-                json={"order_id": order_id, "message": response.json()["message"]},
+                json={"order_id": order_id, "message": reservation["message"]},
             )
             return
 
-        elif response.json()["status"] == True:
-            logger.info(f"Stock validated successfully for order {order_id}")
-            # Update message "Order taken" in ORDER_SERVICE
-            make_request(
-                "POST",
-                f"{ORDER_SERVICE_URL}/update_msg",
-                json={
-                    "order_id": order_id,
-                    "message": "Order taken",
-                },
-            )
-            make_request(
-                "POST",
-                f"{DELIVERY_SERVICE_URL}/assign_delivery",
-                json={"order_id": order_id, "customer_distance": customer_distance},
-            )
-            make_request(
-                "POST",
-                f"{STOCK_SERVICE_URL}/remove_stock",
-                json={"order_items": order_items},
-            )
-            logger.info(f"Order {order_id} processed successfully")
-            return
-
-        else:
-            logger.error(f"Unexpected response for order {order_id}")
-            response = make_request(
-                "POST",
-                f"{ORDER_SERVICE_URL}/cancel_order",
-                json={
-                    "order_id": order_id,
-                    "message": "Order cancelled due to server issues",
-                },
-            )
-            return
+        logger.info(f"Stock held for order {order_id}")
+        # Update message "Order taken" in ORDER_SERVICE
+        record_order_events((order_id, None, "Order taken"))
+        make_request(
+            "POST",
+            f"{DELIVERY_SERVICE_URL}/assign_delivery",
+            json={"order_id": order_id, "customer_distance": customer_distance},
+        )
+        logger.info(f"Order {order_id} processed successfully")
+        return
 
     except Exception as e:
         logger.error(f"Error processing order {order_id}: {str(e)}")
         raise
 
 
+@celery.task(name="process_order_batch")
+def process_order_batch(orders: list):
+    """Fan a batch published by /create_orders out into one process_order task per order."""
+    logger.info(f"Processing batch of {len(orders)} orders")
+    group(
+        process_order.s(order_id, customer_distance, order_items)
+        for order_id, customer_distance, order_items in orders
+    ).apply_async()
+
+
 @celery.task(name="simulate_delivery")
 def simulate_delivery(order_id: str, customer_distance: float):
     logger.info(f"Starting delivery simulation for order {order_id}")
     try:
-        # Find a list of delivery persons who are idle
-        logger.info("Searching for idle delivery persons")
-        response = make_request("GET", f"{DELIVERY_SERVICE_URL}/delivery_persons/idle")
-        idle_delivery_persons = response.json()
-
-        # If no delivery persion is idle, then check in a gap of 30 seconds repeatedly to find any idle delivery person
-        count = 0
-        while (len(idle_delivery_persons) == 0) and (count < 120):
-            time.sleep(30)
-            response = make_request("GET", f"{DELIVERY_SERVICE_URL}/idle")
-            idle_delivery_persons = response.json()
-            # Update message "Finding delivery person ..." in ORDER_SERVICE
-            make_request(
-                "POST",
-                f"{ORDER_SERVICE_URL}/update_msg",
-                json={
-                    "order_id": order_id,
-                    "message": "Finding delivery person ...",
-                },
-            )
-            count += 1
-
-        # If no delivery person is idle for 1 hour, then cancel the order
-        if (len(idle_delivery_persons) == 0) and (count == 120):
-            logger.error(
-                f"No delivery person available for order {order_id} after 1 hour"
-            )
-            response = make_request(
-                "POST",
-                f"{ORDER_SERVICE_URL}/cancel_order",
-                json={
-                    "order_id": order_id,
-                    "message": "No delivery person available",
-                },
-            )
+        # Recorded before claiming, so it can never overwrite the messages
+        # of a delivery that starts as soon as the order is queued
+        record_order_events((order_id, None, "Finding delivery person ..."))
+
+        # Claim an idle delivery person; locking, marking them en_route and
+        # creating the delivery record happen in one call
+        logger.info("Claiming an idle delivery person")
+        assignment = claim_delivery_person(order_id, customer_distance)
+
+        # If no delivery person is idle (or dispatch runs in batches) the order
+        # waits in the dispatch queue and deliver_order runs once it is assigned. Orders
+        # still queued after DISPATCH_MAX_WAIT are cancelled by cancel_order.
+        if not assignment["assigned"]:
+            logger.info(f"No delivery person idle, order {order_id} queued")
             return
 
-        # If Idle delivery person is found, then assign the delivery person to the order randomly
-        delivery_person = random.choice(idle_delivery_persons)
-        delivery_person_id = delivery_person["id"]
-
-        # Update the update_delivery_person_status status to "en_route"
-        make_request(
-            "POST",
-            f"{DELIVERY_SERVICE_URL}/update_delivery_person_status",
-            json={"person_id": delivery_person_id, "person_status": "en_route"},
+        deliver(
+            order_id,
+            customer_distance,
+            assignment["delivery_person_id"],
+            assignment.get("pickup_distance", 0.0),
         )
 
-        # Create a record in deliveries table with delivery_id, order_id, and delivery_person_id
-        response = make_request(
-            "POST",
-            f"{DELIVERY_SERVICE_URL}/create_delivery_record",
-            json={"order_id": order_id, "delivery_person_id": delivery_person_id},
-        )
+    except Exception as e:
+        logger.error(f"Error in delivery simulation for order {order_id}: {str(e)}")
+        raise
 
-        logger.info(
-            f"Assigned delivery person {delivery_person_id} to order {order_id}"
-        )
 
-        # Once delivery person is assigned, update the message to "Delivery person assigned"
-        make_request(
-            "POST",
-            f"{ORDER_SERVICE_URL}/update_msg",
-            json={
-                "order_id": order_id,
-                "message": "Delivery person assigned",
-            },
-        )
+@celery.task(name="deliver_order")
+def deliver_order(
+    order_id: str,
+    customer_distance: float,
+    delivery_person_id: int,
+    pickup_distance: float = 0.0,
+):
+    """Deliver a queued order once the delivery service or the matcher has assigned it."""
+    try:
+        deliver(order_id, customer_distance, delivery_person_id, pickup_distance)
+    except Exception as e:
+        logger.error(f"Error in delivery of queued order {order_id}: {str(e)}")
+        raise
 
-        # Update the /update_msg for ORDER_SERVICE to update message "Delivery en route"
-        make_request(
-            "POST",
-            f"{ORDER_SERVICE_URL}/update_msg",
-            json={
-                "order_id": order_id,
-                "message": "Delivery on the road",
-            },
-        )
 
-        # Simulate the delivery time of order based on customer distance
-        delivery_time = random.randint(5, 10) + 5 * customer_distance
-        logger.info(f"Delivery time for order {order_id}: {delivery_time} seconds")
-        time.sleep(delivery_time)
+@celery.task(name="cancel_order")
+def cancel_order(order_id: str, message: str):
+    """Cancel an order the delivery service gave up dispatching."""
+    logger.error(f"Cancelling order {order_id}: {message}")
+    make_request(
+        "POST",
+        f"{ORDER_SERVICE_URL}/cancel_order",
+        json={"order_id": order_id, "message": message},
+    )
 
-        # Call the /close_order for ORDER_SERVICE to close the order
-        make_request(
-            "POST",
-            f"{ORDER_SERVICE_URL}/close_order",
-            json={
-                "order_id": order_id,
-                "message": "Order delivered",
-            },
-        )
 
-        # Update the update_delivery_person_status status to "idle"
-        make_request(
-            "POST",
-            f"{DELIVERY_SERVICE_URL}/update_delivery_person_status",
-            json={"person_id": delivery_person_id, "person_status": "idle"},
-        )
+@celery.task(name="commit_stock")
+def commit_stock(order_id: str):
+    """Take the stock held for a completed order for good."""
+    make_request("POST", f"{STOCK_SERVICE_URL}/reservations/{order_id}/commit")
 
-        logger.info(f"Delivery completed for order {order_id}")
 
-    except Exception as e:
-        logger.error(f"Error in delivery simulation for order {order_id}: {str(e)}")
-        raise
+@celery.task(name="release_stock")
+def release_stock(order_id: str):
+    """Return the stock held for a cancelled order."""
+    make_request("POST", f"{STOCK_SERVICE_URL}/reservations/{order_id}/release")